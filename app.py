@@ -38,6 +38,9 @@ if __name__ == "__main__":
     app = Application()
     app.listen(tws_conf["publish"])
     parse_command_line()
+    app.api.checkTWSConn()
     tornado.ioloop.PeriodicCallback(app.api.checkTWSConn, 30000).start()
-    tornado.ioloop.PeriodicCallback(app.api.client.run, 100).start()
-    tornado.ioloop.IOLoop.current().start()
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        app.api.shutdown()
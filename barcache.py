@@ -0,0 +1,216 @@
+"""
+On-disk cache of historical bars, in front of history.HistoryEngine.
+
+One file per contract, bar size, whatToShow and useRTH, under path:
+    HEADER              magic, version, bar count n, range count r
+    r RANGE             the [start, end) time ranges covered, sorted, disjoint
+    8 columns of n      time, open, high, low, close, volume, wap, count,
+                        8 bytes each (history.Bars.TYPECODES, native order)
+memory mapped, the columns read in place as memoryviews and bisected by time.
+
+A request is answered from the file for the covered spans, only the missing
+gaps are fetched from IB (concurrently, paced by the engine), merged with the
+cached bars and the file rewritten to a temporary one, then replaced, off the
+IOLoop. A range counts as covered once fetched, even without bars (weekends,
+holidays), but only up to one bar size before now: recent bars may not be
+complete yet and are fetched every time, not cached, unless the same span
+was fetched less than identical_interval seconds ago: asking IB for it again
+would only wait for its identical request pacing.
+
+Requests of one series are served one at a time, a request waiting for
+another one fetching the same range finds it cached.
+"""
+from history import Bars, BAR_SIZES
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+
+import tornado.ioloop
+
+HEADER = struct.Struct("<4sIqq")
+RANGE = struct.Struct("<qq")
+MAGIC = b"BARS"
+VERSION = 1
+
+def add_range(ranges, start, end):
+    """ranges with [start, end) added, overlapping and adjacent ones merged"""
+    merged = []
+    for (s, e) in sorted(ranges + [(start, end)]):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+def missing(ranges, start, end):
+    """the gaps of [start, end) not covered by ranges"""
+    gaps = []
+    cursor = start
+    for (s, e) in ranges:
+        if e <= cursor:
+            continue
+        if s >= end:
+            break
+        if s > cursor:
+            gaps.append((cursor, s))
+        cursor = e
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+class MappedBars:
+    """Read only Bars columns over the mapped file."""
+    def __init__(self, buffer, offset, count):
+        self.views = [buffer]
+        for (name, typecode) in zip(Bars.COLUMNS, Bars.TYPECODES):
+            view = buffer[offset:offset + count * 8].cast(typecode)
+            setattr(self, name, view)
+            self.views.append(view)
+            offset += count * 8
+        # not self.count, a column
+        self.length = count
+
+    def __len__(self):
+        return self.length
+
+    def release(self):
+        for view in reversed(self.views):
+            view.release()
+
+class Series:
+    """The cache file of one series."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = asyncio.Lock()
+        self.map = None
+        self.bars = Bars()
+        self.ranges = []
+        # (start, end, monotonic time, Bars) of the last uncached span fetched
+        self.tail = None
+        self.load()
+
+    def load(self):
+        self.close()
+        try:
+            with open(self.filename, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size:
+                    return
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        (magic, version, count, nranges) = HEADER.unpack_from(self.map)
+        offset = HEADER.size + nranges * RANGE.size
+        if magic != MAGIC or version != VERSION or size != offset + count * 8 * len(Bars.COLUMNS):
+            logging.warning(f"BarCache: ignoring {self.filename}, not a version {VERSION} cache file")
+            self.close()
+            return
+        self.ranges = [RANGE.unpack_from(self.map, HEADER.size + i * RANGE.size) for i in range(nranges)]
+        self.bars = MappedBars(memoryview(self.map), offset, count)
+
+    def merge(self, fills):
+        """The cached bars with those of fills, [(start, end, Bars)] of
+        uncovered ranges, and the new ranges."""
+        ranges = self.ranges
+        segments = [(s, e, self.bars) for (s, e) in ranges]
+        for (start, end, bars) in fills:
+            segments.append((start, end, bars))
+            ranges = add_range(ranges, start, end)
+        merged = Bars()
+        for (start, end, bars) in sorted(segments, key=lambda segment: segment[0]):
+            merged.extend(bars, start, end)
+        return (merged, ranges)
+
+    def write(self, bars, ranges):
+        """runs on an executor thread, the file is not mapped meanwhile"""
+        tmp = self.filename + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(bars), len(ranges)))
+            f.write(b"".join(RANGE.pack(*r) for r in ranges))
+            for name in Bars.COLUMNS:
+                getattr(bars, name).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+    def close(self):
+        if isinstance(self.bars, MappedBars):
+            self.bars.release()
+        self.bars = Bars()
+        self.ranges = []
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+class BarCache:
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.series = {}
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        self.cached_bars = 0
+        self.gaps = 0
+        # uncached spans served from the last one fetched
+        self.tails = 0
+
+    def get(self, contract, bar_size, what_to_show, use_rth):
+        key = "-".join(str(v).replace(" ", "") for v in (contract.symbol, contract.secType, contract.exchange, contract.currency, bar_size, what_to_show, int(use_rth)))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = Series(os.path.join(self.path, f"{key}.bars"))
+        return series
+
+    async def fetch(self, history, contract, start, end, bar_size="1 min", what_to_show="TRADES", use_rth=True):
+        """HistoryEngine.fetch, the cached spans read from disk."""
+        (start, end) = (int(start), int(end))
+        # bars starting from then may not be complete
+        covered_end = min(end, int(time.time()) - BAR_SIZES[bar_size][0])
+        series = self.get(contract, bar_size, what_to_show, use_rth)
+        async with series.lock:
+            gaps = missing(series.ranges, start, covered_end)
+            tail = [(max(start, covered_end), end)] if end > covered_end else []
+            recent = series.tail
+            if tail and recent and time.monotonic() - recent[2] < history.identical_interval:
+                if recent[0] <= tail[0][0] and tail[0][1] <= recent[1]:
+                    self.tails += 1
+                    tail = []
+            spans = gaps + tail
+            fetched = await asyncio.gather(*(history.fetch(contract, s, e, bar_size, what_to_show, use_rth) for (s, e) in spans))
+            if tail:
+                series.tail = tail[0] + (time.monotonic(), fetched[-1])
+            elif end > covered_end:
+                fetched.append(recent[3])
+            cached = series.bars
+            if gaps:
+                (cached, ranges) = series.merge([(s, e, bars) for ((s, e), bars) in zip(gaps, fetched)])
+                series.close()
+                try:
+                    await tornado.ioloop.IOLoop.current().run_in_executor(None, series.write, cached, ranges)
+                except OSError as e:
+                    logging.warning(f"BarCache: cannot write {series.filename}, {e}")
+                series.load()
+            bars = Bars()
+            bars.extend(cached, start, covered_end)
+            self.cached_bars += len(bars) - sum(len(b) for b in fetched[:len(gaps)])
+            if covered_end <= start or gaps == [(start, covered_end)]:
+                self.misses += 1
+            elif not gaps:
+                self.hits += 1
+            else:
+                self.partial += 1
+            self.gaps += len(gaps)
+            if end > covered_end:
+                bars.extend(fetched[-1], max(start, covered_end), end)
+            return bars
+
+    def stats(self):
+        return {"series": len(self.series), "hits": self.hits, "partial": self.partial, "misses": self.misses, "cached_bars": self.cached_bars, "gaps": self.gaps, "tails": self.tails}
+
+    def close(self):
+        for series in self.series.values():
+            series.close()
@@ -0,0 +1,195 @@
+"""
+Tick-to-WebSocket latency of the whole gateway.
+
+For every rate, starts simulator.Simulator with stamped sizes (send time in
+us) and the gateway (IbApi + the tornado handlers) in their own processes,
+connects --clients WebSocket clients to /trade and to /depth, spread over
+--procs processes, and measures for each new update received how long after
+the simulator sent it the client got it. That covers the socket to TWS,
+decode, IbApi state, Register fan-out, json.dumps and the WebSocket write.
+
+Clients ask for --client-rate messages per second (?rate=), the gateway
+conflates above it, so the latency is the age of the state delivered. A rate
+is sustainable when the p99 stays under --slo ms and clients get at least
+75% of min(rate, client rate) messages (updates landing just before the end
+of a conflation window wait for the next one, so 100% is not reached even
+idle).
+
+    python benchmarks/bench_e2e.py [--rates 100,1000,5000,10000] [--clients 4] [--procs 1]
+        [--client-rate 100] [--seconds 5] [--transport asyncio] [--slo 50]
+
+Needs config.py (the gateway imports it), tws_conf host/port are overridden.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WARMUP = 1.0
+CHANNELS = ("trade", "depth")
+
+
+def run_simulator(port, rate):
+    from simulator import Simulator
+    loop = asyncio.new_event_loop()
+    sim = Simulator(tick_rate=rate, depth_rate=rate, stamp=True)
+    loop.run_until_complete(sim.start("127.0.0.1", port))
+    loop.run_forever()
+
+
+def run_gateway(port, ib_port, transport):
+    import tornado.ioloop
+    import tornado.web
+    from config import tws_conf
+    from core import IbApi
+    from handler import handlers
+
+    conf = dict(tws_conf, host="127.0.0.1", port=ib_port, transport=transport, record_path="", capture_path="", order_id_path="", order_archive_path="", order_journal_path="", history_cache_path="")
+    app = tornado.web.Application(handlers)
+    app.api = IbApi(conf)
+    app.listen(port)
+    tornado.ioloop.IOLoop.current().spawn_callback(app.api.connect)
+    tornado.ioloop.IOLoop.current().start()
+
+
+def stamp_of(channel, data):
+    if channel == "trade":
+        return data.get("size", 0)
+    return max((row[1] for side in ("asks", "bids") for row in data.get(side, ())), default=0)
+
+
+async def client(url, channel, warm_at, stop_at, latencies):
+    from tornado.websocket import websocket_connect
+    conn = await websocket_connect(url)
+    last = 0
+    count = 0
+    while True:
+        now = time.time()
+        if now >= stop_at:
+            break
+        try:
+            msg = await asyncio.wait_for(conn.read_message(), stop_at - now)
+        except asyncio.TimeoutError:
+            break
+        if msg is None:
+            break
+        received = time.time_ns() // 1000
+        stamp = stamp_of(channel, json.loads(msg))
+        # the price and size callbacks of one tick resend the same stamp
+        if stamp > last:
+            last = stamp
+            if received >= warm_at * 1e6:
+                latencies.append(received - stamp)
+                count += 1
+    conn.close()
+    return count
+
+
+def run_clients(port, channel, clients, rate, warm_at, stop_at, pipe):
+    async def main():
+        latencies = []
+        url = f"ws://127.0.0.1:{port}/{channel}?rate={rate}"
+        counts = await asyncio.gather(*(client(url, channel, warm_at, stop_at, latencies) for _ in range(clients)))
+        return (latencies, list(counts))
+    pipe.send(asyncio.new_event_loop().run_until_complete(main()))
+
+
+def wait_ready(port, timeout=15):
+    """until /contract has the contract details, i.e. the gateway is connected"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/contract", timeout=1) as res:
+                if json.loads(res.read()).get("data"):
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_rate(rate, args, base_port):
+    ctx = multiprocessing.get_context("spawn")
+    (ib_port, ws_port) = (base_port, base_port + 1)
+    procs = [ctx.Process(target=run_simulator, args=(ib_port, rate), daemon=True)]
+    procs[0].start()
+    time.sleep(0.5)
+    procs.append(ctx.Process(target=run_gateway, args=(ws_port, ib_port, args.transport), daemon=True))
+    procs[1].start()
+    results = {}
+    try:
+        if not wait_ready(ws_port):
+            print(f"{rate:>8} gateway not ready")
+            return False
+        warm_at = time.time() + WARMUP
+        stop_at = warm_at + args.seconds
+        pipes = []
+        for channel in CHANNELS:
+            for i in range(args.procs):
+                n = args.clients // args.procs + (i < args.clients % args.procs)
+                if not n:
+                    continue
+                (recv, send) = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=run_clients, args=(ws_port, channel, n, args.client_rate, warm_at, stop_at, send), daemon=True)
+                proc.start()
+                procs.append(proc)
+                pipes.append((channel, recv))
+        for (channel, recv) in pipes:
+            (latencies, counts) = recv.recv()
+            entry = results.setdefault(channel, ([], []))
+            entry[0].extend(latencies)
+            entry[1].extend(counts)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.join()
+
+    sustained = True
+    for channel in CHANNELS:
+        (latencies, counts) = results.get(channel, ([], []))
+        latencies.sort()
+        expected = min(rate, args.client_rate) * args.seconds
+        delivered = min(counts) / expected if counts else 0
+        p50, p99, p999 = (percentile(latencies, p) / 1000 for p in (0.5, 0.99, 0.999))
+        worst = latencies[-1] / 1000 if latencies else float("nan")
+        print(f"{rate:>8} {channel:<6} {len(latencies):>9} {delivered:>9.1%} {p50:>9.2f} {p99:>9.2f} {p999:>9.2f} {worst:>9.2f}")
+        sustained = sustained and delivered >= 0.75 and p99 <= args.slo
+    return sustained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", default="100,1000,5000,10000", help="updates per second per stream, comma separated")
+    parser.add_argument("--clients", type=int, default=4, help="WebSocket clients per channel")
+    parser.add_argument("--client-rate", type=float, default=100, help="messages per second asked by each client")
+    parser.add_argument("--procs", type=int, default=1, help="client processes per channel")
+    parser.add_argument("--seconds", type=float, default=5, help="measured seconds per rate")
+    parser.add_argument("--transport", choices=("thread", "asyncio"), default="asyncio")
+    parser.add_argument("--slo", type=float, default=50, help="p99 ms for a rate to count as sustained")
+    parser.add_argument("--port", type=int, default=7700, help="first port used")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients per channel at {args.client_rate:g} msgs/s, {args.transport} transport, latency in ms")
+    print(f"{'rate':>8} {'stream':<6} {'updates':>9} {'delivered':>9} {'p50':>9} {'p99':>9} {'p999':>9} {'max':>9}")
+    best = 0
+    for (i, rate) in enumerate(int(r) for r in args.rates.split(",")):
+        if run_rate(rate, args, args.port + 2 * i):
+            best = rate
+    print(f"max sustained rate: {best} updates/s per stream" if best else "no rate sustained")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,777 @@
+"""
+Request encoding: EClient (ibapi.encoder) against the make_field/make_msg
+code it replaced, kept below as legacy_*.
+
+Checks byte-for-byte parity of placeOrder, reqMktData, reqMktDepth,
+reqRealTimeBars and cancelOrder on randomised orders and contracts for
+several server versions (random contracts also exercise the contract
+block cache: most are mutated copies of the same one, half of the orders
+are plain ones, exercising the default placeOrder tail), then times the
+requests of IbApi for its plain LMT order. Strings are ascii: the legacy
+make_msg prefixed the length in characters, truncating non-ascii messages,
+the length is now in bytes (checked separately).
+
+    python benchmarks/bench_encoder.py [--orders 2000] [--seed 1] [--number 20000]
+"""
+import argparse
+import logging
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ibapi.client import EClient, REQUEST_CONTRACT_FIELDS
+from ibapi.comm import make_field, make_field_handle_empty
+from ibapi.common import UNSET_DOUBLE, UNSET_INTEGER
+from ibapi.contract import ComboLeg, Contract, DeltaNeutralContract
+from ibapi.message import OUT
+from ibapi.order import Order, OrderComboLeg
+from ibapi.order_condition import Create, OrderCondition
+from ibapi.server_versions import * # @UnusedWildImport
+from ibapi.softdollartier import SoftDollarTier
+from ibapi.tag_value import TagValue
+from ibapi.utils import current_fn_name
+from ibapi.wrapper import EWrapper
+
+logger = logging.getLogger(__name__)
+
+SERVER_VERSIONS = (MIN_SERVER_VER_TRAILING_PERCENT - 1, MIN_SERVER_VER_LINKING,
+    MIN_SERVER_VER_ORDER_CONTAINER - 1, MIN_SERVER_VER_ORDER_CONTAINER,
+    MIN_SERVER_VER_MKT_DEPTH_PRIM_EXCHANGE - 1, MAX_CLIENT_VER)
+
+
+def legacy_make_msg(text):
+    return struct.pack("!I%ds" % len(text), len(text), str.encode(text))
+
+
+def legacy_place_order(sv, orderId, contract, order):
+    VERSION = 27 if (sv < MIN_SERVER_VER_NOT_HELD) else 45
+
+    # send place order msg
+    flds = []
+    flds += [make_field(OUT.PLACE_ORDER)]
+
+    if sv < MIN_SERVER_VER_ORDER_CONTAINER:
+        flds += [make_field(VERSION)]
+
+    flds += [make_field(orderId)]
+
+    # send contract fields
+    if sv >= MIN_SERVER_VER_PLACE_ORDER_CONID:
+        flds.append(make_field( contract.conId))
+    flds += [make_field( contract.symbol),
+        make_field( contract.secType),
+        make_field( contract.lastTradeDateOrContractMonth),
+        make_field( contract.strike),
+        make_field( contract.right),
+        make_field( contract.multiplier), # srv v15 and above
+        make_field( contract.exchange),
+        make_field( contract.primaryExchange), # srv v14 and above
+        make_field( contract.currency),
+        make_field( contract.localSymbol)] # srv v2 and above
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds.append(make_field( contract.tradingClass))
+
+    if sv >= MIN_SERVER_VER_SEC_ID_TYPE:
+        flds += [make_field( contract.secIdType),
+            make_field( contract.secId)]
+
+    # send main order fields
+    flds.append(make_field( order.action))
+
+    if sv >= MIN_SERVER_VER_FRACTIONAL_POSITIONS:
+        flds.append(make_field(order.totalQuantity))
+    else:
+        flds.append(make_field(int(order.totalQuantity)))
+
+    flds.append(make_field(order.orderType))
+    if sv < MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE:
+        flds.append(make_field(
+            order.lmtPrice if order.lmtPrice != UNSET_DOUBLE else 0))
+    else:
+        flds.append(make_field_handle_empty( order.lmtPrice))
+    if sv < MIN_SERVER_VER_TRAILING_PERCENT:
+        flds.append(make_field(
+            order.auxPrice if order.auxPrice != UNSET_DOUBLE else 0))
+    else:
+        flds.append(make_field_handle_empty( order.auxPrice))
+
+    # send extended order fields
+        flds += [make_field( order.tif),
+        make_field( order.ocaGroup),
+        make_field( order.account),
+        make_field( order.openClose),
+        make_field( order.origin),
+        make_field( order.orderRef),
+        make_field( order.transmit),
+        make_field( order.parentId),      # srv v4 and above
+        make_field( order.blockOrder),    # srv v5 and above
+        make_field( order.sweepToFill),   # srv v5 and above
+        make_field( order.displaySize),   # srv v5 and above
+        make_field( order.triggerMethod), # srv v5 and above
+        make_field( order.outsideRth),    # srv v5 and above
+        make_field( order.hidden)]        # srv v7 and above
+
+    # Send combo legs for BAG requests (srv v8 and above)
+    if contract.secType == "BAG":
+        comboLegsCount = len(contract.comboLegs) if contract.comboLegs else 0
+        flds.append(make_field(comboLegsCount))
+        if comboLegsCount > 0:
+            for comboLeg in contract.comboLegs:
+                assert comboLeg
+                flds += [make_field(comboLeg.conId),
+                    make_field( comboLeg.ratio),
+                    make_field( comboLeg.action),
+                    make_field( comboLeg.exchange),
+                    make_field( comboLeg.openClose),
+                    make_field( comboLeg.shortSaleSlot),      #srv v35 and above
+                    make_field( comboLeg.designatedLocation)] # srv v35 and above
+                if sv >= MIN_SERVER_VER_SSHORTX_OLD:
+                    flds.append(make_field(comboLeg.exemptCode))
+
+    # Send order combo legs for BAG requests
+    if sv >= MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE and contract.secType == "BAG":
+        orderComboLegsCount = len(order.orderComboLegs) if order.orderComboLegs else 0
+        flds.append(make_field( orderComboLegsCount))
+        if orderComboLegsCount:
+            for orderComboLeg in order.orderComboLegs:
+                assert orderComboLeg
+                flds.append(make_field_handle_empty( orderComboLeg.price))
+
+    if sv >= MIN_SERVER_VER_SMART_COMBO_ROUTING_PARAMS and contract.secType == "BAG":
+            smartComboRoutingParamsCount = len(order.smartComboRoutingParams) if order.smartComboRoutingParams else 0
+            flds.append(make_field( smartComboRoutingParamsCount))
+            if smartComboRoutingParamsCount > 0:
+                for tagValue in order.smartComboRoutingParams:
+                    flds += [make_field(tagValue.tag),
+                        make_field(tagValue.value)]
+
+    ######################################################################
+    # Send the shares allocation.
+    #
+    # This specifies the number of order shares allocated to each Financial
+    # Advisor managed account. The format of the allocation string is as
+    # follows:
+    #                      <account_code1>/<number_shares1>,<account_code2>/<number_shares2>,...N
+    # E.g.
+    #              To allocate 20 shares of a 100 share order to account 'U101' and the
+    #      residual 80 to account 'U203' enter the following share allocation string:
+    #          U101/20,U203/80
+    #####################################################################
+    # send deprecated sharesAllocation field
+    flds += [make_field( ""),            # srv v9 and above
+
+        make_field( order.discretionaryAmt), # srv v10 and above
+        make_field( order.goodAfterTime), # srv v11 and above
+        make_field( order.goodTillDate), # srv v12 and above
+
+        make_field( order.faGroup),      # srv v13 and above
+        make_field( order.faMethod),     # srv v13 and above
+        make_field( order.faPercentage), # srv v13 and above
+        make_field( order.faProfile)]    # srv v13 and above
+
+    if sv >= MIN_SERVER_VER_MODELS_SUPPORT:
+        flds.append(make_field( order.modelCode))
+
+    # institutional short saleslot data (srv v18 and above)
+    flds += [make_field( order.shortSaleSlot),   # 0 for retail, 1 or 2 for institutions
+        make_field( order.designatedLocation)]   # populate only when shortSaleSlot = 2.
+    if sv >= MIN_SERVER_VER_SSHORTX_OLD:
+        flds.append(make_field( order.exemptCode))
+
+    # not needed anymore
+    #bool isVolOrder = (order.orderType.CompareNoCase("VOL") == 0)
+
+    # srv v19 and above fields
+    flds.append(make_field( order.ocaType))
+    #if( sv < 38) {
+    # will never happen
+    #      send( /* order.rthOnly */ false);
+    #}
+    flds += [make_field( order.rule80A),
+        make_field( order.settlingFirm),
+        make_field( order.allOrNone),
+        make_field_handle_empty( order.minQty),
+        make_field_handle_empty( order.percentOffset),
+        make_field( order.eTradeOnly),
+        make_field( order.firmQuoteOnly),
+        make_field_handle_empty( order.nbboPriceCap),
+        make_field( order.auctionStrategy), # AUCTION_MATCH, AUCTION_IMPROVEMENT, AUCTION_TRANSPARENT
+        make_field_handle_empty( order.startingPrice),
+        make_field_handle_empty( order.stockRefPrice),
+        make_field_handle_empty( order.delta),
+        make_field_handle_empty( order.stockRangeLower),
+        make_field_handle_empty( order.stockRangeUpper),
+
+        make_field( order.overridePercentageConstraints),    #srv v22 and above
+
+        # Volatility orders (srv v26 and above)
+        make_field_handle_empty( order.volatility),
+        make_field_handle_empty( order.volatilityType),
+        make_field( order.deltaNeutralOrderType),             # srv v28 and above
+        make_field_handle_empty( order.deltaNeutralAuxPrice)] # srv v28 and above
+
+    if sv >= MIN_SERVER_VER_DELTA_NEUTRAL_CONID and order.deltaNeutralOrderType:
+        flds += [make_field( order.deltaNeutralConId),
+            make_field( order.deltaNeutralSettlingFirm),
+            make_field( order.deltaNeutralClearingAccount),
+            make_field( order.deltaNeutralClearingIntent)]
+
+    if sv >= MIN_SERVER_VER_DELTA_NEUTRAL_OPEN_CLOSE and order.deltaNeutralOrderType:
+        flds += [make_field( order.deltaNeutralOpenClose),
+            make_field( order.deltaNeutralShortSale),
+            make_field( order.deltaNeutralShortSaleSlot),
+            make_field( order.deltaNeutralDesignatedLocation)]
+
+    flds += [make_field( order.continuousUpdate),
+        make_field_handle_empty( order.referencePriceType),
+        make_field_handle_empty( order.trailStopPrice)] # srv v30 and above
+
+    if sv >= MIN_SERVER_VER_TRAILING_PERCENT:
+        flds.append(make_field_handle_empty( order.trailingPercent))
+
+    # SCALE orders
+    if sv >= MIN_SERVER_VER_SCALE_ORDERS2:
+        flds += [make_field_handle_empty( order.scaleInitLevelSize),
+            make_field_handle_empty( order.scaleSubsLevelSize)]
+    else:
+            # srv v35 and above)
+        flds += [make_field( ""), # for not supported scaleNumComponents
+            make_field_handle_empty(order.scaleInitLevelSize)] # for scaleComponentSize
+
+    flds.append(make_field_handle_empty( order.scalePriceIncrement))
+
+    if sv >= MIN_SERVER_VER_SCALE_ORDERS3 \
+        and order.scalePriceIncrement != UNSET_DOUBLE \
+        and order.scalePriceIncrement > 0.0:
+
+        flds += [make_field_handle_empty( order.scalePriceAdjustValue),
+            make_field_handle_empty( order.scalePriceAdjustInterval),
+            make_field_handle_empty( order.scaleProfitOffset),
+            make_field( order.scaleAutoReset),
+            make_field_handle_empty( order.scaleInitPosition),
+            make_field_handle_empty( order.scaleInitFillQty),
+            make_field( order.scaleRandomPercent)]
+
+    if sv >= MIN_SERVER_VER_SCALE_TABLE:
+        flds += [make_field( order.scaleTable),
+            make_field( order.activeStartTime),
+            make_field( order.activeStopTime)]
+
+    # HEDGE orders
+    if sv >= MIN_SERVER_VER_HEDGE_ORDERS:
+        flds.append(make_field( order.hedgeType))
+        if order.hedgeType:
+            flds.append(make_field( order.hedgeParam))
+
+    if sv >= MIN_SERVER_VER_OPT_OUT_SMART_ROUTING:
+        flds.append(make_field( order.optOutSmartRouting))
+
+    if sv >= MIN_SERVER_VER_PTA_ORDERS:
+        flds += [make_field( order.clearingAccount),
+            make_field( order.clearingIntent)]
+
+    if sv >= MIN_SERVER_VER_NOT_HELD:
+        flds.append(make_field( order.notHeld))
+
+    if sv >= MIN_SERVER_VER_DELTA_NEUTRAL:
+        if contract.deltaNeutralContract:
+            flds += [make_field(True),
+                make_field(contract.deltaNeutralContract.conId),
+                make_field(contract.deltaNeutralContract.delta),
+                make_field(contract.deltaNeutralContract.price)]
+        else:
+            flds.append(make_field(False))
+
+    if sv >= MIN_SERVER_VER_ALGO_ORDERS:
+        flds.append(make_field( order.algoStrategy))
+        if order.algoStrategy:
+            algoParamsCount = len(order.algoParams) if order.algoParams else 0
+            flds.append(make_field(algoParamsCount))
+            if algoParamsCount > 0:
+                for algoParam in order.algoParams:
+                    flds += [make_field(algoParam.tag),
+                        make_field(algoParam.value)]
+
+    if sv >= MIN_SERVER_VER_ALGO_ID:
+        flds.append(make_field( order.algoId))
+
+    flds.append(make_field( order.whatIf)) # srv v36 and above
+
+    # send miscOptions parameter
+    if sv >= MIN_SERVER_VER_LINKING:
+        miscOptionsStr = ""
+        if order.orderMiscOptions:
+            for tagValue in order.orderMiscOptions:
+                miscOptionsStr += str(tagValue)
+        flds.append(make_field( miscOptionsStr))
+
+    if sv >= MIN_SERVER_VER_ORDER_SOLICITED:
+        flds.append(make_field(order.solicited))
+
+    if sv >= MIN_SERVER_VER_RANDOMIZE_SIZE_AND_PRICE:
+        flds += [make_field(order.randomizeSize),
+            make_field(order.randomizePrice)]
+
+    if sv >= MIN_SERVER_VER_PEGGED_TO_BENCHMARK:
+        if order.orderType == "PEG BENCH":
+            flds += [make_field(order.referenceContractId),
+                make_field(order.isPeggedChangeAmountDecrease),
+                make_field(order.peggedChangeAmount),
+                make_field(order.referenceChangeAmount),
+                make_field(order.referenceExchangeId)]
+
+        flds.append(make_field(len(order.conditions)))
+
+        if len(order.conditions) > 0:
+            for cond in order.conditions:
+                flds.append(make_field(cond.type()))
+                flds += cond.make_fields()
+
+            flds += [make_field(order.conditionsIgnoreRth),
+                make_field(order.conditionsCancelOrder)]
+
+        flds += [make_field(order.adjustedOrderType),
+            make_field(order.triggerPrice),
+            make_field(order.lmtPriceOffset),
+            make_field(order.adjustedStopPrice),
+            make_field(order.adjustedStopLimitPrice),
+            make_field(order.adjustedTrailingAmount),
+            make_field(order.adjustableTrailingUnit)]
+
+    if sv >= MIN_SERVER_VER_EXT_OPERATOR:
+        flds.append(make_field( order.extOperator))
+
+    if sv >= MIN_SERVER_VER_SOFT_DOLLAR_TIER:
+        flds += [make_field(order.softDollarTier.name),
+            make_field(order.softDollarTier.val)]
+
+    if sv >= MIN_SERVER_VER_CASH_QTY:
+        flds.append(make_field( order.cashQty))
+
+    if sv >= MIN_SERVER_VER_DECISION_MAKER:
+        flds.append(make_field( order.mifid2DecisionMaker))
+        flds.append(make_field( order.mifid2DecisionAlgo))
+
+    if sv >= MIN_SERVER_VER_MIFID_EXECUTION:
+        flds.append(make_field( order.mifid2ExecutionTrader))
+        flds.append(make_field( order.mifid2ExecutionAlgo))
+
+    if sv >= MIN_SERVER_VER_AUTO_PRICE_FOR_HEDGE:
+        flds.append(make_field(order.dontUseAutoPriceForHedge))
+
+    if sv >= MIN_SERVER_VER_ORDER_CONTAINER:
+        flds.append(make_field(order.isOmsContainer))
+
+    if sv >= MIN_SERVER_VER_D_PEG_ORDERS:
+        flds.append(make_field(order.discretionaryUpToLimitPrice))
+
+    if sv >= MIN_SERVER_VER_PRICE_MGMT_ALGO:
+        flds.append(make_field_handle_empty(UNSET_INTEGER if order.usePriceMgmtAlgo == None else 1 if order.usePriceMgmtAlgo else 0))
+
+    msg = "".join(flds)
+    return msg
+
+
+def legacy_req_mkt_data(sv, reqId, contract, genericTickList, snapshot, regulatorySnapshot, mktDataOptions):
+    VERSION = 11
+
+    # send req mkt data msg
+    flds = []
+    flds += [make_field(OUT.REQ_MKT_DATA),
+        make_field(VERSION),
+        make_field(reqId)]
+
+    # send contract fields
+    if sv >= MIN_SERVER_VER_REQ_MKT_DATA_CONID:
+        flds += [make_field(contract.conId),]
+
+    flds += [make_field(contract.symbol),
+        make_field(contract.secType),
+        make_field(contract.lastTradeDateOrContractMonth),
+        make_field(contract.strike),
+        make_field(contract.right),
+        make_field(contract.multiplier), # srv v15 and above
+        make_field(contract.exchange),
+        make_field(contract.primaryExchange), # srv v14 and above
+        make_field(contract.currency),
+        make_field(contract.localSymbol) ] # srv v2 and above
+
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds += [make_field(contract.tradingClass),]
+
+    # Send combo legs for BAG requests (srv v8 and above)
+    if contract.secType == "BAG":
+        comboLegsCount = len(contract.comboLegs) if contract.comboLegs else 0
+        flds += [make_field(comboLegsCount),]
+        for comboLeg in contract.comboLegs:
+                flds += [make_field(comboLeg.conId),
+                    make_field( comboLeg.ratio),
+                    make_field( comboLeg.action),
+                    make_field( comboLeg.exchange)]
+
+    if sv >= MIN_SERVER_VER_DELTA_NEUTRAL:
+        if contract.deltaNeutralContract:
+            flds += [make_field(True),
+                make_field(contract.deltaNeutralContract.conId),
+                make_field(contract.deltaNeutralContract.delta),
+                make_field(contract.deltaNeutralContract.price)]
+        else:
+            flds += [make_field(False),]
+
+    flds += [make_field(genericTickList), # srv v31 and above
+        make_field(snapshot)] # srv v35 and above
+
+    if sv >= MIN_SERVER_VER_REQ_SMART_COMPONENTS:
+        flds += [make_field(regulatorySnapshot),]
+
+    # send mktDataOptions parameter
+    if sv >= MIN_SERVER_VER_LINKING:
+        #current doc says this part if for "internal use only" -> won't support it
+        if mktDataOptions:
+            raise NotImplementedError("not supported")
+        mktDataOptionsStr = ""
+        flds += [make_field(mktDataOptionsStr),]
+
+    msg = "".join(flds)
+    return msg
+
+
+def legacy_req_mkt_depth(sv, reqId, contract, numRows, isSmartDepth, mktDepthOptions):
+    VERSION = 5
+
+    # send req mkt depth msg
+    flds = []
+    flds += [make_field(OUT.REQ_MKT_DEPTH),
+        make_field(VERSION),
+        make_field(reqId)]
+
+    # send contract fields
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds += [make_field(contract.conId),]
+    flds += [make_field(contract.symbol),
+        make_field(contract.secType),
+        make_field(contract.lastTradeDateOrContractMonth),
+        make_field(contract.strike),
+        make_field(contract.right),
+        make_field(contract.multiplier), # srv v15 and above
+        make_field(contract.exchange),]
+    if sv >= MIN_SERVER_VER_MKT_DEPTH_PRIM_EXCHANGE:
+        flds += [make_field(contract.primaryExchange),]
+    flds += [make_field(contract.currency),
+        make_field(contract.localSymbol)]
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds += [make_field(contract.tradingClass),]
+
+    flds += [make_field(numRows),] # srv v19 and above
+
+    if sv >= MIN_SERVER_VER_SMART_DEPTH:
+        flds += [make_field(isSmartDepth),]
+
+    # send mktDepthOptions parameter
+    if sv >= MIN_SERVER_VER_LINKING:
+        #current doc says this part if for "internal use only" -> won't support it
+        if mktDepthOptions:
+            raise NotImplementedError("not supported")
+        mktDataOptionsStr = ""
+        flds += [make_field(mktDataOptionsStr),]
+
+    msg = "".join(flds)
+    return msg
+
+
+def legacy_req_real_time_bars(sv, reqId, contract, barSize, whatToShow, useRTH, realTimeBarsOptions):
+    VERSION = 3
+
+    flds = []
+    flds += [make_field(OUT.REQ_REAL_TIME_BARS),
+        make_field(VERSION),
+        make_field(reqId)]
+
+    # send contract fields
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds += [make_field(contract.conId),]
+    flds += [make_field(contract.symbol),
+        make_field(contract.secType),
+        make_field(contract.lastTradeDateOrContractMonth),
+        make_field(contract.strike),
+        make_field(contract.right),
+        make_field(contract.multiplier),
+        make_field(contract.exchange),
+        make_field(contract.primaryExchange),
+        make_field(contract.currency),
+        make_field(contract.localSymbol)]
+    if sv >= MIN_SERVER_VER_TRADING_CLASS:
+        flds += [make_field(contract.tradingClass),]
+    flds += [make_field(barSize),
+        make_field(whatToShow),
+        make_field(useRTH)]
+
+    # send realTimeBarsOptions parameter
+    if sv >= MIN_SERVER_VER_LINKING:
+        realTimeBarsOptionsStr = ""
+        if realTimeBarsOptions:
+            for tagValueOpt in realTimeBarsOptions:
+                realTimeBarsOptionsStr += str(tagValueOpt)
+        flds += [make_field(realTimeBarsOptionsStr),]
+
+    msg = "".join(flds)
+    return msg
+
+
+def legacy_cancel_order(sv, orderId):
+    VERSION = 1
+
+    msg = make_field(OUT.CANCEL_ORDER) \
+        + make_field(VERSION) \
+        + make_field(orderId)
+    return msg
+
+
+class SentConnection:
+    """Keeps the last message sent."""
+    def __init__(self):
+        self.sent = None
+
+    def isConnected(self):
+        return True
+
+    def sendMsg(self, msg):
+        self.sent = bytes(msg)
+        return len(msg)
+
+
+class ErrorWrapper(EWrapper):
+    """Validation errors of EClient (request not sent) are expected for old server versions."""
+    def __init__(self):
+        super().__init__()
+        self.errors = 0
+
+    def error(self, reqId, errorCode, errorString):
+        self.errors += 1
+
+
+class LegacyClient(EClient):
+    """The replaced requests, with the logRequest, connection check and
+    sendMsg of EClient but not its server version validation (favours
+    legacy)."""
+    def sendMsg(self, msg):
+        full_msg = legacy_make_msg(msg)
+        logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
+        self.conn.sendMsg(full_msg)
+
+    def placeOrder(self, orderId, contract, order):
+        self.logRequest(current_fn_name(), vars())
+        if self.isConnected():
+            self.sendMsg(legacy_place_order(self.serverVersion(), orderId, contract, order))
+
+    def reqMktData(self, reqId, contract, genericTickList, snapshot, regulatorySnapshot, mktDataOptions):
+        self.logRequest(current_fn_name(), vars())
+        if self.isConnected():
+            self.sendMsg(legacy_req_mkt_data(self.serverVersion(), reqId, contract,
+                genericTickList, snapshot, regulatorySnapshot, mktDataOptions))
+
+    def reqMktDepth(self, reqId, contract, numRows, isSmartDepth, mktDepthOptions):
+        self.logRequest(current_fn_name(), vars())
+        if self.isConnected():
+            self.sendMsg(legacy_req_mkt_depth(self.serverVersion(), reqId, contract,
+                numRows, isSmartDepth, mktDepthOptions))
+
+    def reqRealTimeBars(self, reqId, contract, barSize, whatToShow, useRTH, realTimeBarsOptions):
+        self.logRequest(current_fn_name(), vars())
+        if self.isConnected():
+            self.sendMsg(legacy_req_real_time_bars(self.serverVersion(), reqId, contract,
+                barSize, whatToShow, useRTH, realTimeBarsOptions))
+
+    def cancelOrder(self, orderId):
+        self.logRequest(current_fn_name(), vars())
+        if self.isConnected():
+            self.sendMsg(legacy_cancel_order(self.serverVersion(), orderId))
+
+
+def make_client(sv, cls=EClient):
+    client = cls(ErrorWrapper())
+    client.conn = SentConnection()
+    client.serverVersion_ = sv
+    client.setConnState(EClient.CONNECTED)
+    return client
+
+
+def sent(client, request, *args):
+    client.conn.sent = None
+    errors = client.wrapper.errors
+    request(*args)
+    return None if client.wrapper.errors != errors else client.conn.sent
+
+
+def simple_contract():
+    contract = Contract()
+    contract.symbol = "XAUUSD"
+    contract.secType = "CMDTY"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    return contract
+
+
+def simple_order(orderId=1):
+    order = Order()
+    order.orderId = orderId
+    order.action = "BUY"
+    order.orderType = "LMT"
+    order.lmtPrice = 1951.25
+    order.totalQuantity = 10.0
+    order.account = "DU000001"
+    return order
+
+
+def random_value(rnd, default):
+    """a value of the type of the default, the default itself half of the time"""
+    if rnd.random() < 0.5:
+        return default
+    if type(default) is bool:
+        return not default
+    if type(default) is int:
+        return rnd.choice((0, 1, 2, rnd.randint(-5, 10 ** 6), UNSET_INTEGER))
+    if type(default) is float:
+        return rnd.choice((0.0, 1.5, rnd.uniform(-1e4, 1e4), UNSET_DOUBLE, 1e-7))
+    if type(default) is str:
+        return rnd.choice(("", "X", "SMART", "a b"))
+    return default
+
+
+def random_contract(rnd):
+    contract = simple_contract()
+    for (name, default) in vars(Contract()).items():
+        if name not in ("comboLegs", "deltaNeutralContract") and rnd.random() < 0.3:
+            setattr(contract, name, random_value(rnd, default))
+    if rnd.random() < 0.2:
+        contract.secType = "BAG"
+        contract.comboLegs = []
+        for i in range(rnd.randint(0, 3)):
+            leg = ComboLeg()
+            for (name, default) in vars(ComboLeg()).items():
+                setattr(leg, name, random_value(rnd, default))
+            contract.comboLegs.append(leg)
+    if rnd.random() < 0.2:
+        contract.deltaNeutralContract = DeltaNeutralContract()
+        contract.deltaNeutralContract.conId = rnd.randint(1, 10 ** 6)
+        contract.deltaNeutralContract.delta = rnd.random()
+        contract.deltaNeutralContract.price = rnd.uniform(1, 100)
+    return contract
+
+
+def random_order(rnd, orderId):
+    order = simple_order(orderId)
+    order.orderType = rnd.choice(("LMT", "MKT", "STP", "PEG BENCH"))
+    skip = ("softDollarTier", "conditions", "algoParams", "smartComboRoutingParams",
+        "orderComboLegs", "orderMiscOptions", "usePriceMgmtAlgo", "orderType")
+    for (name, default) in vars(Order()).items():
+        if name not in skip and rnd.random() < 0.15:
+            setattr(order, name, random_value(rnd, default))
+    if rnd.random() < 0.3:
+        order.usePriceMgmtAlgo = rnd.choice((None, True, False))
+    if rnd.random() < 0.2:
+        order.softDollarTier = SoftDollarTier("tier", "1", "Tier 1")
+    if rnd.random() < 0.2:
+        order.algoStrategy = "Adaptive"
+        order.algoParams = [TagValue("adaptivePriority", "Normal")]
+    if rnd.random() < 0.2:
+        order.smartComboRoutingParams = [TagValue("NonGuaranteed", "1")]
+        order.orderComboLegs = [OrderComboLeg() for i in range(rnd.randint(0, 2))]
+    if rnd.random() < 0.2:
+        condition = Create(OrderCondition.Price)
+        condition.conId = 12087792
+        condition.exchange = "SMART"
+        condition.price = 1950.5
+        condition.isMore = True
+        condition.triggerMethod = 0
+        order.conditions = [condition]
+    return order
+
+
+def random_plain_order(rnd, orderId):
+    """an order of IbApi.make_order, with at times one other attribute
+    changed, so both the default tail template and its fallback are hit"""
+    order = simple_order(orderId)
+    order.action = rnd.choice(("BUY", "SELL"))
+    order.orderType = rnd.choice(("LMT", "MKT"))
+    order.lmtPrice = rnd.choice((rnd.uniform(1, 3000), UNSET_DOUBLE))
+    order.totalQuantity = rnd.choice((1.0, 10.0, 2.5, 100))
+    if rnd.random() < 0.5:
+        (name, default) = rnd.choice(list(vars(Order()).items()))
+        if name not in ("softDollarTier", "conditions", "algoParams", "smartComboRoutingParams",
+                "orderComboLegs", "orderMiscOptions", "usePriceMgmtAlgo"):
+            setattr(order, name, random_value(rnd, default))
+    return order
+
+
+def check_parity(n, seed):
+    rnd = random.Random(seed)
+    clients = {sv: make_client(sv) for sv in SERVER_VERSIONS}
+    (compared, skipped) = (0, 0)
+    for i in range(n):
+        sv = rnd.choice(SERVER_VERSIONS)
+        client = clients[sv]
+        contract = random_contract(rnd)
+        order = random_order(rnd, i) if rnd.random() < 0.5 else random_plain_order(rnd, i)
+        cases = (
+            (client.placeOrder, legacy_place_order, (i, contract, order)),
+            (client.reqMktData, legacy_req_mkt_data, (i, contract, rnd.choice(("", "233")), rnd.random() < 0.5, rnd.random() < 0.5, [])),
+            (client.reqMktDepth, legacy_req_mkt_depth, (i, contract, rnd.randint(1, 10), rnd.random() < 0.5, [])),
+            (client.reqRealTimeBars, legacy_req_real_time_bars, (i, contract, 5, rnd.choice(("MIDPOINT", "TRADES")), rnd.random() < 0.5, [])),
+            (client.cancelOrder, legacy_cancel_order, (i,)),
+        )
+        for (request, legacy, args) in cases:
+            new = sent(client, request, *args)
+            if new is None:
+                skipped += 1
+                continue
+            old = legacy_make_msg(legacy(sv, *args))
+            if new != old:
+                raise AssertionError(f"{request.__name__} differs, server version {sv}:\n{old!r}\n{new!r}")
+            compared += 1
+    print(f"parity: {compared} requests identical, {skipped} rejected by validation")
+
+    client = clients[MAX_CLIENT_VER]
+    contract = simple_contract()
+    contract.localSymbol = "été"
+    msg = sent(client, client.reqMktData, 1, contract, "", False, False, [])
+    assert struct.unpack_from("!I", msg)[0] == len(msg) - 4
+
+
+def timeit(label, fn, number):
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<28}{best / number * 1e6:>10.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000, help="random requests checked")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--number", type=int, default=20000, help="requests per timing")
+    args = parser.parse_args()
+
+    check_parity(args.orders, args.seed)
+    contract = simple_contract()
+    order = simple_order()
+    run = REQUEST_CONTRACT_FIELDS
+    timeit("contract block make_field", lambda: "".join([make_field(val) for val in run.get(contract)]), args.number)
+    timeit("contract block encoder", lambda: run.encodeValues(run.get(contract)), args.number)
+    timeit("contract block cached", lambda: run.encode(contract), args.number)
+    for (label, client) in (("legacy", make_client(MAX_CLIENT_VER, LegacyClient)), ("encoder", make_client(MAX_CLIENT_VER))):
+        timeit(f"placeOrder {label}", lambda: client.placeOrder(1, contract, order), args.number)
+        timeit(f"reqMktData {label}", lambda: client.reqMktData(1, contract, "", False, False, []), args.number)
+        timeit(f"reqMktDepth {label}", lambda: client.reqMktDepth(1, contract, 5, False, []), args.number)
+        timeit(f"reqRealTimeBars {label}", lambda: client.reqRealTimeBars(1, contract, 5, "MIDPOINT", True, []), args.number)
+        timeit(f"cancelOrder {label}", lambda: client.cancelOrder(1), args.number)
+
+if __name__ == "__main__":
+    main()
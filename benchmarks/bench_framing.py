@@ -0,0 +1,88 @@
+"""
+Framing throughput of the EReader receive path on multi-MB bursts.
+
+Compares the old `buf += data` + comm.read_msg loop against comm.MsgBuffer
+on the same byte stream, delivered in recv sized chunks.
+
+    python benchmarks/bench_framing.py [--mb 8] [--chunk 4096]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ibapi import comm
+
+
+def make_burst(mb):
+    """historical bars sized messages, like a reqHistoricalData answer"""
+    msgs = []
+    size = 0
+    i = 0
+    while size < mb * 1024 * 1024:
+        text = "".join(comm.make_field(f) for f in (17, 1, "20200729  13:%02d:00" % (i % 60),
+            1.172705, 1.17271, 1.1727, 1.17271, -1, -1.0, -1))
+        msg = comm.make_msg(text)
+        msgs.append(msg)
+        size += len(msg)
+        i += 1
+    return b"".join(msgs), len(msgs)
+
+
+def chunks(stream, chunk):
+    view = memoryview(stream)
+    return [view[i:i + chunk] for i in range(0, len(view), chunk)]
+
+
+def frame_legacy(parts):
+    n = 0
+    buf = b""
+    for data in parts:
+        buf += data
+        while len(buf) > 0:
+            (size, msg, buf) = comm.read_msg(buf)
+            if msg:
+                n += 1
+            else:
+                break
+    return n
+
+
+def frame_msgbuffer(parts):
+    n = 0
+    msgBuf = comm.MsgBuffer()
+    for data in parts:
+        # stands for socket.recv_into(msgBuf.freeView())
+        size = len(data)
+        msgBuf.freeView(size)[:size] = data
+        msgBuf.written(size)
+        for _ in msgBuf.msgs():
+            n += 1
+    return n
+
+
+def run(name, fn, parts, expected):
+    start = time.perf_counter()
+    n = fn(parts)
+    elapsed = time.perf_counter() - start
+    assert n == expected, (name, n, expected)
+    print("%-10s %9d frames %8.3f s %12.0f frames/s" % (name, n, elapsed, n / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=8, help="burst size in MB")
+    parser.add_argument("--chunk", type=int, default=4096, help="bytes per recv")
+    args = parser.parse_args()
+
+    stream, count = make_burst(args.mb)
+    parts = chunks(stream, args.chunk)
+    print("%d MB burst, %d frames, %d byte chunks" % (args.mb, count, args.chunk))
+    run("msgbuffer", frame_msgbuffer, parts, count)
+    run("legacy", frame_legacy, parts, count)
+
+
+if __name__ == "__main__":
+    main()
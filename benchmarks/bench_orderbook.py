@@ -0,0 +1,133 @@
+"""
+updateMktDepth throughput of orderbook.OrderBook against list based books.
+
+The stream is either a recorded one, one update per line as
+"position operation side price size" (spaces or commas), or a synthetic
+random walk of inserts, updates and deletes. Every implementation replays the
+whole stream and exports a snapshot after each update, like IbApi does; the
+final books are checked against a list reference model.
+
+    python benchmarks/bench_orderbook.py [--file depth.txt] [--updates 500000] [--depth 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from orderbook import OrderBook, SIDES
+
+
+def load_stream(path):
+    stream = []
+    with open(path) as f:
+        for line in f:
+            fields = line.replace(",", " ").split()
+            if len(fields) != 5:
+                continue
+            stream.append((int(fields[0]), int(fields[1]), int(fields[2]), float(fields[3]), int(fields[4])))
+    return stream
+
+
+def make_stream(updates, depth, seed=1):
+    """a book oscillating around 1.1770, with the model kept to emit valid positions"""
+    rnd = random.Random(seed)
+    counts = [0, 0]
+    stream = []
+    for _ in range(updates):
+        side = rnd.randrange(2)
+        n = counts[side]
+        r = rnd.random()
+        if n == 0 or (r < 0.3 and n < depth):
+            operation, position = 0, rnd.randint(0, n)
+            counts[side] = min(n + 1, depth)
+        elif r < 0.85:
+            operation, position = 1, rnd.randrange(n)
+        else:
+            operation, position = 2, rnd.randrange(n)
+            counts[side] = n - 1
+        tick = position + 1 if side == 0 else -position
+        price = round(1.17700 + tick * 0.00001, 5)
+        stream.append((position, operation, side, price, rnd.randrange(1, 100) * 100000))
+    return stream
+
+
+class LegacyBook:
+    """the former IbApi code: rows are overwritten, operation is ignored"""
+    def __init__(self, depth):
+        self.depth = {"asks": [[] for _ in range(depth)], "bids": [[] for _ in range(depth)]}
+
+    def apply(self, position, operation, side, price, size):
+        rows = self.depth[SIDES[side]]
+        if position < len(rows):
+            rows[position] = [price, size]
+        return True
+
+    def snapshot(self):
+        return self.depth
+
+
+class ListBook:
+    """list.insert / del, with a new snapshot per export"""
+    def __init__(self, depth):
+        self.max_depth = depth
+        self.sides = ([], [])
+
+    def apply(self, position, operation, side, price, size):
+        rows = self.sides[side]
+        if operation == 0 or (operation == 1 and position == len(rows)):
+            if position >= self.max_depth or position > len(rows):
+                return False
+            rows.insert(position, [price, size])
+            del rows[self.max_depth:]
+        elif operation == 1:
+            if position > len(rows):
+                return False
+            rows[position] = [price, size]
+        elif operation == 2:
+            if position >= len(rows):
+                return False
+            del rows[position]
+        else:
+            return False
+        return True
+
+    def snapshot(self):
+        return {"asks": [list(r) for r in self.sides[0]], "bids": [list(r) for r in self.sides[1]]}
+
+
+def replay(book, stream):
+    for (position, operation, side, price, size) in stream:
+        if book.apply(position, operation, side, price, size):
+            book.snapshot()
+    return book
+
+
+def run(name, make, stream):
+    book = make()
+    start = time.perf_counter()
+    replay(book, stream)
+    elapsed = time.perf_counter() - start
+    print("%-10s %9d updates %8.3f s %12.0f updates/s" % (name, len(stream), elapsed, len(stream) / elapsed))
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", help="recorded depth stream")
+    parser.add_argument("--updates", type=int, default=500000, help="synthetic stream length")
+    parser.add_argument("--depth", type=int, default=10, help="book rows per side")
+    args = parser.parse_args()
+
+    stream = load_stream(args.file) if args.file else make_stream(args.updates, args.depth)
+    print("%d updates, depth %d" % (len(stream), args.depth))
+    book = run("orderbook", lambda: OrderBook(args.depth), stream)
+    reference = run("list", lambda: ListBook(args.depth), stream)
+    run("legacy", lambda: LegacyBook(args.depth), stream)
+    assert book.snapshot() == reference.snapshot(), "orderbook differs from the list model"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,102 @@
-from ibapi import comm
 from ibapi.client import EClient
-from ibapi.common import MAX_MSG_LEN, NO_VALID_ID, OrderId, TickAttrib, TickerId
+from ibapi.common import OrderId, TickAttrib, TickerId
 from ibapi.contract import Contract, ContractDetails
-from ibapi.execution import Execution
+from ibapi.commission_report import CommissionReport
+from ibapi.execution import Execution, ExecutionFilter
 from ibapi.order import Order
 from ibapi.order_state import OrderState
 from ibapi.ticktype import TickType, TickTypeEnum
 from ibapi.wrapper import EWrapper
-from ibapi.errors import BAD_LENGTH
 from ibapi.common import BarData as IbBarData
+from ibapi.server_versions import MIN_SERVER_VER_COMPLETED_ORDERS
 
 from queue import Empty
 from threading import Thread, Condition
 from notification import Dingding
 from routin import Maintainer
+from register import Register
+from market import SubscriptionManager
+from recorder import Recorder
+from orders import OrderIds, request_ids
+from orderstore import OrderStore, TERMINAL, same_state
+from journal import Journal
+from fills import FillStore, make_fill, execution_ts
+from history import HistoryEngine
+from barcache import BarCache
+from metrics import pipeline
 import tornado
+import tornado.ioloop
+import asyncio
 import logging
+import time
 
-depthSide = {0:"ask",1:"bid"}
 tickerSide = {0:"bid",1:"bid",2:"ask",3:"ask",4:"last",5:"last",6:"highest",7:"lowest",8:"volume",9:"pre-close"}
 
-def contract_maker(instrument: str):
-    market_map = {"FUTURE": "FUT", "SPOT": "CMDTY"}
-    xchg, symbol, market = instrument.upper().split(".")
-    sym = symbol.split("_")
-    ib_contract = Contract()
-    ib_contract.symbol = f"{sym[0]}USD"
-    ib_contract.currency = "USD"
-    ib_contract.secType = market_map.get(market, "ERR")
-    ib_contract.exchange = xchg
-    return ib_contract
-
-class Register:
-    def __init__(self):
-        self.callbacks = []
-
-    def login(self, callback):
-        self.callbacks.append(callback)
-
-    def logout(self, callback):
-        self.callbacks.remove(callback)
-
-    def trigger(self, message):
-        self.notify_callbacks(message)
-
-    def notify_callbacks(self, message):
-        if len(self.callbacks):
-            for callback in self.callbacks:
-                callback(message)
-
 class IbClient(EClient):
+    """EClient driven by the tornado IOLoop.
+
+    The EReader thread calls msgQueued after queueing a received chunk, which
+    schedules a single run() on the IOLoop. run() drains msg_queue until it is
+    empty or pump_budget seconds are spent, then yields back to the loop and
+    reschedules itself if messages are left.
+
+    Each message is timed through metrics.pipeline, from the socket recv
+    stamped by the EReader (or the asyncio transport) to its decode.
+
+    Requests are flushed to the socket from the IOLoop too, once per loop
+    callback (Connection.flushSoon), so a burst of them shares a syscall.
+    """
+    pump_budget = 0.02
+
+    def __init__(self, wrapper):
+        super().__init__(wrapper)
+        self.ioloop = None
+        self.pump_pending = False
+
+    def connect(self, host, port, clientId, loop=None):
+        self.ioloop = tornado.ioloop.IOLoop.current()
+        res = super().connect(host, port, clientId, loop)
+        conn = self.conn
+        if loop is None and conn is not None:
+            conn.flushSoon = lambda: self.ioloop.add_callback(conn.flush)
+            conn.flushLater = lambda delay: self.ioloop.call_later(delay, conn.flush)
+        return res
+
+    def msgQueued(self):
+        # called from the EReader thread, add_callback is the only thread-safe IOLoop method
+        if not self.pump_pending and self.ioloop is not None:
+            self.pump_pending = True
+            self.ioloop.add_callback(self.run)
+
     def run(self):
-        if not self.done and self.isConnected():
+        # clear first, so anything queued from now on triggers another run
+        self.pump_pending = False
+        if self.done or not self.isConnected():
+            return
+
+        deadline = time.monotonic() + self.pump_budget
+        while True:
             try:
-                text = self.msg_queue.get(block=True, timeout=0.2)
-
-                if len(text) > MAX_MSG_LEN:
-                    errorMsg = "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text)
-                    self.wrapper.error(
-                        NO_VALID_ID, BAD_LENGTH.code(), errorMsg
-                    )
-                    self.disconnect()
-                    # break
-
-                fields = comm.read_fields(text)
-                self.decoder.interpret(fields)
+                (recvTime, queuedTime, text) = self.msg_queue.get_nowait()
             except Empty:
-                pass
+                return
+            pipeline.begin(recvTime, queuedTime)
+            try:
+                ok = self.decodeMsg(text)
+            finally:
+                pipeline.end()
+            if not ok:
+                return
+            if time.monotonic() > deadline:
+                self.msgQueued()
+                return
+
+    def dispatchMsg(self, msg):
+        pipeline.begin(self.conn.recvTime)
+        try:
+            super().dispatchMsg(msg)
+        finally:
+            pipeline.end()
 
 class IbApi(EWrapper):
     def __init__(self, conf):
@@ -76,39 +106,85 @@ class IbApi(EWrapper):
         self.maintainer = Maintainer()
         self.tws_date = self.maintainer.timer.today()
         self.connection_ts = self.maintainer.timer.timestamp()
-        self.checkTWSConn()
-
-        self.depth_register = Register()
-        self.ib_depth = {"asks":[[],[],[],[],[]],"bids":[[],[],[],[],[]]}
-        self.ib_depth_ready = False
-        self.ib_depth_ts = 0
 
-        self.trade_register = Register()
-        self.ib_trade = {}
-        self.ib_trade_ready = False
-        self.ib_trade_ts = 0
+        # order events are never conflated nor coalesced, nor are fills
+        self.order_register = Register(capacity=10000, conflate=False)
+        self.fill_register = Register(capacity=10000, conflate=False)
 
-        self.candle_register = Register()
-        self.ib_candle = {}
-
-        self.order_register = Register()
-
-        self.ib_contract = {}
         self.ib_account = {}
         self.ib_pos = {}
-        self.ib_orders = {}
 
-        self.reqid = 0
-        self.orderid = 0
+        # order ids are allocated locally, request ids come from their own space
+        self.request_ids = request_ids()
+        self.order_ids = OrderIds(conf.get("order_id_path", ""))
+        # terminal orders are evicted to the archive after order_retention secs
+        self.ib_orders = OrderStore(conf.get("order_archive_path", ""), conf.get("order_retention", 3600))
+        # fills older than fill_retention secs are dropped, from the journal too
+        self.fills = FillStore(retention=conf.get("fill_retention", 86400))
+        # historical bars, chunked and paced, see history.HistoryEngine
+        self.history = HistoryEngine(self, max_active=conf.get("history_max_active", 3))
+        # optional on-disk bar cache, only its gaps are asked to TWS, see barcache.BarCache
+        cache_path = conf.get("history_cache_path", "")
+        self.bar_cache = BarCache(cache_path) if cache_path else None
+        # orderId of the live orders TWS is asked about after connecting, None when not reconciling
+        self.reconciling = None
+        self.reconcile_seen = set()
+        self.reconcile_pending = 0
+        # optional order journal, replayed here, see journal.Journal
+        journal_path = conf.get("order_journal_path", "")
+        self.journal = Journal(journal_path) if journal_path else None
+        if self.journal:
+            self.restore_orders()
+            self.ib_orders.on_evict = lambda orders: self.journal.append("evict", [order["orderId"] for order in orders])
         self.clientid = conf["clientid"]
         self.accountid = conf["accountid"]
-        self.contractid = contract_maker(conf["symbol"])
+        # optional market data log, see recorder.Recorder
+        record_path = conf.get("record_path")
+        self.recorder = Recorder(record_path) if record_path else None
+        # optional wire capture, see replay.py
+        self.client.capturePath = conf.get("capture_path")
+        self.depth = conf.get("depth", 5)
+        self.market = SubscriptionManager(self, conf["symbol"], self.depth)
+        self.contractid = self.market.default.contract
         self.host = conf["host"]
         self.port = conf["port"]
+        self.transport = conf.get("transport", "thread")
     
     def logger(self, log_str):
         return logging.warning(log_str)
 
+    def next_reqid(self):
+        return next(self.request_ids)
+
+    def metrics(self):
+        """Stage latencies (us), msg_queue depth, outbound queue, order and fill stores, journal, history, bar cache and Register counters, for /metrics."""
+        registers = {"order": self.order_register.stats(), "fill": self.fill_register.stats()}
+        for instrument in self.market.instruments.values():
+            for (channel, register) in instrument.registers.items():
+                registers[f"{instrument.symbol}.{channel}"] = register.stats()
+        conn = self.client.conn
+        outbound = {}
+        if conn is not None:
+            outbound = {
+                "queued_bytes": conn.pendingBytes(),
+                "max_queued_bytes": conn.maxQueuedBytes,
+                "msgs": conn.sentMsgs,
+                "bytes": conn.sentBytes,
+                "writes": conn.sendCalls,
+            }
+        return {
+            "messages": pipeline.messages,
+            "msg_queue": self.client.msg_queue.qsize(),
+            "orders": self.ib_orders.stats(),
+            "journal": self.journal.stats() if self.journal else {},
+            "fills": self.fills.stats(),
+            "history": self.history.stats(),
+            "bar_cache": self.bar_cache.stats() if self.bar_cache else {},
+            "outbound": outbound,
+            "stages": pipeline.snapshot(),
+            "registers": registers,
+        }
+
     @tornado.gen.coroutine
     def checkTWSConn(self):
         pid_status = yield self.maintainer.getPid()
@@ -144,6 +220,9 @@ class IbApi(EWrapper):
                 self.maintainer.closeTWS()
                 self.tws_date = today
 
+        self.ib_orders.evict()
+        self.fills.expire()
+
         if self.client.isConnected():
             ts_diff = self.maintainer.timer.timestamp() - self.connection_ts
             if ts_diff > 30000:
@@ -154,13 +233,18 @@ class IbApi(EWrapper):
     def error(self, reqId: TickerId, errorCode: int, errorString: str):
         """Callback of error caused by specific request."""
         super().error(reqId, errorCode, errorString)
+        if self.history.error(reqId, errorCode, errorString):
+            # pacing violations are retried, not worth a notification
+            self.logger(f"history {reqId}, errorCode: {errorCode}, errorString: {errorString}")
+            return
         yield self.messenger.send_msg("ib msg", f"TWS: {errorString}")
         self.connection_ts = self.maintainer.timer.timestamp()
-        order = self.ib_orders.get(str(reqId), {})
+        order = self.ib_orders.get(reqId, {})
         if order:
+            order = order.copy()
             order["status"] = "Cancelled" if "Order Canceled - reason" in errorString else "Rejected"
             order["time"] = self.connection_ts
-            self.ib_orders[str(reqId)] = order
+            self.store_order("error", order, publish=False)
         self.logger(f"errorCode: {errorCode}, errorString: {errorString}")
     
     @tornado.gen.coroutine
@@ -168,16 +252,19 @@ class IbApi(EWrapper):
         """Connect to TWS."""
         if not self.client.isConnected():
             yield self.messenger.send_msg("ib msg", f"Control: ib TWS running, connnecting")
-            self.client.connect(self.host, self.port, self.clientid)
+            if self.transport == "asyncio":
+                yield self.client.connect(self.host, self.port, self.clientid, loop=asyncio.get_event_loop())
+            else:
+                self.client.connect(self.host, self.port, self.clientid)
             self.client.reqCurrentTime()
             self.subscribe()
+            self.reconcile_orders()
+            self.query_executions()
+            self.history.schedule()
             
     def subscribe(self):
         if self.client.isConnected():
-            self.streamTick(self.contractid)
-            self.streamDepth(self.contractid)
-            self.streamCandleStick(self.contractid)
-            self.query_contract(self.contractid)
+            self.market.resubscribe()
             self.query_account_list()
             self.query_account()
             self.query_position()
@@ -186,6 +273,15 @@ class IbApi(EWrapper):
         """Disconnect from TWS."""
         self.client.disconnect()
 
+    def shutdown(self):
+        """Disconnect and close the market data log and the order journal,
+        at exit."""
+        self.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.journal:
+            self.journal.close()
+
     def connectAck(self):
         """Callback when connection is established."""
         self.logger("IB TWS Connected")
@@ -193,6 +289,7 @@ class IbApi(EWrapper):
     def connectionClosed(self):
         """Callback when connection is closed."""
         self.logger("IB TWS DisConnected")
+        self.history.disconnected()
 
     def currentTime(self, time: int):
         """Callback of current server time of IB."""
@@ -200,82 +297,116 @@ class IbApi(EWrapper):
         time_string = self.maintainer.timer.ts2dtstr(time)
         self.logger(f"Server Time: {time_string}")
 
-    def query_history(self, ib_contract, start, end):
-        """"""
-        self.reqid += 1
-        end_str = ""
-        end_str = end.strftime("%Y%m%d %H:%M:%S")
-        days = min((end - start).days, 180)     # IB only provides 6-month data
-        duration = f"{days} D"
-        bar_size = "1 min" # 1 secs, 5 secs, 10 secs, 15 secs, 30 secs, 1 min, 2 mins, 3 mins, 5 mins, 10 mins, 15 mins, 20 mins, 30 mins, 1 hour, 2 hours, 3 hours, 4 hours, 8 hours, 1 day, 1W, 1M
-        bar_type = "MIDPOINT" if ib_contract.exchange=="IDEALPRO" else "TRADES"
-        self.client.reqHistoricalData(self.reqid,ib_contract,end_str,duration,bar_size,bar_type,1,1,False,[])
+    def query_history(self, ib_contract, start, end, bar_size="1 min", what_to_show="", use_rth=True):
+        """Awaitable history.Bars of [start, end), datetimes or seconds since
+        the epoch, fetched in chunks IB serves, under its pacing rules, read
+        from the bar cache for the spans it covers."""
+        # 1 secs, 5 secs, 10 secs, 15 secs, 30 secs, 1 min, 2 mins, 3 mins, 5 mins, 10 mins, 15 mins, 20 mins, 30 mins, 1 hour, 2 hours, 3 hours, 4 hours, 8 hours, 1 day
+        (start, end) = (ts.timestamp() if hasattr(ts, "timestamp") else ts for ts in (start, end))
+        what_to_show = what_to_show or ("MIDPOINT" if ib_contract.exchange == "IDEALPRO" else "TRADES")
+        if self.bar_cache:
+            return self.bar_cache.fetch(self.history, ib_contract, start, end, bar_size, what_to_show, use_rth)
+        return self.history.fetch(ib_contract, start, end, bar_size, what_to_show, use_rth)
 
     def historicalData(self, reqId: int, ib_bar: IbBarData):
         """Callback of history data update."""
-        """{'date': '20200729  13:48:00', 'open': 1.172705, 'high': 1.17271, 'low': 1.1727, 'close': 1.17271, 'volume': -1, 'barCount': -1, 'average': -1.0}"""
-        self.logger(f"\nhistoricalData, {reqId}, {ib_bar.__dict__}")
+        """{'date': '1595998080', 'open': 1.172705, 'high': 1.17271, 'low': 1.1727, 'close': 1.17271, 'volume': -1, 'barCount': -1, 'average': -1.0}"""
+        self.history.bar(reqId, ib_bar)
     
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         """Callback of history data finished."""
-        self.logger(f"historicalDataEnd {reqId}, {start}, {end}")
+        if not self.history.end(reqId):
+            self.logger(f"historicalDataEnd {reqId}, {start}, {end}")
+
+    def stream(self, channel, ib_contract):
+        """Start a market data stream, return its reqId."""
+        if channel == "trade":
+            return self.streamTick(ib_contract)
+        elif channel == "depth":
+            return self.streamDepth(ib_contract)
+        elif channel == "candle":
+            return self.streamCandleStick(ib_contract)
+
+    def cancel_stream(self, channel, reqId):
+        if channel == "trade":
+            self.client.cancelMktData(reqId)
+        elif channel == "depth":
+            self.client.cancelMktDepth(reqId, False)
+        elif channel == "candle":
+            self.client.cancelRealTimeBars(reqId)
 
     def streamCandleStick(self, ib_contract):
         """"""
-        self.reqid += 1
-        self.client.reqRealTimeBars(self.reqid, ib_contract, 5, "MIDPOINT", True, [])
+        reqid = self.next_reqid()
+        self.client.reqRealTimeBars(reqid, ib_contract, 5, "MIDPOINT", True, [])
+        return reqid
 
     def realtimeBar(self, reqId: TickerId, time:int, open_: float, high: float, low: float, close: float, volume: int, wap: float, count: int):
         """Callback of 5 Second Real Time Bars."""
         """return: {'reqId': 1, 'time': 1596173490, 'open_': 1969.75, 'high': 1969.75, 'low': 1969.6, 'close': 1969.65, 'volume': -1, 'wap': -1.0, 'count': -1}"""
+        pipeline.enter()
         super().realtimeBar(reqId, time, open_, high, low, close, volume, wap, count)
-        self.ib_candle["open"] = open_
-        self.ib_candle["high"] = high
-        self.ib_candle["low"] = low
-        self.ib_candle["close"] = close
-        self.ib_candle["volume"] = volume
-        self.ib_candle["wap"] = wap
-        self.ib_candle["ts"] = time
-        self.candle_register.trigger(self.ib_candle)
+        if self.recorder:
+            self.recorder.bar(reqId, time, open_, high, low, close, volume, wap)
+        instrument = self.market.lookup(reqId)
+        if instrument is None:
+            return
+        candle = instrument.candle
+        candle["open"] = open_
+        candle["high"] = high
+        candle["low"] = low
+        candle["close"] = close
+        candle["volume"] = volume
+        candle["wap"] = wap
+        candle["ts"] = time
+        instrument.registers["candle"].trigger(candle)
 
     def streamTick(self, ib_contract):
         """"""
-        self.reqid += 1
-        self.client.reqMktData(self.reqid, ib_contract, "", False, False, [])
+        reqid = self.next_reqid()
+        self.client.reqMktData(reqid, ib_contract, "", False, False, [])
+        return reqid
 
     def tickPrice(self, reqId: TickerId, tickType: TickType, price: float, attrib: TickAttrib):
         """Callback of tick price update."""
         """return: tickPrice  1 1 0.90778 CanAutoExecute: 1, PastLimit: 0, PreOpen: 0"""
+        pipeline.enter()
         super().tickPrice(reqId, tickType, price, attrib)
-        self.make_ticker(tickType, price=price)
+        if self.recorder:
+            self.recorder.tick_price(reqId, tickType, price)
+        instrument = self.market.lookup(reqId)
+        if instrument is not None:
+            self.make_ticker(instrument, tickType, price=price)
 
     def tickSize(self, reqId: TickerId, tickType: TickType, size: int):
         """Callback of tick volume update."""
         """return: tickSize  1 3 7000000"""
+        pipeline.enter()
         super().tickSize(reqId, tickType, size)
-        self.make_ticker(tickType, size=size)
-
-    def make_ticker(self, ticker_type, price=0, size=0):
+        if self.recorder:
+            self.recorder.tick_size(reqId, tickType, size)
+        instrument = self.market.lookup(reqId)
+        if instrument is not None:
+            self.make_ticker(instrument, tickType, size=size)
+
+    def make_ticker(self, instrument, ticker_type, price=0, size=0):
+        trade = instrument.trade
         if ticker_type < 4:
-            self.ib_trade["side"] = tickerSide[ticker_type]
+            trade["side"] = tickerSide[ticker_type]
         else:
             return
 
         if price:
-            self.ib_trade["price"] = price
+            trade["price"] = price
         if size:
-            self.ib_trade["size"] = size
+            trade["size"] = size
 
-        if not self.ib_trade_ready:
-            if all(self.ib_trade.values()):
-                self.ib_trade_ready = True
+        if not instrument.trade_ready:
+            if all(trade.values()):
+                instrument.trade_ready = True
         else:
-            ts = self.maintainer.timer.timestamp()
-            self.ib_trade["ts"] = ts
-            check_ts = ts // 100
-            if not check_ts == self.ib_trade_ts:
-                self.ib_trade_ts = check_ts
-                self.trade_register.trigger(self.ib_trade)
+            trade["ts"] = self.maintainer.timer.timestamp()
+            instrument.registers["trade"].trigger(trade)
         self.connection_ts = self.maintainer.timer.timestamp()
 
     def tickString(self, reqId: TickerId, tickType: TickType, value: str):
@@ -285,8 +416,9 @@ class IbApi(EWrapper):
 
     def streamDepth(self, ib_contract):
         """"""
-        self.reqid += 1
-        self.client.reqMktDepth(self.reqid, ib_contract, 5, False, [])
+        reqid = self.next_reqid()
+        self.client.reqMktDepth(reqid, ib_contract, self.depth, False, [])
+        return reqid
 
     def updateMktDepth(self, reqId: TickerId, position: int, operation: int, side: int, price: float, size: int):
         """Callback of depth update."""
@@ -301,18 +433,22 @@ class IbApi(EWrapper):
             side - Identifies the side of the book that this order belongs to. Valid values are 0 for ask and 1 for bid.
             """
         
+        pipeline.enter()
         super().updateMktDepth(reqId, position, operation, side, price, size)
-        self.ib_depth[f"{depthSide[side]}s"][position] = [price, size]
-        if not self.ib_depth_ready:
-            if all(self.ib_depth["asks"]) and all(self.ib_depth["bids"]):
-                self.ib_depth_ready = True
+        if self.recorder:
+            self.recorder.depth(reqId, position, operation, side, price, size)
+        instrument = self.market.lookup(reqId)
+        if instrument is None:
+            return
+        book = instrument.book
+        if not book.apply(position, operation, side, price, size):
+            return
+        if not instrument.depth_ready:
+            instrument.depth_ready = book.ready()
         else:
-            ts = self.maintainer.timer.timestamp()
-            self.ib_depth["ts"] = ts
-            check_ts = ts // 100
-            if not check_ts == self.ib_depth_ts:
-                self.ib_depth_ts = check_ts
-                self.depth_register.trigger(self.ib_depth)
+            depth = book.snapshot()
+            depth["ts"] = self.maintainer.timer.timestamp()
+            instrument.registers["depth"].trigger(depth)
         self.connection_ts = self.maintainer.timer.timestamp()
 
     def updateMktDepthL2(self, reqId: TickerId, position: int, marketMaker: str, operation: int, side: int, price: float, size: int, isSmartDepth: bool):
@@ -323,20 +459,25 @@ class IbApi(EWrapper):
 
     ##### contract #####
     def query_contract(self, ib_contract):
-        self.reqid += 1
-        self.client.reqContractDetails(self.reqid, ib_contract)
+        reqid = self.next_reqid()
+        self.client.reqContractDetails(reqid, ib_contract)
+        return reqid
 
     def contractDetails(self, reqId: int, contractDetails: ContractDetails):
         """Callback of contract data update."""
         super().contractDetails(reqId, contractDetails)
-        self.ib_contract["symbol"]= contractDetails.marketName
-        self.ib_contract["minTick"]= contractDetails.minTick
-        self.ib_contract["xchg"]= contractDetails.validExchanges
-        self.ib_contract["longName"]= contractDetails.longName
-        self.ib_contract["mdSizeMultiplier"]= contractDetails.mdSizeMultiplier
+        instrument = self.market.lookup(reqId)
+        if instrument is None:
+            return
+        instrument.details["symbol"]= contractDetails.marketName
+        instrument.details["minTick"]= contractDetails.minTick
+        instrument.details["xchg"]= contractDetails.validExchanges
+        instrument.details["longName"]= contractDetails.longName
+        instrument.details["mdSizeMultiplier"]= contractDetails.mdSizeMultiplier
 
     def contractDetailsEnd(self, reqId: int):
         super().contractDetailsEnd(reqId)
+        self.market.details_end(reqId)
         self.logger(f"ContractDetailsEnd. ReqId, {reqId} ")
 
     ##### Account #####
@@ -398,23 +539,30 @@ class IbApi(EWrapper):
         """Callback of next valid orderid."""
         super().nextValidId(orderId)
         self.logger(f"nextValidId {orderId}")
-        self.reqid = orderId
+        self.order_ids.seed(orderId)
 
     def orderStatus(self,orderId: OrderId,status: str,filled: float,remaining: float,avgFillPrice: float,
         permId: int,parentId: int,lastFillPrice: float,clientId: int,whyHeld: str,mktCapPrice: float):
         """Callback of order status update."""
         """PreSubmitted, Submitted, Filled, Cancelled"""
+        pipeline.enter()
         super().orderStatus(orderId,status,filled,remaining,avgFillPrice,permId,parentId,lastFillPrice,clientId,whyHeld,mktCapPrice)
         self.logger(f"orderStatus\nid:{orderId}, {status}, f:{filled}, r:{remaining}, avg:{avgFillPrice}, {permId},{parentId},{lastFillPrice},{clientId},{whyHeld},{mktCapPrice}")
-        order = self.ib_orders.get(str(orderId), {})
+        if clientId != self.clientid:
+            # orderIds are per client, another client's order is not ours
+            return
+        order = self.ib_orders.get(orderId, {})
         if order:
             order = order.copy()
             order["filledQuantity"] = filled
             order["avgFillPrice"] = avgFillPrice
             order["status"] = status
+            if permId:
+                order["permId"] = permId
             order["time"] = self.maintainer.timer.timestamp()
-            self.order_register.trigger(order)
-            self.ib_orders[str(orderId)] = order
+            self.store_order("orderStatus", order)
+        if self.reconciling is not None:
+            self.reconcile_seen.add(orderId)
         
     def openOrder(self,orderId: OrderId,ib_contract: Contract,ib_order: Order,orderState: OrderState,):
         """Callback when opening new order."""
@@ -423,8 +571,11 @@ class IbApi(EWrapper):
         """ib_order: {'softDollarTier': 1543640930240: Name: , Value: , DisplayName: , 'orderId': 5, 'clientId': 15178, 'permId': 1538198311, 'action': 'BUY', 'totalQuantity': 10.0, 'orderType': 'LMT', 'lmtPrice': 1.15, 'auxPrice': 0.0, 'tif': 'DAY', 'activeStartTime': '', 'activeStopTime': '', 'ocaGroup': '', 'ocaType': 3, 'orderRef': '', 'transmit': True, 'parentId': 0, 'blockOrder': False, 'sweepToFill': False, 'displaySize': 0, 'triggerMethod': 0, 'outsideRth': False, 'hidden': False, 'goodAfterTime': '', 'goodTillDate': '', 'rule80A': '', 'allOrNone': False, 'minQty': 2147483647, 'percentOffset': 1.7976931348623157e+308, 'overridePercentageConstraints': False, 'trailStopPrice': 2.15, 'trailingPercent': 1.7976931348623157e+308, 'faGroup': '', 'faProfile': '', 'faMethod': '', 'faPercentage': '', 'designatedLocation': '', 'openClose': '', 'origin': 0, 'shortSaleSlot': 0, 'exemptCode': -1, 'discretionaryAmt': 0.0, 'eTradeOnly': False, 'firmQuoteOnly': False, 'nbboPriceCap': 1.7976931348623157e+308, 'optOutSmartRouting': False, 'auctionStrategy': 0, 'startingPrice': 1.7976931348623157e+308, 'stockRefPrice': 1.7976931348623157e+308, 'delta': 1.7976931348623157e+308, 'stockRangeLower': 1.7976931348623157e+308, 'stockRangeUpper': 1.7976931348623157e+308, 'randomizePrice': False, 'randomizeSize': False, 'volatility': 1.7976931348623157e+308, 'volatilityType': 0, 'deltaNeutralOrderType': 'None', 'deltaNeutralAuxPrice': 1.7976931348623157e+308, 'deltaNeutralConId': 0, 'deltaNeutralSettlingFirm': '', 'deltaNeutralClearingAccount': '', 'deltaNeutralClearingIntent': '', 'deltaNeutralOpenClose': '?', 'deltaNeutralShortSale': False, 'deltaNeutralShortSaleSlot': 0, 'deltaNeutralDesignatedLocation': '', 'continuousUpdate': False, 'referencePriceType': 0, 'basisPoints': 1.7976931348623157e+308, 'basisPointsType': 2147483647, 'scaleInitLevelSize': 2147483647, 'scaleSubsLevelSize': 2147483647, 'scalePriceIncrement': 1.7976931348623157e+308, 'scalePriceAdjustValue': 1.7976931348623157e+308, 'scalePriceAdjustInterval': 2147483647, 'scaleProfitOffset': 1.7976931348623157e+308, 'scaleAutoReset': False, 'scaleInitPosition': 2147483647, 'scaleInitFillQty': 2147483647, 'scaleRandomPercent': False, 'scaleTable': '', 'hedgeType': '', 'hedgeParam': '', 'account': 'DU228384', 'settlingFirm': '', 'clearingAccount': '', 'clearingIntent': 'IB', 'algoStrategy': '', 'algoParams': None, 'smartComboRoutingParams': None, 'algoId': '', 'whatIf': False, 'notHeld': False, 'solicited': False, 'modelCode': '', 'orderComboLegs': None, 'orderMiscOptions': None, 'referenceContractId': 0, 'peggedChangeAmount': 0.0, 'isPeggedChangeAmountDecrease': False, 'referenceChangeAmount': 0.0, 'referenceExchangeId': '', 'adjustedOrderType': 'None', 'triggerPrice': 1.7976931348623157e+308, 'adjustedStopPrice': 1.7976931348623157e+308, 'adjustedStopLimitPrice': 1.7976931348623157e+308, 'adjustedTrailingAmount': 1.7976931348623157e+308, 'adjustableTrailingUnit': 0, 'lmtPriceOffset': 1.7976931348623157e+308, 'conditions': [], 'conditionsCancelOrder': False, 'conditionsIgnoreRth': False, 'extOperator': '', 'cashQty': 0.0, 'mifid2DecisionMaker': '', 'mifid2DecisionAlgo': '', 'mifid2ExecutionTrader': '', 'mifid2ExecutionAlgo': '', 'dontUseAutoPriceForHedge': True, 'isOmsContainer': False, 'discretionaryUpToLimitPrice': False, 'autoCancelDate': '', 'filledQuantity': 1.7976931348623157e+308, 'refFuturesConId': 0, 'autoCancelParent': False, 'shareholder': '', 'imbalanceOnly': False, 'routeMarketableToBbo': False, 'parentPermId': 0, 'usePriceMgmtAlgo': False}"""
         """ib_contract: {'conId': 12087792, 'symbol': 'EUR', 'secType': 'CASH', 'lastTradeDateOrContractMonth': '', 'strike': 0.0, 'right': '?', 'multiplier': '', 'exchange': 'IDEALPRO', 'primaryExchange': '', 'currency': 'USD', 'localSymbol': 'EUR.USD', 'tradingClass': 'EUR.USD', 'includeExpired': False, 'secIdType': '', 'secId': '', 'comboLegsDescrip': '', 'comboLegs': None, 'deltaNeutralContract': None}"""
 
+        pipeline.enter()
         super().openOrder(orderId, ib_contract, ib_order, orderState)
         self.logger(f"openOrder\n, {orderId}, {orderState.__dict__}, {ib_order.__dict__}")
+        if ib_order.clientId != self.clientid:
+            return
         order = {
             "orderId": ib_order.orderId,
             "orderType": ib_order.orderType,
@@ -437,6 +588,7 @@ class IbApi(EWrapper):
             "account": ib_order.account,
             "whatIf": ib_order.whatIf,
             "autoCancelDate": ib_order.autoCancelDate,
+            "orderRef": ib_order.orderRef,
             "symbol": ib_contract.symbol,
             "exchange": ib_contract.exchange,
             "currency": ib_contract.currency,
@@ -448,24 +600,118 @@ class IbApi(EWrapper):
             "filledQuantity": ib_order.filledQuantity,
             "avgFillPrice": ib_order.startingPrice,
         }
-        self.order_register.trigger(order)
-        self.ib_orders[str(orderId)] = order
+        known = self.ib_orders.get(orderId)
+        if known:
+            # the fills are told by orderStatus
+            order["filledQuantity"] = known["filledQuantity"]
+            order["avgFillPrice"] = known["avgFillPrice"]
+        self.store_order("openOrder", order)
+        if self.reconciling is not None:
+            self.reconcile_seen.add(orderId)
+
+    def openOrderEnd(self):
+        super().openOrderEnd()
+        if self.reconciling is not None:
+            self.reconcile_end()
+
+    def completedOrder(self, ib_contract: Contract, ib_order: Order, orderState: OrderState):
+        """Callback of reqCompletedOrders, orders are matched by permId, by
+        orderId when placed by this client."""
+        super().completedOrder(ib_contract, ib_order, orderState)
+        order = self.ib_orders.by_perm(ib_order.permId)
+        if not order and ib_order.clientId == self.clientid:
+            order = self.ib_orders.get(ib_order.orderId)
+        if not order:
+            return
+        if self.reconciling is not None:
+            self.reconcile_seen.add(order["orderId"])
+        if order["status"] != orderState.status or order["completedStatus"] != orderState.completedStatus:
+            order = order.copy()
+            order["status"] = orderState.status
+            order["completedStatus"] = orderState.completedStatus
+            order["time"] = self.maintainer.timer.timestamp()
+            self.store_order("completedOrder", order)
+
+    def completedOrdersEnd(self):
+        super().completedOrdersEnd()
+        if self.reconciling is not None:
+            self.reconcile_end()
 
     def execDetails(self, reqId: int, contract: Contract, execution: Execution):
         """Callback of trade data update."""
         """execDetails  -1 {'conId': 12087792, 'symbol': 'EUR', 'secType': 'CASH', 'lastTradeDateOrContractMonth': '', 'strike': 0.0, 'right': '', 'multiplier': '', 'exchange': 'IDEALPRO', 'primaryExchange': '', 'currency': 'USD', 'localSymbol': 'EUR.USD', 'tradingClass': 'EUR.USD', 'includeExpired': False, 'secIdType': '', 'secId': '', 'comboLegsDescrip': '', 'comboLegs': None, 'deltaNeutralContract': None} {'execId': '000132b0.5f209c35.01.01', 'time': '20200729  14:15:29', 'acctNumber': 'DU228384', 'exchange': 'IDEALPRO', 'side': 'SLD', 'shares': 10.0, 'price': 1.174, 'permId': 1538198312, 'clientId': 15178, 'orderId': 7, 'liquidation': 0, 'cumQty': 10.0, 'avgPrice': 1.174, 'orderRef': '', 'evRule': '', 'evMultiplier': 0.0, 'modelCode': '', 'lastLiquidity': 2}"""
         super().execDetails(reqId, contract, execution)
         self.logger(f"execDetails \n {reqId}, {execution.__dict__}, {contract.__dict__}")
-        # order = self.ib_orders.get(orderId, {}).copy()
-        # order["completedTime"] = time
-        # self.order_register.trigger(order)
-        # self.ib_orders[orderId] = order
-
-    def make_order(self, direction, orderType, price, volume):
-        """New order."""
-        self.reqid += 1
+        fill = self.fills.add(make_fill(execution, contract))
+        if fill is None:
+            # already known, reqExecutions after a reconnect
+            return
+        if self.journal:
+            self.journal.append("execDetails", fill)
+        self.fill_register.trigger(fill)
+
+    def execDetailsEnd(self, reqId: int):
+        super().execDetailsEnd(reqId)
+        self.logger(f"execDetailsEnd {reqId}, {len(self.fills)} fills")
+
+    def commissionReport(self, commissionReport: CommissionReport):
+        """Callback of the commission of a fill, it comes after its execDetails."""
+        super().commissionReport(commissionReport)
+        commission = {
+            "commission": commissionReport.commission,
+            "commissionCurrency": commissionReport.currency,
+            "realizedPNL": commissionReport.realizedPNL,
+        }
+        if self.journal:
+            self.journal.append("commissionReport", dict(commission, execId=commissionReport.execId))
+        fill = self.fills.commission(commissionReport.execId, commission)
+        if fill is not None:
+            self.fill_register.trigger(fill)
+
+    def query_executions(self):
+        """Catch-up after connecting: the executions since the last fill
+        known, less a minute for clock skew, all of today's without any.
+        Those already known are skipped by execDetails."""
+        if not self.client.isConnected():
+            return
+        exec_filter = ExecutionFilter()
+        exec_filter.clientId = self.clientid
+        exec_filter.acctCode = self.accountid
+        last_ts = self.fills.last_ts()
+        if last_ts:
+            exec_filter.time = time.strftime("%Y%m%d-%H:%M:%S", time.localtime(last_ts - 60))
+        self.client.reqExecutions(self.next_reqid(), exec_filter)
+
+    def make_order(self, direction, orderType, price, volume, tag=""):
+        """New order, returns its id, -1 if no order id was ever received from TWS.
+        tag is sent as the orderRef, to find the order by."""
+        order_ids = self.make_orders([(direction, orderType, price, volume, tag)])
+        return order_ids[0] if order_ids else -1
+
+    def make_orders(self, orders):
+        """New orders from (direction, orderType, price, volume, tag) tuples, with
+        consecutive ids, sent to TWS in a single socket write. Returns their
+        ids, an empty list if no order id was ever received from TWS."""
+        if not orders:
+            return []
+        if not self.order_ids.ready:
+            self.logger("make order, no order id yet")
+            return []
+        first = self.order_ids.allocate(len(orders))
+        order_ids = list(range(first, first + len(orders)))
+        self.client.beginBatch()
+        try:
+            placed = [self.place_order(order_id, *args) for (order_id, args) in zip(order_ids, orders)]
+        finally:
+            self.client.endBatch()
+        # not read back from ib_orders, a Rejected order may be evicted already
+        self.logger(f"make order, {first}" + (f"..{order_ids[-1]}" if len(orders) > 1 else "") + f", {placed[0]['status']}")
+        return order_ids
+
+    def place_order(self, order_id, direction, orderType, price, volume, tag=""):
+        """Sends a new order, returns its order dict."""
         ib_order = Order()
-        ib_order.orderId = self.reqid
+        ib_order.orderId = order_id
         ib_order.clientId = self.clientid
         ib_order.action = direction
         ib_order.orderType = orderType
@@ -473,7 +719,7 @@ class IbApi(EWrapper):
             ib_order.lmtPrice = float(price)
         ib_order.totalQuantity = float(volume)
         ib_order.account = self.accountid
-        self.client.placeOrder(self.reqid, self.contractid, ib_order)
+        ib_order.orderRef = tag
         order = {
             "orderId": ib_order.orderId,
             "orderType": ib_order.orderType,
@@ -486,6 +732,7 @@ class IbApi(EWrapper):
             "account": ib_order.account,
             "whatIf": ib_order.whatIf,
             "autoCancelDate": ib_order.autoCancelDate,
+            "orderRef": ib_order.orderRef,
             "symbol": self.contractid.symbol,
             "exchange": self.contractid.exchange,
             "currency": self.contractid.currency,
@@ -500,10 +747,84 @@ class IbApi(EWrapper):
         if not self.client.isConnected():
             order["status"] = "Rejected"
 
-        self.ib_orders[str(ib_order.orderId)] = order
-        self.client.reqIds(1)
-        self.logger(f"make order, {ib_order.orderId}, {order['status']}")
-        return self.reqid
+        # queued to the journal, not yet on disk when sent (see journal.py)
+        self.store_order("make_order", order, publish=False)
+        self.client.placeOrder(order_id, self.contractid, ib_order)
+        return order
+
+    def store_order(self, event, order, publish=True):
+        """Stores, journals and publishes a new version of an order, returns
+        False and does nothing when only its time changed."""
+        known = self.ib_orders.get(order["orderId"])
+        if known is not None and same_state(known, order):
+            return False
+        # journaled first, put() may evict it and journal that
+        if self.journal:
+            self.journal.append(event, order)
+        self.ib_orders.put(order)
+        if publish:
+            self.order_register.trigger(order)
+        return True
+
+    def restore_orders(self):
+        """Replays the order journal into ib_orders and fills, then compacts it."""
+        start = time.perf_counter()
+        records = self.journal.replay()
+        updated = {}
+        for (ts, event, data) in records:
+            if event == "execDetails":
+                if "ts" not in data:
+                    data["ts"] = execution_ts(data["time"])
+                self.fills.add(data)
+            elif event == "commissionReport":
+                self.fills.commission(data.pop("execId"), data)
+            elif event == "evict":
+                # archived in a previous run
+                for order_id in data:
+                    self.ib_orders.discard(order_id)
+            else:
+                self.ib_orders.put(data, ts, evict=False)
+                updated[data["orderId"]] = ts
+        # archives the orders due that never were, ages the fills out
+        self.ib_orders.evict()
+        self.fills.expire()
+        kept = [(updated[order["orderId"]], "restore", order) for order in self.ib_orders.orders.values()]
+        kept.sort(key=lambda record: record[0])
+        kept += [(fill["ts"], "execDetails", fill) for fill in map(self.fills.get, self.fills.exec_ids)]
+        self.journal.start(kept)
+        self.logger(f"order journal, {len(records)} records, {len(self.ib_orders)} orders and {len(self.fills)} fills restored in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def reconcile_orders(self):
+        """Asks TWS for the open and completed orders after connecting, the
+        callbacks update the orders whose state differs. The live orders
+        TWS reports in neither are Inactive."""
+        if not self.client.isConnected():
+            return
+        self.reconciling = {order["orderId"] for order in self.ib_orders.live()}
+        self.reconcile_seen = set()
+        self.reconcile_pending = 1
+        # this client's orders only, the orderIds of others may be the same
+        self.client.reqOpenOrders()
+        if self.client.serverVersion() >= MIN_SERVER_VER_COMPLETED_ORDERS:
+            self.reconcile_pending += 1
+            self.client.reqCompletedOrders(True)
+
+    def reconcile_end(self):
+        self.reconcile_pending -= 1
+        if self.reconcile_pending > 0:
+            return
+        lost = []
+        for order_id in self.reconciling - self.reconcile_seen:
+            order = self.ib_orders.get(order_id)
+            if order and order["status"] not in TERMINAL:
+                order = order.copy()
+                order["status"] = "Inactive"
+                order["time"] = self.maintainer.timer.timestamp()
+                self.store_order("reconcile", order)
+                lost.append(order_id)
+        self.logger(f"orders reconciled, {len(self.reconcile_seen)} reported by TWS, unknown to TWS: {sorted(lost)}")
+        self.reconciling = None
+        self.reconcile_seen = set()
 
     def cancel_order(self, orderid):
         """Cancel an existing order."""
@@ -511,4 +832,4 @@ class IbApi(EWrapper):
 
 
 # 获取历史K线
-# api.query_history(ib_contract, start=datetime.now()-timedelta(days=1), end=datetime.now())
\ No newline at end of file
+# bars = await api.query_history(ib_contract, start=datetime.now()-timedelta(days=1), end=datetime.now())
\ No newline at end of file
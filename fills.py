@@ -0,0 +1,121 @@
+"""
+The executions (fills) of the session, joined with their commission reports.
+
+A fill is the execDetails Execution as a dict, plus the symbol and secType
+of its contract, ts (its time in seconds since the epoch) and the commission,
+commissionCurrency and realizedPNL of its commissionReport, None until it
+arrives (reports can come first, they are then kept until their fill does).
+Like orders, fill dicts are replaced, never mutated.
+
+Fills are indexed by execId and orderId, and by time with a sorted array
+searched by bisect, so a time range page costs O(log n + page).
+"""
+from bisect import bisect_left, bisect_right
+import time
+
+def execution_ts(exec_time):
+    """Execution.time ("20200729  14:15:29", in the TWS time zone, maybe
+    followed by its name) as seconds since the epoch, local time assumed"""
+    try:
+        return time.mktime(time.strptime(" ".join(exec_time.split()[:2]), "%Y%m%d %H:%M:%S"))
+    except (ValueError, OverflowError):
+        return time.time()
+
+def make_fill(execution, contract):
+    fill = dict(execution.__dict__, symbol=contract.symbol, secType=contract.secType)
+    fill["ts"] = execution_ts(execution.time)
+    fill["commission"] = fill["commissionCurrency"] = fill["realizedPNL"] = None
+    return fill
+
+class FillStore:
+    """The max_fills most recent fills, the oldest tenth is dropped beyond,
+    and expire() drops those older than retention seconds."""
+    def __init__(self, max_fills=100000, retention=86400):
+        self.max_fills = max_fills
+        self.retention = retention
+        self.fills = {}
+        self.orders = {}
+        # sorted by ts, parallel
+        self.times = []
+        self.exec_ids = []
+        # execId -> commission fields of reports received before their fill
+        self.commissions = {}
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.fills)
+
+    def get(self, exec_id, default=None):
+        return self.fills.get(exec_id, default)
+
+    def add(self, fill):
+        """Stores a new fill, returns it with its commission when already
+        reported, None when it is known (executions sent again by
+        reqExecutions)."""
+        exec_id = fill["execId"]
+        if exec_id in self.fills:
+            self.duplicates += 1
+            return None
+        commission = self.commissions.pop(exec_id, None)
+        if commission is not None:
+            fill = dict(fill, **commission)
+        self.fills[exec_id] = fill
+        self.orders.setdefault(fill["orderId"], []).append(exec_id)
+        ts = fill["ts"]
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.exec_ids.append(exec_id)
+        else:
+            index = bisect_right(self.times, ts)
+            self.times.insert(index, ts)
+            self.exec_ids.insert(index, exec_id)
+        if len(self.fills) > self.max_fills:
+            self.evict(len(self.fills) - self.max_fills + self.max_fills // 10)
+        return fill
+
+    def commission(self, exec_id, commission):
+        """Joins the commission fields to their fill, returns it, None when
+        the fill is not there yet."""
+        fill = self.fills.get(exec_id)
+        if fill is None:
+            self.commissions[exec_id] = commission
+            return None
+        fill = dict(fill, **commission)
+        self.fills[exec_id] = fill
+        return fill
+
+    def evict(self, count):
+        for exec_id in self.exec_ids[:count]:
+            fill = self.fills.pop(exec_id)
+            exec_ids = self.orders.get(fill["orderId"])
+            if exec_ids is not None:
+                exec_ids.remove(exec_id)
+                if not exec_ids:
+                    del self.orders[fill["orderId"]]
+        del self.times[:count]
+        del self.exec_ids[:count]
+
+    def expire(self, now=None):
+        """Drops the fills older than retention, returns how many."""
+        count = bisect_left(self.times, (now or time.time()) - self.retention)
+        if count:
+            self.evict(count)
+        return count
+
+    def by_order(self, order_id):
+        return [self.fills[exec_id] for exec_id in self.orders.get(order_id, ())]
+
+    def page(self, start=0, end=None, offset=0, limit=100):
+        """Fills with start <= ts < end, oldest first, from offset on.
+        Returns (fills, total in the range)."""
+        lo = bisect_left(self.times, start)
+        hi = len(self.times) if end is None else bisect_left(self.times, end)
+        total = max(hi - lo, 0)
+        first = lo + offset
+        return ([self.fills[exec_id] for exec_id in self.exec_ids[first:min(first + limit, hi)]], total)
+
+    def last_ts(self):
+        return self.times[-1] if self.times else 0
+
+    def stats(self):
+        return {"fills": len(self.fills), "orders": len(self.orders), "duplicates": self.duplicates, "unmatched_commissions": len(self.commissions)}
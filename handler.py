@@ -1,6 +1,11 @@
 import tornado
 import tornado.websocket
+from metrics import pipeline
+from market import contract_maker
+from history import BAR_SIZES, HistoryError
 import json
+import math
+import time
 
 class BaseHttpHandler(tornado.web.RequestHandler):
     def set_default_headers(self):
@@ -36,13 +41,43 @@ class BaseWsHandler(tornado.websocket.WebSocketHandler):
     def on_error(self, error: str):
         self.api.logger(f"WS on_error, {error}")
 
+    def subscribe(self, channel):
+        """login to the channel of ?symbol=, the configured symbol by default"""
+        self.instrument = None
+        try:
+            self.instrument = self.api.market.subscribe(self.get_argument("symbol", ""), channel)
+        except ValueError:
+            self.write_message(json.dumps({"result":False,"message":"invalid symbol"}))
+            self.close()
+            return False
+        self.instrument.registers[channel].login(self.callback, self.max_rate())
+        return True
+
+    def unsubscribe(self, channel):
+        instrument = getattr(self, "instrument", None)
+        if instrument is not None:
+            instrument.registers[channel].logout(self.callback)
+            self.api.market.unsubscribe(instrument, channel)
+            self.instrument = None
+
+    def max_rate(self):
+        """?rate=n: max messages per second the client wants, 0 for the channel default"""
+        try:
+            rate = float(self.get_argument("rate", "0"))
+        except ValueError:
+            return 0
+        return max(rate, 0) if math.isfinite(rate) else 0
+
     @property
     def api(self):
         return self.application.api
 
 class Contract(BaseHttpHandler):
     async def get(self):
-        res = {"result": True, "data": self.api.ib_contract}
+        instrument = self.api.market.get(self.get_argument("symbol", ""))
+        res = {"result": False, "data": {}}
+        if instrument:
+            res = {"result": True, "data": instrument.details}
         self.finish(res)
 
 class Position(BaseHttpHandler):
@@ -57,43 +92,98 @@ class Account(BaseHttpHandler):
 
 class QueryOrder(BaseHttpHandler):
     async def get(self):
+        """?order_id= or ?perm_id=, orders evicted from memory are looked up in the archive"""
         order_id = self.get_argument("order_id", "")
-        order = self.api.ib_orders.get(order_id, {})
+        perm_id = self.get_argument("perm_id", "")
+        if perm_id:
+            order = self.api.ib_orders.by_perm(perm_id, {})
+        else:
+            order = self.api.ib_orders.get(order_id) or self.api.ib_orders.find_archived(order_id) or {}
         res = {"result": False, "data": order}
         if order:
             res["result"] = True
         self.finish(res)
 
+def order_error(direction, orderType, price, volume):
+    """err_msg of the arguments of a new order, empty if valid"""
+    if not direction in ["BUY", "SELL"]:
+        return "invalid direction"
+    if orderType not in ["LMT", "MKT"]:
+        # "STP":stop,"MIT":market if touched, "MOC": market on close,"PEG MKT":peg
+        return "invalid orderType"
+    if not positive(volume):
+        return "invalid volume"
+    if orderType == "LMT" and not positive(price):
+        return "invalid price"
+    return ""
+
+def positive(number):
+    """a finite number above 0, as place_order parses it"""
+    try:
+        return 0 < float(number) < math.inf
+    except ValueError:
+        return False
+
 class MakeOrder(BaseHttpHandler):
     async def post(self):
         direction = self.get_argument("direction", "").upper()
         orderType = self.get_argument("orderType", "").upper()
         price = self.get_argument('price', "0")
         volume = self.get_argument('volume', "0")
+        tag = self.get_argument("tag", "")
         
         res = {"result": False, "order_id": -1, "err_msg": ""}
-        if not direction in ["BUY", "SELL"]:
-            res["err_msg"] = "invalid direction"
-        
-        if not res["err_msg"]:
-            if orderType not in ["LMT", "MKT"]:
-                # "STP":stop,"MIT":market if touched, "MOC": market on close,"PEG MKT":peg
-                res["err_msg"] = "invalid orderType"
-        
-        if not res["err_msg"]:
-            vol = volume.replace(".", "")
-            if not vol.isnumeric():
-                res["err_msg"] = "invalid volume"
-        
+        res["err_msg"] = order_error(direction, orderType, price, volume)
+
         if not res["err_msg"]:
-            px = price.replace(".", "")
-            if orderType == "LMT" and not px.isnumeric():
-                res["err_msg"] = "invalid price"
+            order_id = self.api.make_order(direction, orderType, price, volume, tag)
+            if order_id < 0:
+                res["err_msg"] = "no order id from TWS yet"
+            else:
+                res["result"] = True
+                res["order_id"] = order_id
+        self.finish(res)
+
+class MakeOrders(BaseHttpHandler):
+    """POST a JSON array of orders, objects with the arguments of /make_order:
+    [{"direction": "BUY", "orderType": "LMT", "price": "1.1", "volume": "10", "tag": "ladder-1"}, ...]
+    The valid ones are placed with consecutive ids and sent to TWS in a single
+    write, "orders" has the result of each one, in order."""
+    max_orders = 1000
+
+    async def post(self):
+        res = {"result": False, "orders": [], "err_msg": ""}
+        try:
+            orders = json.loads(self.request.body)
+        except ValueError:
+            orders = None
+        if not isinstance(orders, list) or not orders:
+            res["err_msg"] = "invalid orders"
+        elif len(orders) > self.max_orders:
+            res["err_msg"] = f"more than {self.max_orders} orders"
 
         if not res["err_msg"]:
-            order_id = self.api.make_order(direction, orderType, price, volume)
-            res["result"] = True
-            res["order_id"] = order_id
+            valid = []
+            for order in orders:
+                result = {"result": False, "order_id": -1, "err_msg": ""}
+                if not isinstance(order, dict):
+                    result["err_msg"] = "invalid order"
+                else:
+                    args = (str(order.get("direction", "")).upper(), str(order.get("orderType", "")).upper(),
+                        str(order.get("price", "0")), str(order.get("volume", "0")), str(order.get("tag", "")))
+                    result["err_msg"] = order_error(*args[:4])
+                    if not result["err_msg"]:
+                        valid.append((result, args))
+                res["orders"].append(result)
+
+            order_ids = self.api.make_orders([args for (_, args) in valid])
+            for ((result, _), order_id) in zip(valid, order_ids):
+                result["result"] = True
+                result["order_id"] = order_id
+            if valid and not order_ids:
+                for (result, _) in valid:
+                    result["err_msg"] = "no order id from TWS yet"
+            res["result"] = bool(order_ids)
         self.finish(res)
 
 class CancelOrder(BaseHttpHandler):
@@ -114,14 +204,93 @@ class CancelOrder(BaseHttpHandler):
 
 class OpenOrder(BaseHttpHandler):
     async def get(self):
-        orders = list(self.api.ib_orders.values())
-        open_orders = list(filter(lambda x: x["status"] in ["Submitted"], orders))
-        res = {"result": True, "data": open_orders}
+        """?symbol= and ?tag= filter the submitted orders"""
+        res = {"result": False, "data": [], "err_msg": ""}
+        symbol = self.get_argument("symbol", "")
+        tag = self.get_argument("tag", "")
+        if symbol:
+            # orders carry the IB contract symbol
+            instrument = self.api.market.get(symbol)
+            try:
+                symbol = (instrument.contract if instrument else contract_maker(symbol)).symbol
+            except ValueError:
+                res["err_msg"] = "invalid symbol"
+        if not res["err_msg"]:
+            res["result"] = True
+            res["data"] = self.api.ib_orders.select("Submitted", symbol, tag)
+        self.finish(res)
+
+class Executions(BaseHttpHandler):
+    max_limit = 1000
+
+    async def get(self):
+        """The fills of ?order_id=, or a page of those with start <= ts < end
+        (seconds since the epoch), oldest first: ?start=&end=&offset=&limit="""
+        res = {"result": False, "data": [], "total": 0, "err_msg": ""}
+        order_id = self.get_argument("order_id", "")
+        try:
+            start = float(self.get_argument("start", "0"))
+            end = float(self.get_argument("end", "inf"))
+            offset = max(int(self.get_argument("offset", "0")), 0)
+            limit = min(max(int(self.get_argument("limit", "100")), 0), self.max_limit)
+            order_id = int(order_id) if order_id else None
+        except ValueError:
+            res["err_msg"] = "invalid arguments"
+
+        if not res["err_msg"]:
+            if order_id is not None:
+                fills = self.api.fills.by_order(order_id)
+                (res["data"], res["total"]) = (fills, len(fills))
+            else:
+                (res["data"], res["total"]) = self.api.fills.page(start, end, offset, limit)
+            res["result"] = True
+        self.finish(res)
+
+class History(BaseHttpHandler):
+    async def get(self):
+        """Bars of ?symbol= (the configured one by default) with start <= time < end,
+        seconds since the epoch, the last day by default, as columns:
+        ?start=&end=&bar_size=1 min&what=TRADES|MIDPOINT|BID|ASK...&rth=1"""
+        res = {"result": False, "data": {}, "err_msg": ""}
+        symbol = self.get_argument("symbol", "")
+        bar_size = self.get_argument("bar_size", "1 min")
+        what_to_show = self.get_argument("what", "").upper()
+        use_rth = self.get_argument("rth", "1") not in ("0", "false")
+        try:
+            end = float(self.get_argument("end", "") or time.time())
+            start = float(self.get_argument("start", "") or end - 86400)
+        except ValueError:
+            res["err_msg"] = "invalid start or end"
+        if not res["err_msg"] and bar_size not in BAR_SIZES:
+            res["err_msg"] = "invalid bar_size"
+
+        if not res["err_msg"]:
+            instrument = self.api.market.get(symbol)
+            try:
+                ib_contract = instrument.contract if instrument else contract_maker(symbol)
+            except ValueError:
+                res["err_msg"] = "invalid symbol"
+        if not res["err_msg"]:
+            try:
+                bars = await self.api.query_history(ib_contract, start, end, bar_size, what_to_show, use_rth)
+                res["result"] = True
+                res["data"] = bars.to_dict()
+            except HistoryError as e:
+                res["err_msg"] = str(e)
+        self.finish(res)
+
+class Metrics(BaseHttpHandler):
+    async def get(self):
+        """?reset=1 clears the stage histograms once read"""
+        res = {"result": True, "data": self.api.metrics()}
+        if self.get_argument("reset", ""):
+            pipeline.reset()
         self.finish(res)
 
 class Trade(BaseWsHandler):
     def open(self):
-        self.api.trade_register.login(self.callback)
+        if not self.subscribe("trade"):
+            return
         self.api.logger(f"Trade on open {self.request.remote_ip}")
         self.write_message(json.dumps({"result":True,"message":"Trade kaigao"}))
         pass
@@ -131,19 +300,21 @@ class Trade(BaseWsHandler):
         pass
         
     def on_close(self):
-        self.api.trade_register.logout(self.callback)
+        self.unsubscribe("trade")
         self.api.logger(f"Tick on close {self.request.remote_ip}")
         pass
 
     def callback(self, message):
+        """message is already serialized by the Register"""
         try:
-            self.write_message(json.dumps(message))
+            return self.write_message(message)
         except Exception as e:
             self.api.logger(str(e))
 
 class Depth(BaseWsHandler):
     def open(self):
-        self.api.depth_register.login(self.callback)
+        if not self.subscribe("depth"):
+            return
         self.api.logger(f"Depth on open {self.request.remote_ip}")
         self.write_message(json.dumps({"result":True,"message":"Depth kaigao"}))
         pass
@@ -153,19 +324,21 @@ class Depth(BaseWsHandler):
         pass
         
     def on_close(self):
-        self.api.depth_register.logout(self.callback)
+        self.unsubscribe("depth")
         self.api.logger(f"Depth on close {self.request.remote_ip}")
         pass
 
     def callback(self, message):
+        """message is already serialized by the Register"""
         try:
-            self.write_message(json.dumps(message))
+            return self.write_message(message)
         except Exception as e:
             self.api.logger(str(e))
 
 class Candle(BaseWsHandler):
     def open(self):
-        self.api.candle_register.login(self.callback)
+        if not self.subscribe("candle"):
+            return
         self.api.logger(f"Candle on open {self.request.remote_ip}")
         self.write_message(json.dumps({"result":True,"message":"Candle kaigao"}))
         pass
@@ -175,19 +348,20 @@ class Candle(BaseWsHandler):
         pass
         
     def on_close(self):
-        self.api.candle_register.logout(self.callback)
+        self.unsubscribe("candle")
         self.api.logger(f"Candle on close {self.request.remote_ip}")
         pass
 
     def callback(self, message):
+        """message is already serialized by the Register"""
         try:
-            self.write_message(json.dumps(message))
+            return self.write_message(message)
         except Exception as e:
             self.api.logger(str(e))
 
 class Order(BaseWsHandler):
     def open(self):
-        self.api.order_register.login(self.callback)
+        self.api.order_register.login(self.callback, overflow=self.close)
         self.write_message(json.dumps({"result":True,"message":"Order kaigao"}))
         self.api.logger(f"Order on open {self.request.remote_ip}")
         pass
@@ -202,8 +376,32 @@ class Order(BaseWsHandler):
         pass
 
     def callback(self, message):
+        """message is already serialized by the Register"""
+        try:
+            return self.write_message(message)
+        except Exception as e:
+            self.api.logger(str(e))
+
+class Fills(BaseWsHandler):
+    def open(self):
+        self.api.fill_register.login(self.callback, overflow=self.close)
+        self.write_message(json.dumps({"result":True,"message":"Fills kaigao"}))
+        self.api.logger(f"Fills on open {self.request.remote_ip}")
+        pass
+
+    def on_message(self, message):
+        self.api.logger(message)
+        pass
+        
+    def on_close(self):
+        self.api.fill_register.logout(self.callback)
+        self.api.logger(f"Fills on close {self.request.remote_ip}")
+        pass
+
+    def callback(self, message):
+        """message is already serialized by the Register"""
         try:
-            self.write_message(json.dumps(message))
+            return self.write_message(message)
         except Exception as e:
             self.api.logger(str(e))
 
@@ -211,12 +409,17 @@ handlers = [
     (r"/contract", Contract),
     (r"/position", Position),
     (r"/make_order", MakeOrder),
+    (r"/make_orders", MakeOrders),
     (r"/open_order", OpenOrder),
     (r"/cancel_order", CancelOrder),
     (r"/account", Account),
     (r"/query_order", QueryOrder),
+    (r"/executions", Executions),
+    (r"/history", History),
+    (r"/metrics", Metrics),
     (r"/trade", Trade),
     (r"/depth", Depth),
     (r"/candle_stick", Candle),
     (r"/order", Order),
+    (r"/fills", Fills),
 ]
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Historical bars backfill, behind IbApi.query_history and GET /history.
+
+A backfill of any range is split into chunks no longer than IB serves in one
+reqHistoricalData for the bar size (a day of 1 min bars, a week of 5 mins...),
+sent newest first under IB's pacing rules:
+    - at most max_requests requests in any window seconds (60 per 10 minutes),
+    - no identical request within identical_interval seconds,
+    - at most burst[0] requests for one contract and bar type in burst[1]
+      seconds,
+and at most max_active chunks in flight. IB times the last two from when it
+receives the requests, they are waited margin seconds more. A chunk refused
+for a pacing violation (error 162) is sent again after retry_delay seconds,
+longer at each attempt, and nothing else is sent meanwhile; one that is never
+answered is cancelled and sent again after request_timeout. Chunks in flight
+when the connection is lost are sent again once reconnected, but a fetch
+while disconnected fails at once. When a chunk fails, the other chunks of
+its backfill are dropped, those in flight cancelled; the errors TWS still
+sends for cancelled requests are swallowed for request_timeout seconds.
+
+Bars arrive into per chunk columns (array.array), assembled once the last
+chunk is done into one contiguous Bars, oldest first, without the overlaps
+of neighbour chunks.
+"""
+from array import array
+from bisect import bisect_left
+from collections import deque
+import asyncio
+import time
+
+import tornado.ioloop
+
+# bar size -> (seconds per bar, longest request IB serves for it in seconds)
+BAR_SIZES = {
+    "1 secs": (1, 1800),
+    "5 secs": (5, 3600),
+    "10 secs": (10, 14400),
+    "15 secs": (15, 14400),
+    "30 secs": (30, 28800),
+    "1 min": (60, 86400),
+    "2 mins": (120, 2 * 86400),
+    "3 mins": (180, 7 * 86400),
+    "5 mins": (300, 7 * 86400),
+    "10 mins": (600, 7 * 86400),
+    "15 mins": (900, 7 * 86400),
+    "20 mins": (1200, 7 * 86400),
+    "30 mins": (1800, 7 * 86400),
+    "1 hour": (3600, 30 * 86400),
+    "2 hours": (7200, 30 * 86400),
+    "3 hours": (10800, 30 * 86400),
+    "4 hours": (14400, 30 * 86400),
+    "8 hours": (28800, 30 * 86400),
+    "1 day": (86400, 365 * 86400),
+}
+# IB keeps bars of 30 secs and less for 6 months
+SMALL_BARS_HISTORY = 180 * 86400
+HISTORICAL_DATA_ERROR = 162
+# errors of reqHistoricalData that end the chunk without bars
+NO_DATA = ("HMDS query returned no data",)
+
+class HistoryError(Exception):
+    pass
+
+def duration(seconds):
+    """durationStr, in seconds up to a day, in days above"""
+    if seconds <= 86400:
+        return f"{int(seconds)} S"
+    return f"{-(-int(seconds) // 86400)} D"
+
+def bar_time(date):
+    """BarData.date of formatDate 2: seconds since the epoch, or yyyymmdd
+    for daily bars (local midnight)"""
+    if len(date) == 8:
+        return int(time.mktime(time.strptime(date, "%Y%m%d")))
+    return int(date)
+
+class Bars:
+    """Columns of bars, oldest first, time in seconds since the epoch."""
+    COLUMNS = ("time", "open", "high", "low", "close", "volume", "wap", "count")
+    TYPECODES = ("q", "d", "d", "d", "d", "q", "d", "q")
+
+    def __init__(self):
+        for (name, typecode) in zip(self.COLUMNS, self.TYPECODES):
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.time)
+
+    def append(self, ts, ib_bar):
+        self.time.append(ts)
+        self.open.append(ib_bar.open)
+        self.high.append(ib_bar.high)
+        self.low.append(ib_bar.low)
+        self.close.append(ib_bar.close)
+        self.volume.append(ib_bar.volume)
+        self.wap.append(ib_bar.average)
+        self.count.append(ib_bar.barCount)
+
+    def extend(self, other, start, end):
+        """appends the bars of other with start <= time < end, other is sorted,
+        its columns can be any buffer of the same typecodes (see barcache)"""
+        lo = bisect_left(other.time, start)
+        hi = max(bisect_left(other.time, end), lo)
+        for name in self.COLUMNS:
+            getattr(self, name).frombytes(memoryview(getattr(other, name))[lo:hi].cast("B"))
+
+    def to_dict(self):
+        return {name: getattr(self, name).tolist() for name in self.COLUMNS}
+
+class Chunk:
+    def __init__(self, backfill, start, end):
+        self.backfill = backfill
+        self.start = start
+        self.end = end
+        self.bars = Bars()
+        self.attempts = 0
+        self.not_before = 0
+        self.sent_at = 0
+        self.done = False
+
+    def key(self):
+        """identical requests share this key"""
+        return self.backfill.key + (self.end, self.end - self.start)
+
+class Backfill:
+    def __init__(self, contract, start, end, bar_size, what_to_show, use_rth, future):
+        self.contract = contract
+        self.start = start
+        self.end = end
+        self.bar_size = bar_size
+        self.what_to_show = what_to_show
+        self.use_rth = use_rth
+        self.future = future
+        self.key = (contract.symbol, contract.secType, contract.exchange, contract.currency, bar_size, what_to_show, use_rth)
+        step = BAR_SIZES[bar_size][1]
+        # newest first
+        self.chunks = []
+        chunk_end = end
+        while chunk_end > start:
+            self.chunks.append(Chunk(self, max(start, chunk_end - step), chunk_end))
+            chunk_end -= step
+        self.pending = len(self.chunks)
+
+    def assemble(self):
+        bars = Bars()
+        last = self.start
+        for chunk in reversed(self.chunks):
+            bars.extend(chunk.bars, last, self.end)
+            if len(bars):
+                last = bars.time[-1] + 1
+        return bars
+
+class HistoryEngine:
+    def __init__(self, api, max_active=3, max_requests=60, window=600, identical_interval=15,
+            burst=(5, 2.0), margin=1.0, retry_delay=15, max_attempts=5, request_timeout=120):
+        self.api = api
+        self.max_active = max_active
+        self.max_requests = max_requests
+        self.window = window
+        self.identical_interval = identical_interval
+        self.burst = burst
+        self.margin = margin
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.request_timeout = request_timeout
+        self.queue = deque()
+        # reqId -> Chunk
+        self.active = {}
+        # reqId -> monotonic time, of the requests cancelled
+        self.cancelled = {}
+        # send times, of all requests and by Backfill.key
+        self.sent = deque()
+        self.sent_by_key = {}
+        self.sent_identical = {}
+        # no request before, after a pacing violation
+        self.paused_until = 0
+        self.timer = None
+        self.requests = 0
+        self.violations = 0
+        self.timeouts = 0
+
+    async def fetch(self, contract, start, end, bar_size="1 min", what_to_show="TRADES", use_rth=True):
+        """Bars of contract with start <= time < end (seconds since the
+        epoch), raises HistoryError."""
+        if bar_size not in BAR_SIZES:
+            raise HistoryError(f"invalid bar size {bar_size}")
+        if BAR_SIZES[bar_size][0] <= 30:
+            start = max(start, time.time() - SMALL_BARS_HISTORY)
+        (start, end) = (int(start), int(end))
+        future = asyncio.get_event_loop().create_future()
+        backfill = Backfill(contract, start, end, bar_size, what_to_show, int(use_rth), future)
+        if not backfill.chunks:
+            return Bars()
+        if not self.api.client.isConnected():
+            raise HistoryError("not connected")
+        self.queue.extend(backfill.chunks)
+        self.schedule()
+        return await future
+
+    def pace_delay(self, chunk, now):
+        """seconds before chunk may be sent"""
+        delay = max(chunk.not_before, self.paused_until) - now
+        if len(self.sent) >= self.max_requests:
+            delay = max(delay, self.sent[-self.max_requests] + self.window - now)
+        last = self.sent_identical.get(chunk.key())
+        if last is not None:
+            delay = max(delay, last + self.identical_interval + self.margin - now)
+        sent = self.sent_by_key.get(chunk.backfill.key)
+        if sent is not None and len(sent) >= self.burst[0]:
+            delay = max(delay, sent[-self.burst[0]] + self.burst[1] + self.margin - now)
+        return delay
+
+    def schedule(self):
+        """Sends the chunks allowed now, and plans the next call."""
+        if self.timer is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.timer)
+            self.timer = None
+        now = time.monotonic()
+        self.expire(now)
+        connected = self.api.client.isConnected()
+        wait = None
+        for chunk in list(self.queue):
+            if not connected or len(self.active) >= self.max_active:
+                break
+            delay = self.pace_delay(chunk, now)
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            self.queue.remove(chunk)
+            self.send(chunk, now)
+        if self.active:
+            wait = min(wait or self.request_timeout, self.request_timeout)
+        if wait is not None and connected:
+            self.timer = tornado.ioloop.IOLoop.current().call_later(wait, self.schedule)
+
+    def send(self, chunk, now):
+        backfill = chunk.backfill
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        self.sent.append(now)
+        sent = self.sent_by_key.setdefault(backfill.key, deque(maxlen=self.burst[0]))
+        sent.append(now)
+        self.sent_identical[chunk.key()] = now
+        chunk.attempts += 1
+        chunk.sent_at = now
+        chunk.bars = Bars()
+        self.requests += 1
+        reqid = self.api.next_reqid()
+        self.active[reqid] = chunk
+        end_str = time.strftime("%Y%m%d %H:%M:%S", time.localtime(chunk.end))
+        self.api.client.reqHistoricalData(reqid, backfill.contract, end_str, duration(chunk.end - chunk.start),
+            backfill.bar_size, backfill.what_to_show, backfill.use_rth, 2, False, [])
+
+    def expire(self, now):
+        """chunks never answered are cancelled and sent again"""
+        for (reqid, cancelled_at) in list(self.cancelled.items()):
+            if now - cancelled_at > self.request_timeout:
+                del self.cancelled[reqid]
+        for (reqid, chunk) in list(self.active.items()):
+            if now - chunk.sent_at > self.request_timeout and reqid in self.active:
+                self.timeouts += 1
+                self.cancel(reqid, now)
+                self.retry(chunk, now, f"history {reqid} timed out")
+
+    def cancel(self, reqid, now):
+        del self.active[reqid]
+        self.cancelled[reqid] = now
+        if self.api.client.isConnected():
+            self.api.client.cancelHistoricalData(reqid)
+
+    def retry(self, chunk, now, reason):
+        if chunk.attempts >= self.max_attempts:
+            self.fail(chunk.backfill, f"{reason}, {chunk.attempts} attempts")
+            return False
+        chunk.not_before = now + self.retry_delay * chunk.attempts
+        self.queue.appendleft(chunk)
+        return True
+
+    def fail(self, backfill, reason):
+        for chunk in backfill.chunks:
+            chunk.done = True
+            if chunk in self.queue:
+                self.queue.remove(chunk)
+        now = time.monotonic()
+        for (reqid, chunk) in list(self.active.items()):
+            if chunk.backfill is backfill:
+                self.cancel(reqid, now)
+        if not backfill.future.done():
+            backfill.future.set_exception(HistoryError(reason))
+
+    def bar(self, reqId, ib_bar):
+        chunk = self.active.get(reqId)
+        if chunk is None:
+            return False
+        chunk.bars.append(bar_time(ib_bar.date), ib_bar)
+        return True
+
+    def end(self, reqId):
+        chunk = self.active.pop(reqId, None)
+        if chunk is None:
+            return False
+        self.complete(chunk)
+        self.schedule()
+        return True
+
+    def complete(self, chunk):
+        backfill = chunk.backfill
+        if chunk.done:
+            return
+        chunk.done = True
+        backfill.pending -= 1
+        if not backfill.pending and not backfill.future.done():
+            backfill.future.set_result(backfill.assemble())
+
+    def error(self, reqId, errorCode, errorString):
+        """Returns True when the error is about a chunk."""
+        chunk = self.active.pop(reqId, None)
+        if chunk is None:
+            # the trailing error of a request cancelled
+            return reqId in self.cancelled
+        if errorCode == HISTORICAL_DATA_ERROR and "pacing violation" in errorString:
+            self.violations += 1
+            if self.retry(chunk, time.monotonic(), errorString):
+                self.paused_until = max(self.paused_until, chunk.not_before)
+        elif errorCode == HISTORICAL_DATA_ERROR and any(text in errorString for text in NO_DATA):
+            self.complete(chunk)
+        else:
+            self.fail(chunk.backfill, f"{errorCode} {errorString}")
+        self.schedule()
+        return True
+
+    def disconnected(self):
+        """the chunks in flight are sent again after reconnecting"""
+        for chunk in self.active.values():
+            chunk.attempts -= 1
+            self.queue.appendleft(chunk)
+        self.active.clear()
+
+    def stats(self):
+        return {"queued": len(self.queue), "active": len(self.active), "cancelled": len(self.cancelled), "requests": self.requests, "violations": self.violations, "timeouts": self.timeouts}
@@ -0,0 +1,138 @@
+"""
+Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is subject to the terms
+ and conditions of the IB API Non-Commercial License or the IB API Commercial License, as applicable.
+"""
+
+
+"""
+asyncio replacement for the Connection + EReader pair.
+The transport is driven by the event loop: incoming bytes are received
+straight into a comm.MsgBuffer, split into length-prefixed messages right in
+buffer_updated and handed to msgHandler, without an extra thread or Queue in
+between.
+All methods must be called from the event loop thread.
+Like the EReader, messages are written to capture when it is set, and it is
+closed on disconnect. recvTime is the time.perf_counter_ns() of the chunk
+being dispatched, as in Connection.
+sendMsg queues the message and schedules one flush with call_soon, which
+hands everything queued to the transport with a single writelines: the
+requests sent from one loop callback share a write. The transport buffers
+what the socket does not take and disables Nagle itself.
+"""
+
+
+import asyncio
+import logging
+import time
+
+from ibapi import comm
+from ibapi.common import * # @UnusedWildImport
+from ibapi.errors import * # @UnusedWildImport
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncConnection(asyncio.BufferedProtocol):
+    def __init__(self, host, port, loop, msgHandler):
+        self.host = host
+        self.port = port
+        self.loop = loop
+        self.msgHandler = msgHandler
+        self.transport = None
+        self.wrapper = None
+        self.msgBuf = comm.MsgBuffer()
+        self.capture = None
+        self.recvTime = 0
+        self.closed = loop.create_future()
+        self.outbox = []
+        self.queuedBytes = 0
+        self.maxQueuedBytes = 0
+        self.sentMsgs = 0
+        self.sentBytes = 0
+        self.sendCalls = 0
+
+
+    async def connect(self):
+        await self.loop.create_connection(lambda: self, self.host, self.port)
+
+
+    def connection_made(self, transport):
+        logger.debug("connected to %s:%d", self.host, self.port)
+        self.transport = transport
+
+
+    def connection_lost(self, exc):
+        logger.debug("socket either closed or broken %s", exc)
+        self.disconnect()
+
+
+    def get_buffer(self, sizehint):
+        return self.msgBuf.freeView()
+
+
+    def buffer_updated(self, nbytes):
+        self.recvTime = time.perf_counter_ns()
+        self.msgBuf.written(nbytes)
+        recvTime = time.time_ns()
+        for msg in self.msgBuf.msgs():
+            if self.capture is not None:
+                self.capture.write(recvTime, msg)
+            self.msgHandler(msg)
+            if self.transport is None:
+                # msgHandler disconnected us
+                return
+
+
+    def disconnect(self):
+        if self.transport is not None:
+            logger.debug("disconnecting")
+            transport = self.transport
+            self.transport = None
+            self.outbox = []
+            self.queuedBytes = 0
+            transport.close()
+            logger.debug("disconnected")
+            if self.wrapper:
+                self.wrapper.connectionClosed()
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if not self.closed.done():
+            self.closed.set_result(True)
+
+
+    def isConnected(self):
+        return self.transport is not None
+
+
+    def sendMsg(self, msg):
+        if not self.isConnected():
+            logger.debug("sendMsg attempted while not connected")
+            return 0
+        if not self.outbox:
+            self.loop.call_soon(self.flush)
+        self.outbox.append(msg)
+        self.queuedBytes += len(msg)
+        self.sentMsgs += 1
+        queued = self.pendingBytes()
+        if queued > self.maxQueuedBytes:
+            self.maxQueuedBytes = queued
+        return len(msg)
+
+
+    def flush(self):
+        if not self.outbox or self.transport is None:
+            return
+        msgs = self.outbox
+        self.outbox = []
+        self.transport.writelines(msgs)
+        self.sendCalls += 1
+        self.sentBytes += self.queuedBytes
+        self.queuedBytes = 0
+
+
+    def pendingBytes(self):
+        """queued here and in the transport buffer"""
+        buffered = self.transport.get_write_buffer_size() if self.transport is not None else 0
+        return self.queuedBytes + buffered
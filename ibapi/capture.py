@@ -0,0 +1,108 @@
+"""
+Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is subject to the terms
+ and conditions of the IB API Non-Commercial License or the IB API Commercial License, as applicable.
+"""
+
+
+"""
+Wire capture of the messages received from TWS, for replay.
+
+A capture file starts with a HEADER (magic, server version) followed by
+frames: FRAME (receive time in ns since the epoch, kind, length) then length
+bytes. MSG frames hold one message as received, size prefix removed. NOTE
+frames hold a utf-8 JSON object written by the application, e.g. which
+stream a reqId belongs to, so the replay can rebuild that state.
+"""
+
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+MAGIC = b"IBCAP\x00\x00\x01"
+HEADER = struct.Struct("<8sI")
+FRAME = struct.Struct("<qBI")
+(MSG, NOTE) = range(2)
+
+
+class CaptureWriter:
+    """Appends frames to a capture file. Messages are written by the reader
+    (thread or event loop), notes by the application, hence the lock. The
+    file buffer is flushed at least every flushInterval seconds of capture."""
+
+    def __init__(self, filename, serverVersion, bufferSize=1024 * 1024, flushInterval=1.0):
+        self.filename = filename
+        self.file = open(filename, "wb", buffering=bufferSize)
+        self.file.write(HEADER.pack(MAGIC, serverVersion))
+        self.lock = threading.Lock()
+        self.nFrames = 0
+        self.flushInterval = int(flushInterval * 1e9)
+        self.flushTime = time.time_ns() + self.flushInterval
+
+
+    def write(self, ts, msg, kind=MSG):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(FRAME.pack(ts, kind, len(msg)))
+            self.file.write(msg)
+            self.nFrames += 1
+            if ts >= self.flushTime:
+                self.file.flush()
+                self.flushTime = ts + self.flushInterval
+
+
+    def note(self, **kwargs):
+        self.write(time.time_ns(), json.dumps(kwargs).encode(), NOTE)
+
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class CaptureReader:
+    """Frames of a capture file, memory mapped."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("%s is not a capture file" % filename)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.serverVersion) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError("%s is not a capture file" % filename)
+
+
+    def __iter__(self):
+        """Yields (ts, kind, data), data is a bytes copy. A frame truncated
+        at the end of the file (capture still being written) is skipped."""
+        buf = self.map
+        end = len(buf)
+        offset = HEADER.size
+        while offset + FRAME.size <= end:
+            (ts, kind, size) = FRAME.unpack_from(buf, offset)
+            offset += FRAME.size
+            if offset + size > end:
+                break
+            yield (ts, kind, buf[offset:offset + size])
+            offset += size
+
+
+    def close(self):
+        self.map.close()
@@ -14,12 +14,16 @@ It takes care of almost everything:
 The user just needs to override EWrapper methods to receive the answers.
 """
 
+import asyncio
 import logging
+import os
 import queue
 import socket
 
 from ibapi import (decoder, reader, comm)
+from ibapi.capture import CaptureWriter
 from ibapi.connection import Connection
+from ibapi.aioconnection import AsyncConnection
 from ibapi.message import OUT
 from ibapi.common import * # @UnusedWildImport
 from ibapi.contract import Contract
@@ -27,6 +31,8 @@ from ibapi.order import Order
 from ibapi.execution import ExecutionFilter
 from ibapi.scanner import ScannerSubscription
 from ibapi.comm import (make_field, make_field_handle_empty)
+from ibapi.encoder import (encodeField, encodeFieldHandleEmpty, staticFields,
+    FieldRun, makeMsg)
 from ibapi.utils import (current_fn_name, BadMessage)
 from ibapi.errors import * #@UnusedWildImport
 from ibapi.server_versions import * # @UnusedWildImport
@@ -36,6 +42,81 @@ from ibapi.server_versions import * # @UnusedWildImport
 logger = logging.getLogger(__name__)
 
 
+# field runs of the requests built with ibapi.encoder, in wire order
+CONTRACT_CACHE_SIZE = 256
+# the contract block of recent servers, cached: orders and market data
+# requests are mostly sent for the same few contracts
+ORDER_CONTRACT_FIELDS = FieldRun("conId", "symbol", "secType",
+    "lastTradeDateOrContractMonth", "strike", "right", "multiplier", "exchange",
+    "primaryExchange", "currency", "localSymbol", "tradingClass", "secIdType",
+    "secId", cacheSize=CONTRACT_CACHE_SIZE)
+REQUEST_CONTRACT_FIELDS = FieldRun("conId", "symbol", "secType",
+    "lastTradeDateOrContractMonth", "strike", "right", "multiplier", "exchange",
+    "primaryExchange", "currency", "localSymbol", "tradingClass",
+    cacheSize=CONTRACT_CACHE_SIZE)
+CONTRACT_FIELDS = FieldRun("symbol", "secType", "lastTradeDateOrContractMonth",
+    "strike", "right", "multiplier", "exchange", "primaryExchange", "currency",
+    "localSymbol")
+CONTRACT_SEC_ID_FIELDS = FieldRun("secIdType", "secId")
+MKT_DEPTH_CONTRACT_FIELDS = FieldRun("symbol", "secType",
+    "lastTradeDateOrContractMonth", "strike", "right", "multiplier", "exchange")
+CONTRACT_LOCAL_FIELDS = FieldRun("currency", "localSymbol")
+DELTA_NEUTRAL_CONTRACT_FIELDS = FieldRun("conId", "delta", "price")
+MKT_DATA_COMBO_LEG_FIELDS = FieldRun("conId", "ratio", "action", "exchange")
+COMBO_LEG_FIELDS = FieldRun("conId", "ratio", "action", "exchange", "openClose",
+    "shortSaleSlot", "designatedLocation")
+TAG_VALUE_FIELDS = FieldRun("tag", "value")
+ORDER_EXTENDED_FIELDS = FieldRun("tif", "ocaGroup", "account", "openClose",
+    "origin", "orderRef", "transmit", "parentId", "blockOrder", "sweepToFill",
+    "displaySize", "triggerMethod", "outsideRth", "hidden")
+ORDER_FA_FIELDS = FieldRun("discretionaryAmt", "goodAfterTime", "goodTillDate",
+    "faGroup", "faMethod", "faPercentage", "faProfile")
+ORDER_SHORT_SALE_FIELDS = FieldRun("shortSaleSlot", "designatedLocation")
+ORDER_MISC_FIELDS = FieldRun("ocaType", "rule80A", "settlingFirm", "allOrNone",
+    "minQty?", "percentOffset?", "eTradeOnly", "firmQuoteOnly", "nbboPriceCap?",
+    "auctionStrategy", "startingPrice?", "stockRefPrice?", "delta?",
+    "stockRangeLower?", "stockRangeUpper?", "overridePercentageConstraints",
+    "volatility?", "volatilityType?", "deltaNeutralOrderType",
+    "deltaNeutralAuxPrice?")
+ORDER_DELTA_NEUTRAL_CONID_FIELDS = FieldRun("deltaNeutralConId",
+    "deltaNeutralSettlingFirm", "deltaNeutralClearingAccount",
+    "deltaNeutralClearingIntent")
+ORDER_DELTA_NEUTRAL_OPEN_CLOSE_FIELDS = FieldRun("deltaNeutralOpenClose",
+    "deltaNeutralShortSale", "deltaNeutralShortSaleSlot",
+    "deltaNeutralDesignatedLocation")
+ORDER_TRAIL_FIELDS = FieldRun("continuousUpdate", "referencePriceType?",
+    "trailStopPrice?")
+ORDER_SCALE_LEVEL_FIELDS = FieldRun("scaleInitLevelSize?", "scaleSubsLevelSize?")
+ORDER_SCALE_PRICE_FIELDS = FieldRun("scalePriceAdjustValue?",
+    "scalePriceAdjustInterval?", "scaleProfitOffset?", "scaleAutoReset",
+    "scaleInitPosition?", "scaleInitFillQty?", "scaleRandomPercent")
+ORDER_SCALE_TABLE_FIELDS = FieldRun("scaleTable", "activeStartTime", "activeStopTime")
+ORDER_PTA_FIELDS = FieldRun("clearingAccount", "clearingIntent")
+ORDER_RANDOMIZE_FIELDS = FieldRun("randomizeSize", "randomizePrice")
+ORDER_PEG_BENCH_FIELDS = FieldRun("referenceContractId",
+    "isPeggedChangeAmountDecrease", "peggedChangeAmount",
+    "referenceChangeAmount", "referenceExchangeId")
+ORDER_CONDITIONS_FIELDS = FieldRun("conditionsIgnoreRth", "conditionsCancelOrder")
+ORDER_ADJUSTED_FIELDS = FieldRun("adjustedOrderType", "triggerPrice",
+    "lmtPriceOffset", "adjustedStopPrice", "adjustedStopLimitPrice",
+    "adjustedTrailingAmount", "adjustableTrailingUnit")
+ORDER_SOFT_DOLLAR_TIER_FIELDS = FieldRun("softDollarTier.name", "softDollarTier.val")
+ORDER_DECISION_MAKER_FIELDS = FieldRun("mifid2DecisionMaker", "mifid2DecisionAlgo")
+ORDER_MIFID_EXECUTION_FIELDS = FieldRun("mifid2ExecutionTrader", "mifid2ExecutionAlgo")
+# Order attributes placeOrder reads before its tail (EClient.orderTailFields)
+# or only for BAG contracts; all the others must be defaults for the tail to
+# be spliced from DEFAULT_ORDER_TAILS, by server version
+ORDER_HEAD_ATTRIBUTES = {"orderId", "clientId", "permId", "action",
+    "totalQuantity", "orderType", "lmtPrice", "auxPrice", "tif", "ocaGroup",
+    "account", "openClose", "origin", "orderRef", "transmit", "parentId",
+    "blockOrder", "sweepToFill", "displaySize", "triggerMethod", "outsideRth",
+    "hidden", "orderComboLegs", "smartComboRoutingParams", "softDollarTier"}
+ORDER_TAIL_DEFAULTS = FieldRun(*(name for name in vars(Order())
+    if name not in ORDER_HEAD_ATTRIBUTES), "softDollarTier.name",
+    "softDollarTier.val", "softDollarTier.displayName", defaults=Order())
+DEFAULT_ORDER_TAILS = {}
+
+
 class EClient(object):
     (DISCONNECTED, CONNECTING, CONNECTED, REDIRECT) = range(4)
 
@@ -45,6 +126,8 @@ class EClient(object):
         self.msg_queue = queue.Queue()
         self.wrapper = wrapper
         self.decoder = None
+        # directory of the wire captures, one file per connection, None to disable
+        self.capturePath = None
         self.reset()
 
 
@@ -63,6 +146,10 @@ class EClient(object):
         self.asynchronous = False
         self.reader = None
         self.decode = None
+        self.connectAnswer = None
+        self.capture = None
+        # requests held by beginBatch until endBatch, None when not batching
+        self.batch = None
         self.setConnState(EClient.DISCONNECTED)
 
 
@@ -74,10 +161,45 @@ class EClient(object):
 
     def sendMsg(self, msg):
         full_msg = comm.make_msg(msg)
-        logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
+        if self.batch is not None:
+            self.batch.append(full_msg)
+            return
+        self.conn.sendMsg(full_msg)
+
+
+    def sendEncoded(self, pieces):
+        """sendMsg of a request built with ibapi.encoder"""
+        full_msg = makeMsg(pieces)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s %s %s", "SENDING", current_fn_name(1), full_msg)
+        if self.batch is not None:
+            self.batch.append(full_msg)
+            return
         self.conn.sendMsg(full_msg)
 
 
+    def beginBatch(self):
+        """ Holds the requests sent from now on until endBatch, which writes
+        them to the socket at once (e.g. a ladder of placeOrder). Batches
+        do not nest. """
+
+        self.batch = []
+
+
+    def endBatch(self):
+        """ Sends the requests held since beginBatch in a single write.
+        Returns the number of requests sent. """
+
+        msgs = self.batch
+        self.batch = None
+        if not msgs or self.conn is None:
+            return 0
+        self.conn.sendMsg(b"".join(msgs))
+        return len(msgs)
+
+
     def logRequest(self, fnName, fnParams):
         if logger.isEnabledFor(logging.INFO):
             if 'self' in fnParams:
@@ -110,7 +232,7 @@ class EClient(object):
 
         self.sendMsg(msg)
 
-    def connect(self, host, port, clientId):
+    def connect(self, host, port, clientId, loop=None):
         """This function must be called before any other. There is no
         feedback for a successful connection, but a subsequent attempt to
         connect will return the message \"Already connected.\"
@@ -123,8 +245,16 @@ class EClient(object):
             orders placed/modified from this client will be associated with
             this client identifier.
 
-            Note: Each client MUST connect with a unique clientId."""
+            Note: Each client MUST connect with a unique clientId.
+        loop:asyncio.AbstractEventLoop - Optional. When given, the connection
+            uses an asyncio transport on this loop instead of a blocking
+            socket and the EReader thread: messages are decoded on the loop
+            as they arrive and nothing is put in msg_queue. connect then
+            returns an asyncio.Task that completes once the handshake is done,
+            and the client must only be used from the loop thread."""
 
+        if loop is not None:
+            return loop.create_task(self.connectAsync(host, port, clientId, loop))
 
         try:
             self.host = host
@@ -136,44 +266,29 @@ class EClient(object):
 
             self.conn.connect()
             self.setConnState(EClient.CONNECTING)
-
-            #TODO: support async mode
-
-            v100prefix = "API\0"
-            v100version = "v%d..%d" % (MIN_CLIENT_VER, MAX_CLIENT_VER)
-            #v100version = "v%d..%d" % (MIN_CLIENT_VER, 101)
-            msg = comm.make_msg(v100version)
-            logger.debug("msg %s", msg)
-            msg2 = str.encode(v100prefix, 'ascii') + msg
-            logger.debug("REQUEST %s", msg2)
-            self.conn.sendMsg(msg2)
+            self.sendConnectRequest()
 
             self.decoder = decoder.Decoder(self.wrapper, self.serverVersion())
+            msgBuf = comm.MsgBuffer()
             fields = []
 
             #sometimes I get news before the server version, thus the loop
             while len(fields) != 2:
                 self.decoder.interpret(fields)
-                buf = self.conn.recvMsg()
-                logger.debug("ANSWER %s", buf)
-                if len(buf) > 0:
-                    (size, msg, rest) = comm.read_msg(buf)
-                    logger.debug("size:%d msg:%s rest:%s|", size, msg, rest)
+                msg = msgBuf.popMsg()
+                if msg is not None:
                     fields = comm.read_fields(msg)
-                    logger.debug("fields %s", fields)
+                    logger.debug("ANSWER fields %s", fields)
                 else:
                     fields = []
+                    self.conn.recvMsgInto(msgBuf)
+                    if not self.conn.isConnected():
+                        raise ConnectionError("connection closed during handshake")
 
-            (server_version, conn_time) = fields
-            server_version = int(server_version)
-            logger.debug("ANSWER Version:%d time:%s", server_version, conn_time)
-            self.connTime = conn_time
-            self.serverVersion_ = server_version
-            self.decoder.serverVersion = self.serverVersion()
-
-            self.setConnState(EClient.CONNECTED)
+            self.processConnectAnswer(fields)
 
-            self.reader = reader.EReader(self.conn, self.msg_queue)
+            # messages received right after the handshake answer stay in msgBuf
+            self.reader = reader.EReader(self.conn, self.msg_queue, self.msgQueued, msgBuf, self.capture)
             self.reader.start()   # start thread
             logger.info("sent startApi")
             self.startApi()
@@ -186,6 +301,97 @@ class EClient(object):
             self.done = True
 
 
+    async def connectAsync(self, host, port, clientId, loop):
+        """Same as connect, over an asyncio transport. Use connect(loop=...)
+        rather than calling this directly."""
+
+        try:
+            self.host = host
+            self.port = port
+            self.clientId = clientId
+            logger.debug("Connecting to %s:%d w/ id:%d (asyncio)", self.host, self.port, self.clientId)
+
+            self.conn = AsyncConnection(self.host, self.port, loop, self.dispatchMsg)
+            await self.conn.connect()
+            self.setConnState(EClient.CONNECTING)
+
+            self.decoder = decoder.Decoder(self.wrapper, self.serverVersion())
+            self.connectAnswer = loop.create_future()
+            self.sendConnectRequest()
+
+            await asyncio.wait((self.connectAnswer, self.conn.closed),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not self.connectAnswer.done():
+                raise ConnectionError("connection closed during handshake")
+
+            logger.info("sent startApi")
+            self.startApi()
+            self.wrapper.connectAck()
+        except OSError:
+            if self.wrapper:
+                self.wrapper.error(NO_VALID_ID, CONNECT_FAIL.code(), CONNECT_FAIL.msg())
+            logger.info("could not connect")
+            self.disconnect()
+            self.done = True
+
+
+    def sendConnectRequest(self):
+        v100prefix = "API\0"
+        v100version = "v%d..%d" % (MIN_CLIENT_VER, MAX_CLIENT_VER)
+        #v100version = "v%d..%d" % (MIN_CLIENT_VER, 101)
+        msg = comm.make_msg(v100version)
+        logger.debug("msg %s", msg)
+        msg2 = str.encode(v100prefix, 'ascii') + msg
+        logger.debug("REQUEST %s", msg2)
+        self.conn.sendMsg(msg2)
+
+
+    def processConnectAnswer(self, fields):
+        (server_version, conn_time) = fields
+        server_version = int(server_version)
+        logger.debug("ANSWER Version:%d time:%s", server_version, conn_time)
+        self.connTime = conn_time
+        self.serverVersion_ = server_version
+        self.decoder.serverVersion = self.serverVersion()
+        if self.capturePath:
+            self.startCapture()
+
+        self.setConnState(EClient.CONNECTED)
+
+
+    def startCapture(self):
+        os.makedirs(self.capturePath, exist_ok=True)
+        filename = os.path.join(self.capturePath, "ib-%d-%s.ibcap" % (
+            self.clientId, time.strftime("%Y%m%d-%H%M%S")))
+        logger.info("capturing to %s", filename)
+        self.capture = CaptureWriter(filename, self.serverVersion())
+
+
+    def dispatchMsg(self, msg):
+        """Message handler of the asyncio transport, called on the loop for
+        every complete message received."""
+
+        if self.connState != EClient.CONNECTING:
+            try:
+                self.decodeMsg(msg)
+            except BadMessage:
+                logger.info("BadMessage")
+                self.conn.disconnect()
+            return
+
+        fields = comm.read_fields(msg)
+        logger.debug("ANSWER fields %s", fields)
+        #sometimes I get news before the server version
+        if len(fields) != 2:
+            self.decoder.interpret(fields)
+            return
+
+        self.processConnectAnswer(fields)
+        self.conn.capture = self.capture
+        if not self.connectAnswer.done():
+            self.connectAnswer.set_result(True)
+
+
     def disconnect(self):
         """Call this function to terminate the connections with TWS.
         Calling this function does not cancel orders that have already been
@@ -203,8 +409,8 @@ class EClient(object):
         """Call this function to check if there is a connection with TWS"""
 
         connConnected = self.conn and self.conn.isConnected()
-        logger.debug("%s isConn: %s, connConnected: %s" % (id(self),
-            self.connState, str(connConnected)))
+        logger.debug("%s isConn: %s, connConnected: %s", id(self),
+            self.connState, connConnected)
         return EClient.CONNECTED == self.connState and connConnected
 
     def keyboardInterrupt(self):
@@ -216,6 +422,35 @@ class EClient(object):
         if self.nKeybIntHard > 5:
             raise SystemExit()
 
+    def captureNote(self, **kwargs):
+        """Writes an application note (reqId of a stream, ...) to the wire
+        capture, if any, for the replay."""
+
+        if self.capture is not None:
+            self.capture.note(**kwargs)
+
+    def msgQueued(self):
+        """Called from the EReader thread each time new messages have been
+        put in msg_queue. Intended to be overloaded by event-driven clients
+        that want to be woken up instead of polling the queue."""
+        pass
+
+    def decodeMsg(self, text):
+        """Decodes one message taken from msg_queue and dispatches it to the
+        wrapper. Returns False if the message was rejected and the
+        connection dropped."""
+
+        if len(text) > MAX_MSG_LEN:
+            self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
+                "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
+            self.disconnect()
+            return False
+
+        fields = comm.read_fields(text)
+        logger.debug("fields %s", fields)
+        self.decoder.interpret(fields)
+        return True
+
 
     def run(self):
         """This is the function that has the message loop."""
@@ -225,18 +460,12 @@ class EClient(object):
                         or not self.msg_queue.empty()):
                 try:
                     try:
-                        text = self.msg_queue.get(block=True, timeout=0.2)
-                        if len(text) > MAX_MSG_LEN:
-                            self.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
-                                "%s:%d:%s" % (BAD_LENGTH.msg(), len(text), text))
-                            self.disconnect()
-                            break
+                        (_, _, text) = self.msg_queue.get(block=True, timeout=0.2)
                     except queue.Empty:
                         logger.debug("queue.get: empty")
                     else:
-                        fields = comm.read_fields(text)
-                        logger.debug("fields %s", fields)
-                        self.decoder.interpret(fields)
+                        if not self.decodeMsg(text):
+                            break
                 except (KeyboardInterrupt, SystemExit):
                     logger.info("detected KeyboardInterrupt, SystemExit")
                     self.keyboardInterrupt()
@@ -360,67 +589,50 @@ class EClient(object):
                     UPDATE_TWS.msg() + "  It does not support tradingClass parameter in reqMktData.")
                 return
 
+        sv = self.serverVersion()
         VERSION = 11
 
         # send req mkt data msg
-        flds = []
-        flds += [make_field(OUT.REQ_MKT_DATA),
-            make_field(VERSION),
-            make_field(reqId)]
+        flds = [staticFields(OUT.REQ_MKT_DATA, VERSION),
+            encodeField(reqId)]
 
         # send contract fields
-        if self.serverVersion() >= MIN_SERVER_VER_REQ_MKT_DATA_CONID:
-            flds += [make_field(contract.conId),]
-
-        flds += [make_field(contract.symbol),
-            make_field(contract.secType),
-            make_field(contract.lastTradeDateOrContractMonth),
-            make_field(contract.strike),
-            make_field(contract.right),
-            make_field(contract.multiplier), # srv v15 and above
-            make_field(contract.exchange),
-            make_field(contract.primaryExchange), # srv v14 and above
-            make_field(contract.currency),
-            make_field(contract.localSymbol) ] # srv v2 and above
+        if sv >= MIN_SERVER_VER_TRADING_CLASS:
+            flds.append(REQUEST_CONTRACT_FIELDS.encode(contract))
+        else:
+            if sv >= MIN_SERVER_VER_REQ_MKT_DATA_CONID:
+                flds.append(encodeField(contract.conId))
 
-        if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds += [make_field(contract.tradingClass),]
+            flds.append(CONTRACT_FIELDS.encode(contract))
 
         # Send combo legs for BAG requests (srv v8 and above)
         if contract.secType == "BAG":
             comboLegsCount = len(contract.comboLegs) if contract.comboLegs else 0
-            flds += [make_field(comboLegsCount),]
+            flds.append(encodeField(comboLegsCount))
             for comboLeg in contract.comboLegs:
-                    flds += [make_field(comboLeg.conId),
-                        make_field( comboLeg.ratio),
-                        make_field( comboLeg.action),
-                        make_field( comboLeg.exchange)]
+                    flds.append(MKT_DATA_COMBO_LEG_FIELDS.encode(comboLeg))
 
-        if self.serverVersion() >= MIN_SERVER_VER_DELTA_NEUTRAL:
+        if sv >= MIN_SERVER_VER_DELTA_NEUTRAL:
             if contract.deltaNeutralContract:
-                flds += [make_field(True),
-                    make_field(contract.deltaNeutralContract.conId),
-                    make_field(contract.deltaNeutralContract.delta),
-                    make_field(contract.deltaNeutralContract.price)]
+                flds += [staticFields(True),
+                    DELTA_NEUTRAL_CONTRACT_FIELDS.encode(contract.deltaNeutralContract)]
             else:
-                flds += [make_field(False),]
+                flds.append(staticFields(False))
 
-        flds += [make_field(genericTickList), # srv v31 and above
-            make_field(snapshot)] # srv v35 and above
+        flds += [encodeField(genericTickList), # srv v31 and above
+            encodeField(snapshot)] # srv v35 and above
 
-        if self.serverVersion() >= MIN_SERVER_VER_REQ_SMART_COMPONENTS:
-            flds += [make_field(regulatorySnapshot),]
+        if sv >= MIN_SERVER_VER_REQ_SMART_COMPONENTS:
+            flds.append(encodeField(regulatorySnapshot))
 
         # send mktDataOptions parameter
-        if self.serverVersion() >= MIN_SERVER_VER_LINKING:
+        if sv >= MIN_SERVER_VER_LINKING:
             #current doc says this part if for "internal use only" -> won't support it
             if mktDataOptions:
                 raise NotImplementedError("not supported")
-            mktDataOptionsStr = ""
-            flds += [make_field(mktDataOptionsStr),]
+            flds.append(staticFields(""))
 
-        msg = "".join(flds)
-        self.sendMsg(msg)
+        self.sendEncoded(flds)
 
 
     def cancelMktData(self, reqId:TickerId):
@@ -1027,107 +1239,95 @@ class EClient(object):
             self.wrapper.error(orderId, UPDATE_TWS.code(), UPDATE_TWS.msg() + " It does not support Use price management algo requests")
             return
 
-        VERSION = 27 if (self.serverVersion() < MIN_SERVER_VER_NOT_HELD) else 45
+        sv = self.serverVersion()
+        VERSION = 27 if (sv < MIN_SERVER_VER_NOT_HELD) else 45
 
         # send place order msg
         flds = []
-        flds += [make_field(OUT.PLACE_ORDER)]
-
-        if self.serverVersion() < MIN_SERVER_VER_ORDER_CONTAINER:
-            flds += [make_field(VERSION)]
+        if sv < MIN_SERVER_VER_ORDER_CONTAINER:
+            flds.append(staticFields(OUT.PLACE_ORDER, VERSION))
+        else:
+            flds.append(staticFields(OUT.PLACE_ORDER))
 
-        flds += [make_field(orderId)]
+        flds.append(encodeField(orderId))
 
         # send contract fields
-        if self.serverVersion() >= MIN_SERVER_VER_PLACE_ORDER_CONID:
-            flds.append(make_field( contract.conId))
-        flds += [make_field( contract.symbol),
-            make_field( contract.secType),
-            make_field( contract.lastTradeDateOrContractMonth),
-            make_field( contract.strike),
-            make_field( contract.right),
-            make_field( contract.multiplier), # srv v15 and above
-            make_field( contract.exchange),
-            make_field( contract.primaryExchange), # srv v14 and above
-            make_field( contract.currency),
-            make_field( contract.localSymbol)] # srv v2 and above
-        if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds.append(make_field( contract.tradingClass))
+        if sv >= MIN_SERVER_VER_TRADING_CLASS:
+            flds.append(ORDER_CONTRACT_FIELDS.encode(contract))
+        else:
+            if sv >= MIN_SERVER_VER_PLACE_ORDER_CONID:
+                flds.append(encodeField(contract.conId))
+            flds.append(CONTRACT_FIELDS.encode(contract))
 
-        if self.serverVersion() >= MIN_SERVER_VER_SEC_ID_TYPE:
-            flds += [make_field( contract.secIdType),
-                make_field( contract.secId)]
+            if sv >= MIN_SERVER_VER_SEC_ID_TYPE:
+                flds.append(CONTRACT_SEC_ID_FIELDS.encode(contract))
 
         # send main order fields
-        flds.append(make_field( order.action))
+        flds.append(encodeField(order.action))
 
-        if self.serverVersion() >= MIN_SERVER_VER_FRACTIONAL_POSITIONS:
-            flds.append(make_field(order.totalQuantity))
+        if sv >= MIN_SERVER_VER_FRACTIONAL_POSITIONS:
+            flds.append(encodeField(order.totalQuantity))
         else:
-            flds.append(make_field(int(order.totalQuantity)))
+            flds.append(encodeField(int(order.totalQuantity)))
 
-        flds.append(make_field(order.orderType))
-        if self.serverVersion() < MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE:
-            flds.append(make_field(
+        flds.append(encodeField(order.orderType))
+        if sv < MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE:
+            flds.append(encodeField(
                 order.lmtPrice if order.lmtPrice != UNSET_DOUBLE else 0))
         else:
-            flds.append(make_field_handle_empty( order.lmtPrice))
-        if self.serverVersion() < MIN_SERVER_VER_TRAILING_PERCENT:
-            flds.append(make_field(
+            flds.append(encodeFieldHandleEmpty(order.lmtPrice))
+        if sv < MIN_SERVER_VER_TRAILING_PERCENT:
+            flds.append(encodeField(
                 order.auxPrice if order.auxPrice != UNSET_DOUBLE else 0))
         else:
-            flds.append(make_field_handle_empty( order.auxPrice))
-
-        # send extended order fields
-            flds += [make_field( order.tif),
-            make_field( order.ocaGroup),
-            make_field( order.account),
-            make_field( order.openClose),
-            make_field( order.origin),
-            make_field( order.orderRef),
-            make_field( order.transmit),
-            make_field( order.parentId),      # srv v4 and above
-            make_field( order.blockOrder),    # srv v5 and above
-            make_field( order.sweepToFill),   # srv v5 and above
-            make_field( order.displaySize),   # srv v5 and above
-            make_field( order.triggerMethod), # srv v5 and above
-            make_field( order.outsideRth),    # srv v5 and above
-            make_field( order.hidden)]        # srv v7 and above
+            flds.append(encodeFieldHandleEmpty(order.auxPrice))
+
+            # send extended order fields (srv v4 to v7 fields, only sent
+            # along with the auxPrice of recent servers, as it always was)
+            flds.append(ORDER_EXTENDED_FIELDS.encode(order))
 
         # Send combo legs for BAG requests (srv v8 and above)
         if contract.secType == "BAG":
             comboLegsCount = len(contract.comboLegs) if contract.comboLegs else 0
-            flds.append(make_field(comboLegsCount))
+            flds.append(encodeField(comboLegsCount))
             if comboLegsCount > 0:
                 for comboLeg in contract.comboLegs:
                     assert comboLeg
-                    flds += [make_field(comboLeg.conId),
-                        make_field( comboLeg.ratio),
-                        make_field( comboLeg.action),
-                        make_field( comboLeg.exchange),
-                        make_field( comboLeg.openClose),
-                        make_field( comboLeg.shortSaleSlot),      #srv v35 and above
-                        make_field( comboLeg.designatedLocation)] # srv v35 and above
-                    if self.serverVersion() >= MIN_SERVER_VER_SSHORTX_OLD:
-                        flds.append(make_field(comboLeg.exemptCode))
+                    flds.append(COMBO_LEG_FIELDS.encode(comboLeg))
+                    if sv >= MIN_SERVER_VER_SSHORTX_OLD:
+                        flds.append(encodeField(comboLeg.exemptCode))
 
         # Send order combo legs for BAG requests
-        if self.serverVersion() >= MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE and contract.secType == "BAG":
+        if sv >= MIN_SERVER_VER_ORDER_COMBO_LEGS_PRICE and contract.secType == "BAG":
             orderComboLegsCount = len(order.orderComboLegs) if order.orderComboLegs else 0
-            flds.append(make_field( orderComboLegsCount))
+            flds.append(encodeField(orderComboLegsCount))
             if orderComboLegsCount:
                 for orderComboLeg in order.orderComboLegs:
                     assert orderComboLeg
-                    flds.append(make_field_handle_empty( orderComboLeg.price))
+                    flds.append(encodeFieldHandleEmpty(orderComboLeg.price))
 
-        if self.serverVersion() >= MIN_SERVER_VER_SMART_COMBO_ROUTING_PARAMS and contract.secType == "BAG":
+        if sv >= MIN_SERVER_VER_SMART_COMBO_ROUTING_PARAMS and contract.secType == "BAG":
                 smartComboRoutingParamsCount = len(order.smartComboRoutingParams) if order.smartComboRoutingParams else 0
-                flds.append(make_field( smartComboRoutingParamsCount))
+                flds.append(encodeField(smartComboRoutingParamsCount))
                 if smartComboRoutingParamsCount > 0:
                     for tagValue in order.smartComboRoutingParams:
-                        flds += [make_field(tagValue.tag),
-                            make_field(tagValue.value)]
+                        flds.append(TAG_VALUE_FIELDS.encode(tagValue))
+
+        # the rest is all Order() defaults for plain orders, spliced from a
+        # text rendered once per server version
+        if order.orderType != "PEG BENCH" and not contract.deltaNeutralContract \
+                and ORDER_TAIL_DEFAULTS.isDefault(order):
+            flds.append(self.defaultOrderTail(sv))
+        else:
+            flds += self.orderTailFields(sv, contract, order)
 
+        self.sendEncoded(flds)
+
+
+    def orderTailFields(self, sv, contract, order):
+        """placeOrder fields from the shares allocation on"""
+
+        flds = []
         ######################################################################
         # Send the shares allocation.
         #
@@ -1140,219 +1340,154 @@ class EClient(object):
         #      residual 80 to account 'U203' enter the following share allocation string:
         #          U101/20,U203/80
         #####################################################################
-        # send deprecated sharesAllocation field
-        flds += [make_field( ""),            # srv v9 and above
+        # send deprecated sharesAllocation field (srv v9 and above)
+        flds.append(staticFields(""))
+        flds.append(ORDER_FA_FIELDS.encode(order))
 
-            make_field( order.discretionaryAmt), # srv v10 and above
-            make_field( order.goodAfterTime), # srv v11 and above
-            make_field( order.goodTillDate), # srv v12 and above
+        if sv >= MIN_SERVER_VER_MODELS_SUPPORT:
+            flds.append(encodeField(order.modelCode))
 
-            make_field( order.faGroup),      # srv v13 and above
-            make_field( order.faMethod),     # srv v13 and above
-            make_field( order.faPercentage), # srv v13 and above
-            make_field( order.faProfile)]    # srv v13 and above
+        # institutional short saleslot data (srv v18 and above)
+        flds.append(ORDER_SHORT_SALE_FIELDS.encode(order))
+        if sv >= MIN_SERVER_VER_SSHORTX_OLD:
+            flds.append(encodeField(order.exemptCode))
 
-        if self.serverVersion() >= MIN_SERVER_VER_MODELS_SUPPORT:
-            flds.append(make_field( order.modelCode))
+        # srv v19 and above fields
+        flds.append(ORDER_MISC_FIELDS.encode(order))
 
-        # institutional short saleslot data (srv v18 and above)
-        flds += [make_field( order.shortSaleSlot),   # 0 for retail, 1 or 2 for institutions
-            make_field( order.designatedLocation)]   # populate only when shortSaleSlot = 2.
-        if self.serverVersion() >= MIN_SERVER_VER_SSHORTX_OLD:
-            flds.append(make_field( order.exemptCode))
+        if sv >= MIN_SERVER_VER_DELTA_NEUTRAL_CONID and order.deltaNeutralOrderType:
+            flds.append(ORDER_DELTA_NEUTRAL_CONID_FIELDS.encode(order))
 
-        # not needed anymore
-        #bool isVolOrder = (order.orderType.CompareNoCase("VOL") == 0)
+        if sv >= MIN_SERVER_VER_DELTA_NEUTRAL_OPEN_CLOSE and order.deltaNeutralOrderType:
+            flds.append(ORDER_DELTA_NEUTRAL_OPEN_CLOSE_FIELDS.encode(order))
 
-        # srv v19 and above fields
-        flds.append(make_field( order.ocaType))
-        #if( self.serverVersion() < 38) {
-        # will never happen
-        #      send( /* order.rthOnly */ false);
-        #}
-        flds += [make_field( order.rule80A),
-            make_field( order.settlingFirm),
-            make_field( order.allOrNone),
-            make_field_handle_empty( order.minQty),
-            make_field_handle_empty( order.percentOffset),
-            make_field( order.eTradeOnly),
-            make_field( order.firmQuoteOnly),
-            make_field_handle_empty( order.nbboPriceCap),
-            make_field( order.auctionStrategy), # AUCTION_MATCH, AUCTION_IMPROVEMENT, AUCTION_TRANSPARENT
-            make_field_handle_empty( order.startingPrice),
-            make_field_handle_empty( order.stockRefPrice),
-            make_field_handle_empty( order.delta),
-            make_field_handle_empty( order.stockRangeLower),
-            make_field_handle_empty( order.stockRangeUpper),
-
-            make_field( order.overridePercentageConstraints),    #srv v22 and above
-
-            # Volatility orders (srv v26 and above)
-            make_field_handle_empty( order.volatility),
-            make_field_handle_empty( order.volatilityType),
-            make_field( order.deltaNeutralOrderType),             # srv v28 and above
-            make_field_handle_empty( order.deltaNeutralAuxPrice)] # srv v28 and above
-
-        if self.serverVersion() >= MIN_SERVER_VER_DELTA_NEUTRAL_CONID and order.deltaNeutralOrderType:
-            flds += [make_field( order.deltaNeutralConId),
-                make_field( order.deltaNeutralSettlingFirm),
-                make_field( order.deltaNeutralClearingAccount),
-                make_field( order.deltaNeutralClearingIntent)]
-
-        if self.serverVersion() >= MIN_SERVER_VER_DELTA_NEUTRAL_OPEN_CLOSE and order.deltaNeutralOrderType:
-            flds += [make_field( order.deltaNeutralOpenClose),
-                make_field( order.deltaNeutralShortSale),
-                make_field( order.deltaNeutralShortSaleSlot),
-                make_field( order.deltaNeutralDesignatedLocation)]
-
-        flds += [make_field( order.continuousUpdate),
-            make_field_handle_empty( order.referencePriceType),
-            make_field_handle_empty( order.trailStopPrice)] # srv v30 and above
-
-        if self.serverVersion() >= MIN_SERVER_VER_TRAILING_PERCENT:
-            flds.append(make_field_handle_empty( order.trailingPercent))
+        # srv v30 and above
+        flds.append(ORDER_TRAIL_FIELDS.encode(order))
+
+        if sv >= MIN_SERVER_VER_TRAILING_PERCENT:
+            flds.append(encodeFieldHandleEmpty(order.trailingPercent))
 
         # SCALE orders
-        if self.serverVersion() >= MIN_SERVER_VER_SCALE_ORDERS2:
-            flds += [make_field_handle_empty( order.scaleInitLevelSize),
-                make_field_handle_empty( order.scaleSubsLevelSize)]
+        if sv >= MIN_SERVER_VER_SCALE_ORDERS2:
+            flds.append(ORDER_SCALE_LEVEL_FIELDS.encode(order))
         else:
                 # srv v35 and above)
-            flds += [make_field( ""), # for not supported scaleNumComponents
-                make_field_handle_empty(order.scaleInitLevelSize)] # for scaleComponentSize
+            flds += [staticFields(""), # for not supported scaleNumComponents
+                encodeFieldHandleEmpty(order.scaleInitLevelSize)] # for scaleComponentSize
 
-        flds.append(make_field_handle_empty( order.scalePriceIncrement))
+        flds.append(encodeFieldHandleEmpty(order.scalePriceIncrement))
 
-        if self.serverVersion() >= MIN_SERVER_VER_SCALE_ORDERS3 \
+        if sv >= MIN_SERVER_VER_SCALE_ORDERS3 \
             and order.scalePriceIncrement != UNSET_DOUBLE \
             and order.scalePriceIncrement > 0.0:
+            flds.append(ORDER_SCALE_PRICE_FIELDS.encode(order))
 
-            flds += [make_field_handle_empty( order.scalePriceAdjustValue),
-                make_field_handle_empty( order.scalePriceAdjustInterval),
-                make_field_handle_empty( order.scaleProfitOffset),
-                make_field( order.scaleAutoReset),
-                make_field_handle_empty( order.scaleInitPosition),
-                make_field_handle_empty( order.scaleInitFillQty),
-                make_field( order.scaleRandomPercent)]
-
-        if self.serverVersion() >= MIN_SERVER_VER_SCALE_TABLE:
-            flds += [make_field( order.scaleTable),
-                make_field( order.activeStartTime),
-                make_field( order.activeStopTime)]
+        if sv >= MIN_SERVER_VER_SCALE_TABLE:
+            flds.append(ORDER_SCALE_TABLE_FIELDS.encode(order))
 
         # HEDGE orders
-        if self.serverVersion() >= MIN_SERVER_VER_HEDGE_ORDERS:
-            flds.append(make_field( order.hedgeType))
+        if sv >= MIN_SERVER_VER_HEDGE_ORDERS:
+            flds.append(encodeField(order.hedgeType))
             if order.hedgeType:
-                flds.append(make_field( order.hedgeParam))
+                flds.append(encodeField(order.hedgeParam))
 
-        if self.serverVersion() >= MIN_SERVER_VER_OPT_OUT_SMART_ROUTING:
-            flds.append(make_field( order.optOutSmartRouting))
+        if sv >= MIN_SERVER_VER_OPT_OUT_SMART_ROUTING:
+            flds.append(encodeField(order.optOutSmartRouting))
 
-        if self.serverVersion() >= MIN_SERVER_VER_PTA_ORDERS:
-            flds += [make_field( order.clearingAccount),
-                make_field( order.clearingIntent)]
+        if sv >= MIN_SERVER_VER_PTA_ORDERS:
+            flds.append(ORDER_PTA_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_NOT_HELD:
-            flds.append(make_field( order.notHeld))
+        if sv >= MIN_SERVER_VER_NOT_HELD:
+            flds.append(encodeField(order.notHeld))
 
-        if self.serverVersion() >= MIN_SERVER_VER_DELTA_NEUTRAL:
+        if sv >= MIN_SERVER_VER_DELTA_NEUTRAL:
             if contract.deltaNeutralContract:
-                flds += [make_field(True),
-                    make_field(contract.deltaNeutralContract.conId),
-                    make_field(contract.deltaNeutralContract.delta),
-                    make_field(contract.deltaNeutralContract.price)]
+                flds += [staticFields(True),
+                    DELTA_NEUTRAL_CONTRACT_FIELDS.encode(contract.deltaNeutralContract)]
             else:
-                flds.append(make_field(False))
+                flds.append(staticFields(False))
 
-        if self.serverVersion() >= MIN_SERVER_VER_ALGO_ORDERS:
-            flds.append(make_field( order.algoStrategy))
+        if sv >= MIN_SERVER_VER_ALGO_ORDERS:
+            flds.append(encodeField(order.algoStrategy))
             if order.algoStrategy:
                 algoParamsCount = len(order.algoParams) if order.algoParams else 0
-                flds.append(make_field(algoParamsCount))
+                flds.append(encodeField(algoParamsCount))
                 if algoParamsCount > 0:
                     for algoParam in order.algoParams:
-                        flds += [make_field(algoParam.tag),
-                            make_field(algoParam.value)]
+                        flds.append(TAG_VALUE_FIELDS.encode(algoParam))
 
-        if self.serverVersion() >= MIN_SERVER_VER_ALGO_ID:
-            flds.append(make_field( order.algoId))
+        if sv >= MIN_SERVER_VER_ALGO_ID:
+            flds.append(encodeField(order.algoId))
 
-        flds.append(make_field( order.whatIf)) # srv v36 and above
+        flds.append(encodeField(order.whatIf)) # srv v36 and above
 
         # send miscOptions parameter
-        if self.serverVersion() >= MIN_SERVER_VER_LINKING:
+        if sv >= MIN_SERVER_VER_LINKING:
             miscOptionsStr = ""
             if order.orderMiscOptions:
                 for tagValue in order.orderMiscOptions:
                     miscOptionsStr += str(tagValue)
-            flds.append(make_field( miscOptionsStr))
+            flds.append(encodeField(miscOptionsStr))
 
-        if self.serverVersion() >= MIN_SERVER_VER_ORDER_SOLICITED:
-            flds.append(make_field(order.solicited))
+        if sv >= MIN_SERVER_VER_ORDER_SOLICITED:
+            flds.append(encodeField(order.solicited))
 
-        if self.serverVersion() >= MIN_SERVER_VER_RANDOMIZE_SIZE_AND_PRICE:
-            flds += [make_field(order.randomizeSize),
-                make_field(order.randomizePrice)]
+        if sv >= MIN_SERVER_VER_RANDOMIZE_SIZE_AND_PRICE:
+            flds.append(ORDER_RANDOMIZE_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_PEGGED_TO_BENCHMARK:
+        if sv >= MIN_SERVER_VER_PEGGED_TO_BENCHMARK:
             if order.orderType == "PEG BENCH":
-                flds += [make_field(order.referenceContractId),
-                    make_field(order.isPeggedChangeAmountDecrease),
-                    make_field(order.peggedChangeAmount),
-                    make_field(order.referenceChangeAmount),
-                    make_field(order.referenceExchangeId)]
+                flds.append(ORDER_PEG_BENCH_FIELDS.encode(order))
 
-            flds.append(make_field(len(order.conditions)))
+            flds.append(encodeField(len(order.conditions)))
 
             if len(order.conditions) > 0:
                 for cond in order.conditions:
-                    flds.append(make_field(cond.type()))
+                    flds.append(encodeField(cond.type()))
                     flds += cond.make_fields()
 
-                flds += [make_field(order.conditionsIgnoreRth),
-                    make_field(order.conditionsCancelOrder)]
+                flds.append(ORDER_CONDITIONS_FIELDS.encode(order))
 
-            flds += [make_field(order.adjustedOrderType),
-                make_field(order.triggerPrice),
-                make_field(order.lmtPriceOffset),
-                make_field(order.adjustedStopPrice),
-                make_field(order.adjustedStopLimitPrice),
-                make_field(order.adjustedTrailingAmount),
-                make_field(order.adjustableTrailingUnit)]
+            flds.append(ORDER_ADJUSTED_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_EXT_OPERATOR:
-            flds.append(make_field( order.extOperator))
+        if sv >= MIN_SERVER_VER_EXT_OPERATOR:
+            flds.append(encodeField(order.extOperator))
 
-        if self.serverVersion() >= MIN_SERVER_VER_SOFT_DOLLAR_TIER:
-            flds += [make_field(order.softDollarTier.name),
-                make_field(order.softDollarTier.val)]
+        if sv >= MIN_SERVER_VER_SOFT_DOLLAR_TIER:
+            flds.append(ORDER_SOFT_DOLLAR_TIER_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_CASH_QTY:
-            flds.append(make_field( order.cashQty))
+        if sv >= MIN_SERVER_VER_CASH_QTY:
+            flds.append(encodeField(order.cashQty))
 
-        if self.serverVersion() >= MIN_SERVER_VER_DECISION_MAKER:
-            flds.append(make_field( order.mifid2DecisionMaker))
-            flds.append(make_field( order.mifid2DecisionAlgo))
+        if sv >= MIN_SERVER_VER_DECISION_MAKER:
+            flds.append(ORDER_DECISION_MAKER_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_MIFID_EXECUTION:
-            flds.append(make_field( order.mifid2ExecutionTrader))
-            flds.append(make_field( order.mifid2ExecutionAlgo))
+        if sv >= MIN_SERVER_VER_MIFID_EXECUTION:
+            flds.append(ORDER_MIFID_EXECUTION_FIELDS.encode(order))
 
-        if self.serverVersion() >= MIN_SERVER_VER_AUTO_PRICE_FOR_HEDGE:
-            flds.append(make_field(order.dontUseAutoPriceForHedge))
+        if sv >= MIN_SERVER_VER_AUTO_PRICE_FOR_HEDGE:
+            flds.append(encodeField(order.dontUseAutoPriceForHedge))
 
-        if self.serverVersion() >= MIN_SERVER_VER_ORDER_CONTAINER:
-            flds.append(make_field(order.isOmsContainer))
+        if sv >= MIN_SERVER_VER_ORDER_CONTAINER:
+            flds.append(encodeField(order.isOmsContainer))
 
-        if self.serverVersion() >= MIN_SERVER_VER_D_PEG_ORDERS:
-            flds.append(make_field(order.discretionaryUpToLimitPrice))
+        if sv >= MIN_SERVER_VER_D_PEG_ORDERS:
+            flds.append(encodeField(order.discretionaryUpToLimitPrice))
 
-        if self.serverVersion() >= MIN_SERVER_VER_PRICE_MGMT_ALGO:
-            flds.append(make_field_handle_empty(UNSET_INTEGER if order.usePriceMgmtAlgo == None else 1 if order.usePriceMgmtAlgo else 0))
+        if sv >= MIN_SERVER_VER_PRICE_MGMT_ALGO:
+            flds.append(encodeFieldHandleEmpty(UNSET_INTEGER if order.usePriceMgmtAlgo == None else 1 if order.usePriceMgmtAlgo else 0))
+
+        return flds
 
-        msg = "".join(flds)
-        self.sendMsg(msg)
+
+    def defaultOrderTail(self, sv):
+        """orderTailFields of a default Order() as one text"""
+
+        tail = DEFAULT_ORDER_TAILS.get(sv)
+        if tail is None:
+            tail = "".join(self.orderTailFields(sv, Contract(), Order()))
+            DEFAULT_ORDER_TAILS[sv] = tail
+        return tail
 
 
     def cancelOrder(self, orderId:OrderId):
@@ -1369,11 +1504,8 @@ class EClient(object):
 
         VERSION = 1
 
-        msg = make_field(OUT.CANCEL_ORDER) \
-            + make_field(VERSION) \
-            + make_field(orderId)
-
-        self.sendMsg(msg)
+        self.sendEncoded([staticFields(OUT.CANCEL_ORDER, VERSION),
+            encodeField(orderId)])
 
 
     def reqOpenOrders(self):
@@ -2043,43 +2175,33 @@ class EClient(object):
         VERSION = 5
 
         # send req mkt depth msg
-        flds = []
-        flds += [make_field(OUT.REQ_MKT_DEPTH),
-            make_field(VERSION),
-            make_field(reqId)]
+        flds = [staticFields(OUT.REQ_MKT_DEPTH, VERSION),
+            encodeField(reqId)]
 
         # send contract fields
-        if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds += [make_field(contract.conId),]
-        flds += [make_field(contract.symbol),
-            make_field(contract.secType),
-            make_field(contract.lastTradeDateOrContractMonth),
-            make_field(contract.strike),
-            make_field(contract.right),
-            make_field(contract.multiplier), # srv v15 and above
-            make_field(contract.exchange),]
         if self.serverVersion() >= MIN_SERVER_VER_MKT_DEPTH_PRIM_EXCHANGE:
-            flds += [make_field(contract.primaryExchange),]
-        flds += [make_field(contract.currency),
-            make_field(contract.localSymbol)]
-        if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds += [make_field(contract.tradingClass),]
+            flds.append(REQUEST_CONTRACT_FIELDS.encode(contract))
+        else:
+            if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
+                flds.append(encodeField(contract.conId))
+            flds.append(MKT_DEPTH_CONTRACT_FIELDS.encode(contract))
+            flds.append(CONTRACT_LOCAL_FIELDS.encode(contract))
+            if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
+                flds.append(encodeField(contract.tradingClass))
 
-        flds += [make_field(numRows),] # srv v19 and above
+        flds.append(encodeField(numRows)) # srv v19 and above
 
         if self.serverVersion() >= MIN_SERVER_VER_SMART_DEPTH:
-            flds += [make_field(isSmartDepth),]
+            flds.append(encodeField(isSmartDepth))
 
         # send mktDepthOptions parameter
         if self.serverVersion() >= MIN_SERVER_VER_LINKING:
             #current doc says this part if for "internal use only" -> won't support it
             if mktDepthOptions:
                 raise NotImplementedError("not supported")
-            mktDataOptionsStr = ""
-            flds += [make_field(mktDataOptionsStr),]
+            flds.append(staticFields(""))
 
-        msg = "".join(flds)
-        self.sendMsg(msg)
+        self.sendEncoded(flds)
 
 
     def cancelMktDepth(self, reqId:TickerId, isSmartDepth:bool):
@@ -2714,29 +2836,17 @@ class EClient(object):
 
         VERSION = 3
 
-        flds = []
-        flds += [make_field(OUT.REQ_REAL_TIME_BARS),
-            make_field(VERSION),
-            make_field(reqId)]
+        flds = [staticFields(OUT.REQ_REAL_TIME_BARS, VERSION),
+            encodeField(reqId)]
 
         # send contract fields
         if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds += [make_field(contract.conId),]
-        flds += [make_field(contract.symbol),
-            make_field(contract.secType),
-            make_field(contract.lastTradeDateOrContractMonth),
-            make_field(contract.strike),
-            make_field(contract.right),
-            make_field(contract.multiplier),
-            make_field(contract.exchange),
-            make_field(contract.primaryExchange),
-            make_field(contract.currency),
-            make_field(contract.localSymbol)]
-        if self.serverVersion() >= MIN_SERVER_VER_TRADING_CLASS:
-            flds += [make_field(contract.tradingClass),]
-        flds += [make_field(barSize),
-            make_field(whatToShow),
-            make_field(useRTH)]
+            flds.append(REQUEST_CONTRACT_FIELDS.encode(contract))
+        else:
+            flds.append(CONTRACT_FIELDS.encode(contract))
+        flds += [encodeField(barSize),
+            encodeField(whatToShow),
+            encodeField(useRTH)]
 
         # send realTimeBarsOptions parameter
         if self.serverVersion() >= MIN_SERVER_VER_LINKING:
@@ -2744,10 +2854,9 @@ class EClient(object):
             if realTimeBarsOptions:
                 for tagValueOpt in realTimeBarsOptions:
                     realTimeBarsOptionsStr += str(tagValueOpt)
-            flds += [make_field(realTimeBarsOptionsStr),]
+            flds.append(encodeField(realTimeBarsOptionsStr))
 
-        msg = "".join(flds)
-        self.sendMsg(msg)
+        self.sendEncoded(flds)
 
 
     def cancelRealTimeBars(self, reqId:TickerId):
@@ -16,11 +16,13 @@ from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE
 
 logger = logging.getLogger(__name__)
 
+HEADER = struct.Struct("!I")
+
 
 def make_msg(text) -> bytes:
     """ adds the length prefix """
-    msg = struct.pack("!I%ds" % len(text), len(text), str.encode(text))
-    return msg
+    payload = str.encode(text)
+    return HEADER.pack(len(payload)) + payload
 
 
 def make_field(val) -> str:
@@ -73,3 +75,74 @@ def read_fields(buf:bytes) -> tuple:
 
 
 
+class MsgBuffer:
+    """ Receive buffer for length-prefixed messages.
+
+    Bytes are received straight into a preallocated bytearray (see freeView,
+    meant for socket.recv_into) and complete messages are sliced out of it
+    through a memoryview. Consumed bytes are only reclaimed when more room is
+    needed, so the pending tail is never copied once per message the way
+    read_msg does. The buffer doubles when a message does not fit. """
+
+    def __init__(self, size=65536):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0   # first byte not consumed yet
+        self.end = 0     # end of the received bytes
+
+    def __len__(self):
+        return self.end - self.start
+
+    def freeView(self, minFree=4096) -> memoryview:
+        """ view on the free space after the received bytes, with at least
+        minFree bytes. Call written() with the number of bytes filled in. """
+        if len(self.buf) - self.end < minFree:
+            self._makeRoom(minFree)
+        return self.view[self.end:]
+
+    def written(self, n):
+        self.end += n
+
+    def extend(self, data):
+        n = len(data)
+        self.freeView(n)[:n] = data
+        self.end += n
+
+    def _makeRoom(self, minFree):
+        pending = self.end - self.start
+        if pending + minFree > len(self.buf):
+            size = len(self.buf)
+            while pending + minFree > size:
+                size *= 2
+            buf = bytearray(size)
+            buf[:pending] = self.view[self.start:self.end]
+            self.buf = buf
+            self.view = memoryview(buf)
+        elif pending:
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = pending
+
+    def popMsg(self):
+        """ next complete message payload as bytes, or None if more bytes
+        are needed """
+        start = self.start
+        if self.end - start < 4:
+            return None
+        size = HEADER.unpack_from(self.buf, start)[0]
+        msgEnd = start + 4 + size
+        if msgEnd > self.end:
+            return None
+        msg = bytes(self.view[start + 4:msgEnd])
+        if msgEnd == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = msgEnd
+        return msg
+
+    def msgs(self):
+        """ iterates over the complete messages received so far """
+        msg = self.popMsg()
+        while msg is not None:
+            yield msg
+            msg = self.popMsg()
@@ -7,12 +7,31 @@ Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is su
 """
 Just a thin wrapper around a socket.
 It allows us to keep some other info along with it.
+recvTime is the time.perf_counter_ns() of the last recvMsgInto that got data.
+
+Outgoing messages go through an outbox: sendMsg queues them and flush writes
+everything queued with one sendmsg (scatter-gather, send of the joined
+buffers where sendmsg is missing), resuming after partial sends so a message
+is never truncated. By default sendMsg flushes right away; with flushSoon
+set, e.g. to schedule flush on an event loop, it only queues and asks for a
+flush once, so the requests sent by one callback (resubscribing on
+reconnect, an order ladder, cancels) share a syscall. Nagle is disabled
+(noDelay), the coalescing is done here.
+
+A scheduled flush has no caller to raise to: a send that fails disconnects
+and is reported to wrapper.error, one that times out (TWS not reading) is
+retried retryDelay seconds later with flushLater, and an outbox growing past
+maxOutboxBytes disconnects as well.
 """
 
 
+import collections
+import itertools
+import os
 import socket
 import threading
 import logging
+import time
 
 from ibapi.common import * # @UnusedWildImport
 from ibapi.errors import * # @UnusedWildImport
@@ -22,6 +41,10 @@ from ibapi.errors import * # @UnusedWildImport
 
 logger = logging.getLogger(__name__)
 
+# max buffers per sendmsg
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
 
 class Connection:
     def __init__(self, host, port):
@@ -30,6 +53,21 @@ class Connection:
         self.socket = None
         self.wrapper = None
         self.lock = threading.Lock()
+        self.recvTime = 0
+        self.noDelay = True
+        # callables scheduling a flush(), flushSoon() right after the current
+        # callback, flushLater(delay) in delay seconds; None to flush in sendMsg
+        self.flushSoon = None
+        self.flushLater = None
+        self.flushPending = False
+        self.retryDelay = 1.0
+        self.maxOutboxBytes = 16 * 1024 * 1024
+        self.outbox = collections.deque()
+        self.queuedBytes = 0
+        self.maxQueuedBytes = 0
+        self.sentMsgs = 0
+        self.sentBytes = 0
+        self.sendCalls = 0
 
 
     def connect(self):
@@ -46,6 +84,8 @@ class Connection:
             if self.wrapper:
                 self.wrapper.error(NO_VALID_ID, CONNECT_FAIL.code(), CONNECT_FAIL.msg())
 
+        if self.noDelay:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.socket.settimeout(1)   #non-blocking
 
 
@@ -56,6 +96,8 @@ class Connection:
                 logger.debug("disconnecting")
                 self.socket.close()
                 self.socket = None
+                self.outbox.clear()
+                self.queuedBytes = 0
                 logger.debug("disconnected")
                 if self.wrapper:
                     self.wrapper.connectionClosed()
@@ -68,27 +110,89 @@ class Connection:
 
 
     def sendMsg(self, msg):
-
-        logger.debug("acquiring lock")
-        self.lock.acquire()
-        logger.debug("acquired lock")
-        if not self.isConnected():
-            logger.debug("sendMsg attempted while not connected, releasing lock")
-            self.lock.release()
-            return 0
+        """Queues msg and flushes, or has it flushed soon with flushSoon.
+        Returns the number of bytes sent (queued with flushSoon), 0 if not
+        connected."""
+        with self.lock:
+            if not self.isConnected():
+                logger.debug("sendMsg attempted while not connected")
+                return 0
+            full = self.queuedBytes + len(msg) > self.maxOutboxBytes
+            if not full:
+                self.outbox.append(msg)
+                self.queuedBytes += len(msg)
+                self.sentMsgs += 1
+                if self.queuedBytes > self.maxQueuedBytes:
+                    self.maxQueuedBytes = self.queuedBytes
+                if self.flushSoon is None:
+                    return self._flush()
+                if not self.flushPending:
+                    self.flushPending = True
+                    self.flushSoon()
+                return len(msg)
+        self.sendFailed(f"{self.queuedBytes} bytes queued, TWS is not reading")
+        return 0
+
+
+    def flush(self):
+        """Sends everything queued, returns the number of bytes sent. A
+        failed send disconnects."""
+        with self.lock:
+            self.flushPending = False
+            try:
+                return self._flush()
+            except OSError as e:
+                error = e
+        self.sendFailed(error)
+        return 0
+
+
+    def sendFailed(self, reason):
+        logger.error("send failed, %s, disconnecting", reason)
+        self.disconnect()
+        if self.wrapper:
+            self.wrapper.error(NO_VALID_ID, SOCKET_EXCEPTION.code(), "Exception caught while writing socket - %s" % reason)
+
+
+    def _flush(self):
+        # with the lock held
+        sent = 0
         try:
-            nSent = self.socket.send(msg)
-        except socket.error:
-            logger.debug("exception from sendMsg %s", sys.exc_info())
-            raise
+            while self.outbox and self.socket is not None:
+                if HAS_SENDMSG:
+                    n = self.socket.sendmsg(itertools.islice(self.outbox, IOV_MAX))
+                else:
+                    n = self.socket.send(b"".join(self.outbox))
+                self.sendCalls += 1
+                sent += n
+                self.queuedBytes -= n
+                # drop what was sent, keep the rest of a partially sent buffer
+                while n:
+                    head = self.outbox[0]
+                    if len(head) <= n:
+                        n -= len(head)
+                        self.outbox.popleft()
+                    else:
+                        self.outbox[0] = memoryview(head)[n:]
+                        n = 0
+        except socket.timeout:
+            # the send buffer stayed full, what is left goes first next time
+            logger.warning("send timed out, %d bytes still queued", self.queuedBytes)
+            if self.flushSoon is None:
+                raise
+            if not self.flushPending:
+                self.flushPending = True
+                if self.flushLater is not None:
+                    self.flushLater(self.retryDelay)
+                else:
+                    self.flushSoon()
         finally:
-            logger.debug("releasing lock")
-            self.lock.release()
-            logger.debug("release lock")
+            self.sentBytes += sent
+        return sent
 
-        logger.debug("sendMsg: sent: %d", nSent)
 
-        return nSent
+    def pendingBytes(self):
+        return self.queuedBytes
 
 
     def recvMsg(self):
@@ -111,9 +215,38 @@ class Connection:
         return buf
 
 
+    def recvMsgInto(self, msgBuf):
+        """Receives whatever is available straight into msgBuf (a
+        comm.MsgBuffer). Returns the number of bytes received, 0 on timeout
+        or when the connection was closed."""
+        sock = self.socket
+        if sock is None:
+            logger.debug("recvMsgInto attempted while not connected")
+            return 0
+        try:
+            n = sock.recv_into(msgBuf.freeView())
+            # receiving 0 bytes outside a timeout means the connection is either
+            # closed or broken
+            if n == 0:
+                logger.debug("socket either closed or broken, disconnecting")
+                self.disconnect()
+            else:
+                self.recvTime = time.perf_counter_ns()
+                msgBuf.written(n)
+        except socket.timeout:
+            n = 0
+        except OSError:
+            if self.socket is not None:
+                raise
+            logger.debug("socket closed by disconnect while receiving")
+            n = 0
+
+        return n
+
+
     def _recvAllMsg(self):
         cont = True
-        allbuf = b""
+        allbuf = bytearray()
 
         while cont and self.socket is not None:
             buf = self.socket.recv(4096)
@@ -123,5 +256,5 @@ class Connection:
             if len(buf) < 4096:
                 cont = False
 
-        return allbuf
+        return bytes(allbuf)
 
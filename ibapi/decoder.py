@@ -40,14 +40,43 @@ class HandleInfo(Object):
         return s
 
 
+def decodeStr(field):
+    try:
+        return field.decode('UTF-8')
+    except UnicodeDecodeError:
+        return field.decode('latin-1')
+
+
+SIZE_TICK_TYPES = {
+    TickTypeEnum.BID: TickTypeEnum.BID_SIZE,
+    TickTypeEnum.ASK: TickTypeEnum.ASK_SIZE,
+    TickTypeEnum.LAST: TickTypeEnum.LAST_SIZE,
+    TickTypeEnum.DELAYED_BID: TickTypeEnum.DELAYED_BID_SIZE,
+    TickTypeEnum.DELAYED_ASK: TickTypeEnum.DELAYED_ASK_SIZE,
+    TickTypeEnum.DELAYED_LAST: TickTypeEnum.DELAYED_LAST_SIZE,
+}
+
+
 class Decoder(Object):
     def __init__(self, wrapper, serverVersion):
         self.wrapper = wrapper
-        self.serverVersion = serverVersion
+        self.plans = {}
         self.discoverParams()
+        self.serverVersion = serverVersion
         #self.printParams()
 
 
+    @property
+    def serverVersion(self):
+        return self.serverVersion_
+
+    @serverVersion.setter
+    def serverVersion(self, serverVersion):
+        self.serverVersion_ = serverVersion
+        self.orderDecoder = OrderDecoder(serverVersion)
+        self.compilePlans()
+
+
     def processTickPriceMsg(self, fields):
         next(fields)
         decode(int, fields)
@@ -127,89 +156,13 @@ class Decoder(Object):
     def processOpenOrder(self, fields):
 
         next(fields)
-        
-        order = Order()
-        contract = Contract()
-        orderState = OrderState()
 
         if self.serverVersion < MIN_SERVER_VER_ORDER_CONTAINER:
             version = decode(int, fields)
         else:
             version = self.serverVersion
 
-        
-        OrderDecoder.__init__(self, contract, order, orderState, version, self.serverVersion)
-
-        # read orderId
-        OrderDecoder.decodeOrderId(self, fields)
-
-        # read contract fields
-        OrderDecoder.decodeContractFields(self, fields)
-
-        # read order fields
-        OrderDecoder.decodeAction(self, fields)
-        OrderDecoder.decodeTotalQuantity(self, fields)
-        OrderDecoder.decodeOrderType(self, fields)
-        OrderDecoder.decodeLmtPrice(self, fields)
-        OrderDecoder.decodeAuxPrice(self, fields)
-        OrderDecoder.decodeTIF(self, fields)
-        OrderDecoder.decodeOcaGroup(self, fields)
-        OrderDecoder.decodeAccount(self, fields)
-        OrderDecoder.decodeOpenClose(self, fields)
-        OrderDecoder.decodeOrigin(self, fields)
-        OrderDecoder.decodeOrderRef(self, fields)
-        OrderDecoder.decodeClientId(self, fields)
-        OrderDecoder.decodePermId(self, fields)
-        OrderDecoder.decodeOutsideRth(self, fields)
-        OrderDecoder.decodeHidden(self, fields)
-        OrderDecoder.decodeDiscretionaryAmt(self, fields)
-        OrderDecoder.decodeGoodAfterTime(self, fields)
-        OrderDecoder.skipSharesAllocation(self, fields)
-        OrderDecoder.decodeFAParams(self, fields)
-        OrderDecoder.decodeModelCode(self, fields)
-        OrderDecoder.decodeGoodTillDate(self, fields)
-        OrderDecoder.decodeRule80A(self, fields)
-        OrderDecoder.decodePercentOffset(self, fields)
-        OrderDecoder.decodeSettlingFirm(self, fields)
-        OrderDecoder.decodeShortSaleParams(self, fields)
-        OrderDecoder.decodeAuctionStrategy(self, fields)
-        OrderDecoder.decodeBoxOrderParams(self, fields)
-        OrderDecoder.decodePegToStkOrVolOrderParams(self, fields)
-        OrderDecoder.decodeDisplaySize(self, fields)
-        OrderDecoder.decodeBlockOrder(self, fields)
-        OrderDecoder.decodeSweepToFill(self, fields)
-        OrderDecoder.decodeAllOrNone(self, fields)
-        OrderDecoder.decodeMinQty(self, fields)
-        OrderDecoder.decodeOcaType(self, fields)
-        OrderDecoder.decodeETradeOnly(self, fields)
-        OrderDecoder.decodeFirmQuoteOnly(self, fields)
-        OrderDecoder.decodeNbboPriceCap(self, fields)
-        OrderDecoder.decodeParentId(self, fields)
-        OrderDecoder.decodeTriggerMethod(self, fields)
-        OrderDecoder.decodeVolOrderParams(self, fields, True)
-        OrderDecoder.decodeTrailParams(self, fields)
-        OrderDecoder.decodeBasisPoints(self, fields)
-        OrderDecoder.decodeComboLegs(self, fields)
-        OrderDecoder.decodeSmartComboRoutingParams(self, fields)
-        OrderDecoder.decodeScaleOrderParams(self, fields)
-        OrderDecoder.decodeHedgeParams(self, fields)
-        OrderDecoder.decodeOptOutSmartRouting(self, fields)
-        OrderDecoder.decodeClearingParams(self, fields)
-        OrderDecoder.decodeNotHeld(self, fields)
-        OrderDecoder.decodeDeltaNeutral(self, fields)
-        OrderDecoder.decodeAlgoParams(self, fields)
-        OrderDecoder.decodeSolicited(self, fields)
-        OrderDecoder.decodeWhatIfInfoAndCommission(self, fields)
-        OrderDecoder.decodeVolRandomizeFlags(self, fields)
-        OrderDecoder.decodePegToBenchParams(self, fields)
-        OrderDecoder.decodeConditions(self, fields)
-        OrderDecoder.decodeAdjustedOrderParams(self, fields)
-        OrderDecoder.decodeSoftDollarTier(self, fields)
-        OrderDecoder.decodeCashQty(self, fields)
-        OrderDecoder.decodeDontUseAutoPriceForHedge(self, fields)
-        OrderDecoder.decodeIsOmsContainers(self, fields)
-        OrderDecoder.decodeDiscretionaryUpToLimitPrice(self, fields)
-        OrderDecoder.decodeUsePriceMgmtAlgo(self, fields)
+        (contract, order, orderState) = self.orderDecoder.decodeOpenOrder(fields, version)
 
         self.wrapper.openOrder(order.orderId, contract, order, orderState)
 
@@ -1099,77 +1052,8 @@ class Decoder(Object):
 
     def processCompletedOrderMsg(self, fields):
         next(fields)
-        
-        order = Order()
-        contract = Contract()
-        orderState = OrderState()
-
-        OrderDecoder.__init__(self, contract, order, orderState, UNSET_INTEGER, self.serverVersion)
 
-        # read contract fields
-        OrderDecoder.decodeContractFields(self, fields)
-
-        # read order fields
-        OrderDecoder.decodeAction(self, fields)
-        OrderDecoder.decodeTotalQuantity(self, fields)
-        OrderDecoder.decodeOrderType(self, fields)
-        OrderDecoder.decodeLmtPrice(self, fields)
-        OrderDecoder.decodeAuxPrice(self, fields)
-        OrderDecoder.decodeTIF(self, fields)
-        OrderDecoder.decodeOcaGroup(self, fields)
-        OrderDecoder.decodeAccount(self, fields)
-        OrderDecoder.decodeOpenClose(self, fields)
-        OrderDecoder.decodeOrigin(self, fields)
-        OrderDecoder.decodeOrderRef(self, fields)
-        OrderDecoder.decodePermId(self, fields)
-        OrderDecoder.decodeOutsideRth(self, fields)
-        OrderDecoder.decodeHidden(self, fields)
-        OrderDecoder.decodeDiscretionaryAmt(self, fields)
-        OrderDecoder.decodeGoodAfterTime(self, fields)
-        OrderDecoder.decodeFAParams(self, fields)
-        OrderDecoder.decodeModelCode(self, fields)
-        OrderDecoder.decodeGoodTillDate(self, fields)
-        OrderDecoder.decodeRule80A(self, fields)
-        OrderDecoder.decodePercentOffset(self, fields)
-        OrderDecoder.decodeSettlingFirm(self, fields)
-        OrderDecoder.decodeShortSaleParams(self, fields)
-        OrderDecoder.decodeBoxOrderParams(self, fields)
-        OrderDecoder.decodePegToStkOrVolOrderParams(self, fields)
-        OrderDecoder.decodeDisplaySize(self, fields)
-        OrderDecoder.decodeSweepToFill(self, fields)
-        OrderDecoder.decodeAllOrNone(self, fields)
-        OrderDecoder.decodeMinQty(self, fields)
-        OrderDecoder.decodeOcaType(self, fields)
-        OrderDecoder.decodeTriggerMethod(self, fields)
-        OrderDecoder.decodeVolOrderParams(self, fields, False)
-        OrderDecoder.decodeTrailParams(self, fields)
-        OrderDecoder.decodeComboLegs(self, fields)
-        OrderDecoder.decodeSmartComboRoutingParams(self, fields)
-        OrderDecoder.decodeScaleOrderParams(self, fields)
-        OrderDecoder.decodeHedgeParams(self, fields)
-        OrderDecoder.decodeClearingParams(self, fields)
-        OrderDecoder.decodeNotHeld(self, fields)
-        OrderDecoder.decodeDeltaNeutral(self, fields)
-        OrderDecoder.decodeAlgoParams(self, fields)
-        OrderDecoder.decodeSolicited(self, fields)
-        OrderDecoder.decodeOrderStatus(self, fields)
-        OrderDecoder.decodeVolRandomizeFlags(self, fields)
-        OrderDecoder.decodePegToBenchParams(self, fields)
-        OrderDecoder.decodeConditions(self, fields)
-        OrderDecoder.decodeStopPriceAndLmtPriceOffset(self, fields)
-        OrderDecoder.decodeCashQty(self, fields)
-        OrderDecoder.decodeDontUseAutoPriceForHedge(self, fields)
-        OrderDecoder.decodeIsOmsContainers(self, fields)
-        OrderDecoder.decodeAutoCancelDate(self, fields)
-        OrderDecoder.decodeFilledQuantity(self, fields)
-        OrderDecoder.decodeRefFuturesConId(self, fields)
-        OrderDecoder.decodeAutoCancelParent(self, fields)
-        OrderDecoder.decodeShareholder(self, fields)
-        OrderDecoder.decodeImbalanceOnly(self, fields)
-        OrderDecoder.decodeRouteMarketableToBbo(self, fields)
-        OrderDecoder.decodeParentPermId(self, fields)
-        OrderDecoder.decodeCompletedTime(self, fields)
-        OrderDecoder.decodeCompletedStatus(self, fields)
+        (contract, order, orderState) = self.orderDecoder.decodeCompletedOrder(fields)
 
         self.wrapper.completedOrder(contract, order, orderState)
 
@@ -1198,7 +1082,13 @@ class Decoder(Object):
 
     ######################################################################
 
+    paramsDiscovered = False
+
     def discoverParams(self):
+        # msgId2handleInfo is shared by all decoders, only do this once
+        if Decoder.paramsDiscovered:
+            return
+
         meth2handleInfo = {}
         for handleInfo in self.msgId2handleInfo.values():
             meth2handleInfo[handleInfo.wrapperMeth] = handleInfo
@@ -1214,6 +1104,8 @@ class Decoder(Object):
             #for (pname, param) in sig.parameters.items():
             #     logger.debug("\tparam %s %s %s", pname, param.name, param.annotation)
 
+        Decoder.paramsDiscovered = True
+
 
     def printParams(self):
         for (_, handleInfo) in self.msgId2handleInfo.items():
@@ -1266,24 +1158,122 @@ class Decoder(Object):
         sMsgId = fields[0]
         nMsgId = int(sMsgId)
 
-        handleInfo = self.msgId2handleInfo.get(nMsgId, None)
+        try:
+            plan = self.plans.get(nMsgId, None)
+            if plan is not None:
+                plan(fields)
+                return
 
-        if handleInfo is None:
-            logger.debug("%s: no handleInfo", fields)
-            return
+            handleInfo = self.msgId2handleInfo.get(nMsgId, None)
+
+            if handleInfo is None:
+                logger.debug("%s: no handleInfo", fields)
+                return
 
-        try:
             if handleInfo.wrapperMeth is not None:
                 logger.debug("In interpret(), handleInfo: %s", handleInfo)
                 self.interpretWithSignature(fields, handleInfo)
             elif handleInfo.processMeth is not None:
                 handleInfo.processMeth(self, iter(fields))
         except BadMessage:
-                theBadMsg = ",".join(fields)
+                theBadMsg = ",".join(decodeStr(field) for field in fields)
                 self.wrapper.error(NO_VALID_ID, BAD_MESSAGE.code(),
                                    BAD_MESSAGE.msg() + theBadMsg)
                 raise
 
+    ######################################################################
+
+    def compilePlans(self):
+        """Builds, for the current wrapper and server version, a decode plan
+        per message id: a callable taking the fields and calling the wrapper
+        directly, without going through inspect signatures, getattr or
+        per field logging. Messages without a plan go through
+        interpretWithSignature / processMeth as before."""
+
+        plans = {}
+        for (msgId, handleInfo) in self.msgId2handleInfo.items():
+            if handleInfo.wrapperMeth is not None and handleInfo.wrapperParams is not None:
+                plans[msgId] = self.compileWrapperPlan(handleInfo)
+
+        if self.serverVersion is not None:
+            plans[IN.TICK_PRICE] = self.compileTickPricePlan()
+            plans[IN.REAL_TIME_BARS] = self.compileRealTimeBarPlan()
+
+        self.plans = plans
+
+
+    def compileWrapperPlan(self, handleInfo):
+        """Same decoding as interpretWithSignature, with the converters and
+        the bound wrapper method resolved once."""
+
+        converters = tuple(param.annotation if param.annotation in (int, float) else decodeStr
+                           for (pname, param) in handleInfo.wrapperParams.items()
+                           if pname != "self")
+        method = getattr(self.wrapper, handleInfo.wrapperMeth.__name__)
+        nFields = len(converters) + 2 #msgId and versionId
+
+        def plan(fields):
+            if len(fields) != nFields:
+                logger.error("diff len fields and params %d %d for fields: %s and handleInfo: %s",
+                             len(fields), nFields - 1, fields, handleInfo)
+                return
+            method(*[conv(field) for (conv, field) in zip(converters, fields[2:])])
+
+        return plan
+
+
+    def compileTickPricePlan(self):
+        """processTickPriceMsg for the current server version."""
+
+        tickPrice = self.wrapper.tickPrice
+        tickSize = self.wrapper.tickSize
+        pastLimit = self.serverVersion >= MIN_SERVER_VER_PAST_LIMIT
+        preOpen = self.serverVersion >= MIN_SERVER_VER_PRE_OPEN_BID_ASK
+
+        def plan(fields):
+            if len(fields) < 7:
+                raise BadMessage("no more fields")
+            (_, _, reqId, tickType, price, size, attrMask) = fields[:7]
+            reqId = int(reqId or 0)
+            tickType = int(tickType or 0)
+            price = float(price or 0)
+            size = int(size or 0) # ver 2 field
+            attrMask = int(attrMask or 0) # ver 3 field
+
+            attrib = TickAttrib()
+            if pastLimit:
+                attrib.canAutoExecute = attrMask & 1 != 0
+                attrib.pastLimit = attrMask & 2 != 0
+                if preOpen:
+                    attrib.preOpen = attrMask & 4 != 0
+            else:
+                attrib.canAutoExecute = attrMask == 1
+
+            tickPrice(reqId, tickType, price, attrib)
+
+            # process ver 2 fields
+            sizeTickType = SIZE_TICK_TYPES.get(tickType, None)
+            if sizeTickType is not None:
+                tickSize(reqId, sizeTickType, size)
+
+        return plan
+
+
+    def compileRealTimeBarPlan(self):
+        """processRealTimeBarMsg for the current server version."""
+
+        realtimeBar = self.wrapper.realtimeBar
+
+        def plan(fields):
+            if len(fields) < 11:
+                raise BadMessage("no more fields")
+            (_, _, reqId, time, open_, high, low, close, volume, wap, count) = fields[:11]
+            realtimeBar(int(reqId or 0), int(time or 0), float(open_ or 0),
+                float(high or 0), float(low or 0), float(close or 0),
+                int(volume or 0), float(wap or 0), int(count or 0))
+
+        return plan
+
 
     msgId2handleInfo = {
         IN.TICK_PRICE: HandleInfo(proc=processTickPriceMsg),
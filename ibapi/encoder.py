@@ -0,0 +1,130 @@
+"""
+Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is subject to the terms
+ and conditions of the IB API Non-Commercial License or the IB API Commercial License, as applicable.
+"""
+
+
+"""
+Request encoding for the hot requests of EClient (placeOrder, reqMktData,
+cancelOrder...), producing the same bytes as comm.make_field/make_msg.
+
+A request is a list of text pieces, each one or more NULL terminated
+fields, joined and utf-8 encoded once by makeMsg behind a precompiled
+struct header:
+ - encodeField/encodeFieldHandleEmpty dispatch on the exact type instead of
+   going through str() for everything, and return the text of UNSET_DOUBLE
+   (float repr of DBL_MAX costs microseconds, orders carry dozens) from a
+   constant,
+ - staticFields caches the text of constant runs (message id, version...),
+ - FieldRun reads a run of attributes of one object with a single
+   operator.attrgetter call, can cache its text (contract blocks) and tell
+   when all are defaults (the placeOrder tail of plain orders).
+"""
+
+
+import functools
+import operator
+import struct
+
+from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE
+
+
+HEADER = struct.Struct("!I")
+UNSET_DOUBLE_TEXT = str(UNSET_DOUBLE) + "\0"
+
+
+def encodeField(val) -> str:
+    """ make_field """
+    t = type(val)
+    if t is str:
+        return val + "\0"
+    if t is int:
+        return str(val) + "\0"
+    if t is float:
+        if val == UNSET_DOUBLE:
+            return UNSET_DOUBLE_TEXT
+        return repr(val) + "\0"
+    if t is bool:
+        return "1\0" if val else "0\0"
+    if val is None:
+        raise ValueError("Cannot send None to TWS")
+    return str(val) + "\0"
+
+
+def encodeFieldHandleEmpty(val) -> str:
+    """ make_field_handle_empty """
+    if val is None:
+        raise ValueError("Cannot send None to TWS")
+    if UNSET_INTEGER == val or UNSET_DOUBLE == val:
+        return "\0"
+    return encodeField(val)
+
+
+@functools.lru_cache(maxsize=None)
+def staticFields(*vals) -> str:
+    """ the fields of constant values, encoded once """
+    return "".join(encodeField(val) for val in vals)
+
+
+class FieldRun:
+    """ A run of fields read from the attributes of one object. A name
+    ending with '?' is encoded as make_field_handle_empty.
+
+    With cacheSize, the text is cached by the tuple of values read, along
+    with their types (1 == 1.0 == True but they are encoded differently).
+    Mutating an object changes its values hence its key, nothing needs to
+    be invalidated, and equal objects (a Contract built per request) share
+    an entry. Meant for contracts, whose fields are hashable scalars; the
+    cache is emptied when full.
+
+    With defaults (a default instance, e.g. Order()), isDefault tells with
+    one tuple comparison whether all the values read are the defaults, of
+    the same types. """
+
+    def __init__(self, *names, cacheSize=0, defaults=None):
+        self.names = tuple(name.rstrip("?") for name in names)
+        self.encoders = tuple(encodeFieldHandleEmpty if name.endswith("?")
+                              else encodeField for name in names)
+        self.handleEmpty = encodeFieldHandleEmpty in self.encoders
+        getter = operator.attrgetter(*self.names)
+        # attrgetter of a single name returns the value, not a tuple
+        self.get = getter if len(names) > 1 else lambda obj: (getter(obj),)
+        self.cacheSize = cacheSize
+        self.cache = {}
+        self.defaultVals = None
+        if defaults is not None:
+            self.defaultVals = self.get(defaults)
+            self.defaultTypes = tuple(map(type, self.defaultVals))
+
+    def encodeValues(self, vals) -> str:
+        if not self.handleEmpty:
+            return "".join(map(encodeField, vals))
+        return "".join([enc(val) for (enc, val) in zip(self.encoders, vals)])
+
+    def isDefault(self, obj) -> bool:
+        vals = self.get(obj)
+        return vals == self.defaultVals and tuple(map(type, vals)) == self.defaultTypes
+
+    def encode(self, obj) -> str:
+        vals = self.get(obj)
+        if not self.cacheSize:
+            return self.encodeValues(vals)
+        types = tuple(map(type, vals))
+        try:
+            entry = self.cache.get(vals)
+        except TypeError:
+            # an unhashable value
+            return self.encodeValues(vals)
+        if entry is not None and entry[0] == types:
+            return entry[1]
+        text = self.encodeValues(vals)
+        if len(self.cache) >= self.cacheSize:
+            self.cache.clear()
+        self.cache[vals] = (types, text)
+        return text
+
+
+def makeMsg(pieces) -> bytes:
+    """ joins the encoded pieces and adds the length prefix """
+    payload = "".join(pieces).encode()
+    return HEADER.pack(len(payload)) + payload
@@ -7,22 +7,214 @@ from ibapi import order_condition
 from ibapi.object_implem import Object
 from ibapi.utils import * # @UnusedWildImport
 from ibapi.server_versions import * # @UnusedWildImport
-from ibapi.order import OrderComboLeg
-from ibapi.contract import ComboLeg
+from ibapi.order import Order, OrderComboLeg
+from ibapi.order_state import OrderState
+from ibapi.contract import Contract, ComboLeg
 from ibapi.tag_value import TagValue
 from ibapi.wrapper import DeltaNeutralContract
 from ibapi.softdollartier import SoftDollarTier
 
 logger = logging.getLogger(__name__)
 
+# attribute values of default constructed objects, copied into new instances
+# instead of running the (long) constructors for every order message
+ORDER_DEFAULTS = dict(Order().__dict__)
+CONTRACT_DEFAULTS = dict(Contract().__dict__)
+ORDER_STATE_DEFAULTS = dict(OrderState().__dict__)
+
+
+def newOrder():
+    order = Order.__new__(Order)
+    order.__dict__.update(ORDER_DEFAULTS)
+    # don't share the mutable defaults between orders
+    order.softDollarTier = SoftDollarTier("", "", "")
+    order.conditions = []
+    return order
+
+
+def newContract():
+    contract = Contract.__new__(Contract)
+    contract.__dict__.update(CONTRACT_DEFAULTS)
+    return contract
+
+
+def newOrderState():
+    orderState = OrderState.__new__(OrderState)
+    orderState.__dict__.update(ORDER_STATE_DEFAULTS)
+    return orderState
+
+
 class OrderDecoder(Object):
-    def __init__(self, contract, order, orderState, version, serverVersion):
-        self.contract = contract
-        self.order = order
-        self.orderState = orderState
-        self.version = version
+    """Decodes the OPEN_ORDER and COMPLETED_ORDER payloads.
+    One instance per server version is kept by the Decoder and reused for
+    every order message; contract/order/orderState only point to the
+    objects of the message being decoded."""
+
+    def __init__(self, serverVersion):
+        self.contract = None
+        self.order = None
+        self.orderState = None
+        self.version = serverVersion
         self.serverVersion = serverVersion
-        self.discoverParams()
+
+    def start(self, version):
+        self.contract = newContract()
+        self.order = newOrder()
+        self.orderState = newOrderState()
+        self.version = version
+
+    def finish(self):
+        decoded = (self.contract, self.order, self.orderState)
+        self.contract = None
+        self.order = None
+        self.orderState = None
+        return decoded
+
+    def decodeOpenOrder(self, fields, version):
+        self.start(version)
+
+        # read orderId
+        self.decodeOrderId(fields)
+
+        # read contract fields
+        self.decodeContractFields(fields)
+
+        # read order fields
+        self.decodeAction(fields)
+        self.decodeTotalQuantity(fields)
+        self.decodeOrderType(fields)
+        self.decodeLmtPrice(fields)
+        self.decodeAuxPrice(fields)
+        self.decodeTIF(fields)
+        self.decodeOcaGroup(fields)
+        self.decodeAccount(fields)
+        self.decodeOpenClose(fields)
+        self.decodeOrigin(fields)
+        self.decodeOrderRef(fields)
+        self.decodeClientId(fields)
+        self.decodePermId(fields)
+        self.decodeOutsideRth(fields)
+        self.decodeHidden(fields)
+        self.decodeDiscretionaryAmt(fields)
+        self.decodeGoodAfterTime(fields)
+        self.skipSharesAllocation(fields)
+        self.decodeFAParams(fields)
+        self.decodeModelCode(fields)
+        self.decodeGoodTillDate(fields)
+        self.decodeRule80A(fields)
+        self.decodePercentOffset(fields)
+        self.decodeSettlingFirm(fields)
+        self.decodeShortSaleParams(fields)
+        self.decodeAuctionStrategy(fields)
+        self.decodeBoxOrderParams(fields)
+        self.decodePegToStkOrVolOrderParams(fields)
+        self.decodeDisplaySize(fields)
+        self.decodeBlockOrder(fields)
+        self.decodeSweepToFill(fields)
+        self.decodeAllOrNone(fields)
+        self.decodeMinQty(fields)
+        self.decodeOcaType(fields)
+        self.decodeETradeOnly(fields)
+        self.decodeFirmQuoteOnly(fields)
+        self.decodeNbboPriceCap(fields)
+        self.decodeParentId(fields)
+        self.decodeTriggerMethod(fields)
+        self.decodeVolOrderParams(fields, True)
+        self.decodeTrailParams(fields)
+        self.decodeBasisPoints(fields)
+        self.decodeComboLegs(fields)
+        self.decodeSmartComboRoutingParams(fields)
+        self.decodeScaleOrderParams(fields)
+        self.decodeHedgeParams(fields)
+        self.decodeOptOutSmartRouting(fields)
+        self.decodeClearingParams(fields)
+        self.decodeNotHeld(fields)
+        self.decodeDeltaNeutral(fields)
+        self.decodeAlgoParams(fields)
+        self.decodeSolicited(fields)
+        self.decodeWhatIfInfoAndCommission(fields)
+        self.decodeVolRandomizeFlags(fields)
+        self.decodePegToBenchParams(fields)
+        self.decodeConditions(fields)
+        self.decodeAdjustedOrderParams(fields)
+        self.decodeSoftDollarTier(fields)
+        self.decodeCashQty(fields)
+        self.decodeDontUseAutoPriceForHedge(fields)
+        self.decodeIsOmsContainers(fields)
+        self.decodeDiscretionaryUpToLimitPrice(fields)
+        self.decodeUsePriceMgmtAlgo(fields)
+
+        return self.finish()
+
+    def decodeCompletedOrder(self, fields):
+        self.start(UNSET_INTEGER)
+
+        # read contract fields
+        self.decodeContractFields(fields)
+
+        # read order fields
+        self.decodeAction(fields)
+        self.decodeTotalQuantity(fields)
+        self.decodeOrderType(fields)
+        self.decodeLmtPrice(fields)
+        self.decodeAuxPrice(fields)
+        self.decodeTIF(fields)
+        self.decodeOcaGroup(fields)
+        self.decodeAccount(fields)
+        self.decodeOpenClose(fields)
+        self.decodeOrigin(fields)
+        self.decodeOrderRef(fields)
+        self.decodePermId(fields)
+        self.decodeOutsideRth(fields)
+        self.decodeHidden(fields)
+        self.decodeDiscretionaryAmt(fields)
+        self.decodeGoodAfterTime(fields)
+        self.decodeFAParams(fields)
+        self.decodeModelCode(fields)
+        self.decodeGoodTillDate(fields)
+        self.decodeRule80A(fields)
+        self.decodePercentOffset(fields)
+        self.decodeSettlingFirm(fields)
+        self.decodeShortSaleParams(fields)
+        self.decodeBoxOrderParams(fields)
+        self.decodePegToStkOrVolOrderParams(fields)
+        self.decodeDisplaySize(fields)
+        self.decodeSweepToFill(fields)
+        self.decodeAllOrNone(fields)
+        self.decodeMinQty(fields)
+        self.decodeOcaType(fields)
+        self.decodeTriggerMethod(fields)
+        self.decodeVolOrderParams(fields, False)
+        self.decodeTrailParams(fields)
+        self.decodeComboLegs(fields)
+        self.decodeSmartComboRoutingParams(fields)
+        self.decodeScaleOrderParams(fields)
+        self.decodeHedgeParams(fields)
+        self.decodeClearingParams(fields)
+        self.decodeNotHeld(fields)
+        self.decodeDeltaNeutral(fields)
+        self.decodeAlgoParams(fields)
+        self.decodeSolicited(fields)
+        self.decodeOrderStatus(fields)
+        self.decodeVolRandomizeFlags(fields)
+        self.decodePegToBenchParams(fields)
+        self.decodeConditions(fields)
+        self.decodeStopPriceAndLmtPriceOffset(fields)
+        self.decodeCashQty(fields)
+        self.decodeDontUseAutoPriceForHedge(fields)
+        self.decodeIsOmsContainers(fields)
+        self.decodeAutoCancelDate(fields)
+        self.decodeFilledQuantity(fields)
+        self.decodeRefFuturesConId(fields)
+        self.decodeAutoCancelParent(fields)
+        self.decodeShareholder(fields)
+        self.decodeImbalanceOnly(fields)
+        self.decodeRouteMarketableToBbo(fields)
+        self.decodeParentPermId(fields)
+        self.decodeCompletedTime(fields)
+        self.decodeCompletedStatus(fields)
+
+        return self.finish()
 
     def decodeOrderId(self, fields):
         self.order.orderId = decode(int, fields)
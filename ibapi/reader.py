@@ -8,10 +8,18 @@ Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is su
 The EReader runs in a separate threads and is responsible for receiving the
 incoming messages.
 It will read the packets from the wire, use the low level IB messaging to
-remove the size prefix and put the rest in a Queue.
+remove the size prefix and put the rest in a Queue, as (recvTime, queuedTime,
+msg) tuples: the time.perf_counter_ns() of the socket recv (conn.recvTime)
+and of the put, so the consumer can tell how long a message waited.
+An optional notify callable is invoked (from the reader thread) after each
+received chunk has been queued, so the consumer can be woken up instead of
+polling the Queue.
+With a capture (ibapi.capture.CaptureWriter), every message is also written
+to it with the time it was received, the reader closes it when it stops.
 """
 
 import logging
+import time
 from threading import Thread
 
 from ibapi import comm
@@ -21,33 +29,43 @@ logger = logging.getLogger(__name__)
 
 
 class EReader(Thread):
-    def __init__(self, conn, msg_queue):
+    def __init__(self, conn, msg_queue, notify=None, msgBuf=None, capture=None):
         super().__init__()
         self.conn = conn
         self.msg_queue = msg_queue
+        self.notify = notify
+        # may hold bytes already received during the connect handshake
+        self.msgBuf = msgBuf if msgBuf is not None else comm.MsgBuffer()
+        self.capture = capture
 
     def run(self):
         try:
-            buf = b""
+            msgBuf = self.msgBuf
+            put = self.msg_queue.put
+            capture = self.capture
+            clock = time.perf_counter_ns
+            recvTime = time.time_ns()
             while self.conn.isConnected():
+                nQueued = 0
+                perfTime = self.conn.recvTime
+                for msg in msgBuf.msgs():
+                    if capture is not None:
+                        capture.write(recvTime, msg)
+                    put((perfTime, clock(), msg))
+                    nQueued += 1
 
-                data = self.conn.recvMsg()
-                logger.debug("reader loop, recvd size %d", len(data))
-                buf += data
+                if nQueued and self.notify is not None:
+                    self.notify()
 
-                while len(buf) > 0:
-                    (size, msg, buf) = comm.read_msg(buf)
-                    #logger.debug("resp %s", buf.decode('ascii'))
-                    logger.debug("size:%d msg.size:%d msg:|%s| buf:%s|", size,
-                        len(msg), buf, "|")
-
-                    if msg:
-                        self.msg_queue.put(msg)
-                    else:
-                        logger.debug("more incoming packet(s) are needed ")
-                        break
+                n = self.conn.recvMsgInto(msgBuf)
+                if n and capture is not None:
+                    recvTime = time.time_ns()
+                logger.debug("reader loop, recvd size %d, pending %d", n, len(msgBuf))
 
             logger.debug("EReader thread finished")
         except:
             logger.exception('unhandled exception in EReader thread')
+        finally:
+            if self.capture is not None:
+                self.capture.close()
 
@@ -0,0 +1,114 @@
+"""
+Journal of the order events, replayed at startup.
+
+One JSON line per event: {"ts": time.time(), "event": ..., "data": ...},
+the event being the IbApi callback (make_order, openOrder, orderStatus,
+error, execDetails...) and data the order dict it stored, or the execution,
+or evict and the orderIds OrderStore archived.
+Lines are appended from the IOLoop to a pending list, a background thread
+writes and fsyncs them in batches, at most every sync_interval seconds, so
+callbacks never wait for the disk. It is not a write-ahead log: placeOrder
+goes out without waiting for its make_order record, and a crash loses the
+last batch. The reconciliation with TWS after connecting is the recovery
+path: the orders still open come back with openOrder and the fills with
+reqExecutions, an order already done by then is only known by its fills.
+
+At startup, replay() reads the records back (a torn last line is dropped)
+and start() rewrites the file with only the records still needed, the
+latest version of every order and the fills not aged out (FillStore.expire)
+kept, before appending to it again: the journal holds the state of one run,
+not the history of all of them.
+"""
+from threading import Thread, Condition
+import json
+import logging
+import os
+import time
+
+class Journal:
+    def __init__(self, path, sync_interval=0.05):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.pending = []
+        self.closing = False
+        self.cond = Condition()
+        self.file = None
+        self.thread = None
+        self.records = 0
+        self.syncs = 0
+
+    def replay(self):
+        """[(ts, event, data)] of the journal file, oldest first"""
+        records = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the tail of a batch cut by a crash
+                        logging.warning(f"Journal: dropping a torn record of {self.path}")
+                        continue
+                    records.append((record["ts"], record["event"], record["data"]))
+        except FileNotFoundError:
+            pass
+        return records
+
+    def start(self, records=()):
+        """Rewrites the journal with records, then appends to it."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("".join(self.line(*record) for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a")
+        self.thread = Thread(target=self.run, name="journal", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def line(ts, event, data):
+        return json.dumps({"ts": ts, "event": event, "data": data}) + "\n"
+
+    def append(self, event, data):
+        line = self.line(time.time(), event, data)
+        with self.cond:
+            self.pending.append(line)
+            if len(self.pending) == 1:
+                self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.closing)
+                lines = self.pending
+                self.pending = []
+                closing = self.closing
+            if lines:
+                try:
+                    self.file.write("".join(lines))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.records += len(lines)
+                    self.syncs += 1
+                except OSError as e:
+                    logging.warning(f"Journal write failed, {len(lines)} records lost, {e}")
+            if closing:
+                break
+            # let the next batch build up
+            time.sleep(self.sync_interval)
+        self.file.close()
+        self.file = None
+
+    def stats(self):
+        return {"records": self.records, "syncs": self.syncs, "pending": len(self.pending)}
+
+    def close(self):
+        if self.thread is None:
+            return
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        self.thread = None
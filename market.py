@@ -0,0 +1,149 @@
+from ibapi.contract import Contract
+from register import Register
+from orderbook import OrderBook
+
+CHANNELS = ("trade", "depth", "candle")
+
+def contract_maker(instrument: str):
+    market_map = {"FUTURE": "FUT", "SPOT": "CMDTY"}
+    xchg, symbol, market = instrument.upper().split(".")
+    sym = symbol.split("_")
+    ib_contract = Contract()
+    ib_contract.symbol = f"{sym[0]}USD"
+    ib_contract.currency = "USD"
+    ib_contract.secType = market_map.get(market, "ERR")
+    ib_contract.exchange = xchg
+    return ib_contract
+
+class Instrument:
+    """Market data state and WebSocket registers of one contract."""
+    def __init__(self, symbol, depth=5):
+        self.symbol = symbol
+        self.contract = contract_maker(symbol)
+        self.details = {}
+
+        self.trade = {}
+        self.trade_ready = False
+        self.book = OrderBook(depth)
+        self.depth_ready = False
+        self.candle = {}
+
+        # at most 10 updates per second by default, the latest state is always sent
+        self.registers = {
+            "trade": Register(rate=10),
+            "depth": Register(rate=10),
+            "candle": Register(),
+        }
+        self.refs = dict.fromkeys(CHANNELS, 0)
+        self.req_ids = {}
+
+class SubscriptionManager:
+    """Instruments by symbol and by IB reqId.
+
+    Channels are reference counted: the IB request (reqMktData, reqMktDepth,
+    reqRealTimeBars) is sent when the first client subscribes and cancelled
+    when the last one leaves, so all clients of an instrument share a single
+    market data line. The default symbol is pinned on every channel.
+    depth is the number of book rows requested per instrument.
+    """
+    def __init__(self, api, default_symbol, depth=5):
+        self.api = api
+        self.depth = depth
+        self.instruments = {}
+        self.req_index = {}
+        self.default = self.get_or_create(default_symbol)
+        for channel in CHANNELS:
+            self.subscribe(self.default.symbol, channel)
+
+    def key(self, symbol):
+        return symbol.strip().lower()
+
+    def get(self, symbol=""):
+        if not symbol:
+            return self.default
+        return self.instruments.get(self.key(symbol))
+
+    def get_or_create(self, symbol):
+        """raise ValueError on malformed symbol, expect xchg.base_quote.market"""
+        instrument = self.get(symbol)
+        if instrument is None:
+            instrument = Instrument(self.key(symbol), self.depth)
+            self.instruments[instrument.symbol] = instrument
+            self.query_details(instrument)
+        return instrument
+
+    def lookup(self, reqId):
+        entry = self.req_index.get(reqId)
+        return entry[0] if entry else None
+
+    def subscribe(self, symbol, channel):
+        instrument = self.get_or_create(symbol)
+        instrument.refs[channel] += 1
+        if instrument.refs[channel] == 1:
+            self.request(instrument, channel)
+        return instrument
+
+    def unsubscribe(self, instrument, channel):
+        instrument.refs[channel] -= 1
+        if instrument.refs[channel] > 0:
+            return
+        self.cancel(instrument, channel)
+        if instrument is not self.default and not any(instrument.refs.values()):
+            self.instruments.pop(instrument.symbol, None)
+            for (reqId, (inst, _)) in list(self.req_index.items()):
+                if inst is instrument:
+                    del self.req_index[reqId]
+
+    def request(self, instrument, channel):
+        if not self.api.client.isConnected():
+            # sent by resubscribe once connected
+            return
+        if channel == "depth":
+            # IB resends the whole book on a new request
+            instrument.book.clear()
+            instrument.depth_ready = False
+        reqId = self.api.stream(channel, instrument.contract)
+        instrument.req_ids[channel] = reqId
+        self.req_index[reqId] = (instrument, channel)
+        if self.api.recorder:
+            self.api.recorder.describe(reqId, instrument.symbol, channel)
+        self.api.client.captureNote(reqId=reqId, symbol=instrument.symbol, channel=channel)
+
+    def bind(self, reqId, symbol, channel):
+        """Route reqId to a channel of symbol without requesting anything,
+        for streams opened elsewhere (replay)."""
+        instrument = self.get_or_create(symbol)
+        instrument.req_ids[channel] = reqId
+        self.req_index[reqId] = (instrument, channel)
+        return instrument
+
+    def cancel(self, instrument, channel):
+        reqId = instrument.req_ids.pop(channel, None)
+        if reqId is None:
+            return
+        self.req_index.pop(reqId, None)
+        if self.api.client.isConnected():
+            self.api.cancel_stream(channel, reqId)
+
+    def query_details(self, instrument):
+        if self.api.client.isConnected():
+            reqId = self.api.query_contract(instrument.contract)
+            self.req_index[reqId] = (instrument, "contract")
+
+    def details_end(self, reqId):
+        entry = self.req_index.get(reqId)
+        if entry and entry[1] == "contract":
+            del self.req_index[reqId]
+
+    def resubscribe(self):
+        """Reissue the requests of every subscribed channel, after connecting
+        or when the stream went stale."""
+        for instrument in self.instruments.values():
+            for channel in list(instrument.req_ids):
+                self.cancel(instrument, channel)
+        self.req_index.clear()
+        for instrument in self.instruments.values():
+            self.query_details(instrument)
+            for channel in CHANNELS:
+                if instrument.refs[channel]:
+                    self.request(instrument, channel)
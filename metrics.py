@@ -0,0 +1,141 @@
+"""
+Latency histograms of the gateway pipeline, exposed on /metrics.
+
+Every stage is timed with time.perf_counter_ns, whose clock is shared by the
+EReader thread and the IOLoop:
+
+    framing  socket recv (Connection.recvMsgInto) -> put in msg_queue (EReader)
+    queue    put in msg_queue -> taken by IbClient.run
+    decode   taken -> IbApi callback entered (Decoder.interpret)
+    state    IbApi callback entered -> Register.trigger
+    message  the whole decodeMsg of one message
+    fanout   socket recv -> WebSocket write of the state it produced, the
+             conflation window included
+    write    write_message -> flushed to the socket
+
+The asyncio transport has no queue, framing and queue stay empty with it.
+"""
+import time
+
+now = time.perf_counter_ns
+
+class Histogram:
+    """Durations in ns, log-linear buckets: 4 per power of two, so a bucket
+    is at most 25% wide. record() is a handful of integer operations."""
+    SUB_BITS = 2
+    SIZE = 256
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns):
+        if ns < 0:
+            ns = 0
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        shift = ns.bit_length() - self.SUB_BITS - 1
+        if shift > 0:
+            self.counts[min((shift << self.SUB_BITS) + (ns >> shift), self.SIZE - 1)] += 1
+        else:
+            self.counts[ns] += 1
+
+    def bucket_bounds(self, index):
+        """[low, high) of a bucket in ns"""
+        sub = 1 << self.SUB_BITS
+        if index < 2 * sub:
+            return (index, index + 1)
+        shift = (index >> self.SUB_BITS) - 1
+        mantissa = sub + (index & (sub - 1))
+        return (mantissa << shift, (mantissa + 1) << shift)
+
+    def percentile(self, p):
+        """upper bound of the bucket holding the p quantile, capped by max"""
+        if not self.count:
+            return 0
+        rank = p * self.count
+        seen = 0
+        for (index, n) in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def snapshot(self):
+        """in us"""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count / 1000, 3),
+            "p50": round(self.percentile(0.5) / 1000, 3),
+            "p90": round(self.percentile(0.9) / 1000, 3),
+            "p99": round(self.percentile(0.99) / 1000, 3),
+            "p999": round(self.percentile(0.999) / 1000, 3),
+            "max": round(self.max / 1000, 3),
+        }
+
+class Pipeline:
+    """Stage histograms, and the timestamps of the message being processed
+    on the IOLoop (recv is 0 outside of a message, e.g. for an order sent
+    from a handler)."""
+    STAGES = ("framing", "queue", "decode", "state", "message", "fanout", "write")
+
+    def __init__(self):
+        for name in self.STAGES:
+            setattr(self, name, Histogram())
+        self.messages = 0
+        self.recv = 0
+        self.start = 0
+        self.decoded = False
+        self.entered = 0
+
+    def begin(self, recv, queued=0):
+        """a message is taken from msg_queue (or dispatched by the asyncio transport)"""
+        t = now()
+        if queued:
+            self.framing.record(queued - recv)
+            self.queue.record(t - queued)
+        self.recv = recv
+        self.start = t
+        self.decoded = False
+        self.entered = 0
+
+    def end(self):
+        self.message.record(now() - self.start)
+        self.messages += 1
+        self.recv = 0
+        self.start = 0
+
+    def enter(self):
+        """an IbApi callback is entered, the first one of a message ends its
+        decode (tickPrice is followed by a tickSize from the same message)"""
+        if self.start:
+            self.entered = now()
+            if not self.decoded:
+                self.decoded = True
+                self.decode.record(self.entered - self.start)
+
+    def triggered(self):
+        """a Register is triggered, returns the recv time of the message to stamp its state with"""
+        if self.entered:
+            self.state.record(now() - self.entered)
+            self.entered = 0
+        return self.recv
+
+    def reset(self):
+        for name in self.STAGES:
+            getattr(self, name).reset()
+        self.messages = 0
+
+    def snapshot(self):
+        return {name: getattr(self, name).snapshot() for name in self.STAGES}
+
+pipeline = Pipeline()
@@ -0,0 +1,109 @@
+from array import array
+
+INSERT, UPDATE, DELETE = 0, 1, 2
+SIDES = ("asks", "bids")
+
+class OrderBook:
+    """Level 1..depth market depth of one instrument, as sent by updateMktDepth.
+
+    Prices and sizes live in preallocated arrays, one pair per side (0 ask,
+    1 bid), row 0 is the top of the book. An insert shifts the rows below
+    position down (the last row falls off a full book), a delete shifts them
+    up, so every update is O(depth) and allocates nothing.
+
+    snapshot() exports {"asks": [[price, size], ...], "bids": [...]} into the
+    same dict and row lists every time, only the rows changed since the last
+    export are rewritten.
+    """
+    def __init__(self, depth=5):
+        self.depth = depth
+        self.prices = (array("d", bytes(8 * depth)), array("d", bytes(8 * depth)))
+        self.sizes = (array("q", bytes(8 * depth)), array("q", bytes(8 * depth)))
+        self.counts = [0, 0]
+        # first row of each side changed since the last snapshot, depth if none
+        self.dirty = [depth, depth]
+        self.rows = tuple([[0.0, 0] for _ in range(depth)] for _ in SIDES)
+        self.view = {"asks": [], "bids": []}
+
+    def clear(self):
+        self.counts[0] = self.counts[1] = 0
+        self.dirty[0] = self.dirty[1] = 0
+
+    def ready(self):
+        return self.counts[0] > 0 and self.counts[1] > 0
+
+    def apply(self, position, operation, side, price, size):
+        """Return False when the update is out of the book."""
+        if operation == INSERT:
+            return self.insert(side, position, price, size)
+        elif operation == UPDATE:
+            return self.update(side, position, price, size)
+        elif operation == DELETE:
+            return self.delete(side, position)
+        return False
+
+    def insert(self, side, position, price, size):
+        n = self.counts[side]
+        if position >= self.depth or position > n:
+            return False
+        prices = self.prices[side]
+        sizes = self.sizes[side]
+        end = n if n < self.depth else self.depth - 1
+        if position < end:
+            prices[position + 1:end + 1] = prices[position:end]
+            sizes[position + 1:end + 1] = sizes[position:end]
+        prices[position] = price
+        sizes[position] = size
+        self.counts[side] = end + 1
+        self.touch(side, position)
+        return True
+
+    def update(self, side, position, price, size):
+        n = self.counts[side]
+        if position == n:
+            # an update right below the last row extends the book
+            return self.insert(side, position, price, size)
+        if position > n:
+            return False
+        self.prices[side][position] = price
+        self.sizes[side][position] = size
+        self.touch(side, position)
+        return True
+
+    def delete(self, side, position):
+        n = self.counts[side]
+        if position >= n:
+            return False
+        prices = self.prices[side]
+        sizes = self.sizes[side]
+        if position < n - 1:
+            prices[position:n - 1] = prices[position + 1:n]
+            sizes[position:n - 1] = sizes[position + 1:n]
+        self.counts[side] = n - 1
+        self.touch(side, position)
+        return True
+
+    def touch(self, side, position):
+        if position < self.dirty[side]:
+            self.dirty[side] = position
+
+    def snapshot(self):
+        view = self.view
+        for side in (0, 1):
+            first = self.dirty[side]
+            if first == self.depth:
+                continue
+            self.dirty[side] = self.depth
+            n = self.counts[side]
+            out = view[SIDES[side]]
+            rows = self.rows[side]
+            del out[n:]
+            while len(out) < n:
+                out.append(rows[len(out)])
+            prices = self.prices[side]
+            sizes = self.sizes[side]
+            for i in range(first, n):
+                row = out[i]
+                row[0] = prices[i]
+                row[1] = sizes[i]
+        return view
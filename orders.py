@@ -0,0 +1,87 @@
+"""
+Order ids and request ids.
+
+TWS wants every new order id above the ids already used by the client id,
+and tells the next valid one in nextValidId after connecting. OrderIds hands
+them out locally from there, so placing an order never waits for a reqIds
+round trip, and keeps them monotonic across reconnects and restarts: ids are
+reserved by blocks (hi-lo) and only the end of the current block is written
+to disk, once per block. After a restart it resumes above that mark, even
+before TWS answered.
+
+Market data, contract and historical requests take their ids from another
+space, from REQUEST_ID_BASE up, so they can never be mistaken for an order
+in error() callbacks.
+"""
+import itertools
+import logging
+import os
+import threading
+
+REQUEST_ID_BASE = 1 << 30
+
+class OrderIds:
+    """Thread-safe order id allocator. path is the file keeping the high
+    mark, empty not to persist it."""
+    def __init__(self, path="", block=100):
+        self.path = path
+        self.block = block
+        self.lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # next id to hand out, 0 until seeded by nextValidId or the high mark
+        self.next = self.hi = self.load()
+
+    @property
+    def ready(self):
+        return self.next > 0
+
+    def load(self):
+        if not self.path:
+            return 0
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logging.warning(f"OrderIds: cannot read {self.path}, {e}")
+            return 0
+
+    def save(self, hi):
+        """a failed write is logged, ids keep being allocated from memory"""
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(str(hi))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"OrderIds: cannot save the high mark {hi} to {self.path}, {e}")
+
+    def seed(self, next_valid_id):
+        """nextValidId from TWS, only ever moves the next id up"""
+        with self.lock:
+            if next_valid_id > self.next:
+                self.next = next_valid_id
+
+    def allocate(self, count=1):
+        """Reserves count consecutive ids, returns the first one."""
+        with self.lock:
+            if not self.next:
+                raise ValueError("no order id yet, waiting for nextValidId")
+            first = self.next
+            self.next += count
+            if self.next > self.hi:
+                # persist the end of the new block before handing out its ids
+                hi = self.next + self.block
+                self.save(hi)
+                self.hi = hi
+            return first
+
+def request_ids(base=REQUEST_ID_BASE):
+    """ids of non order requests, next() of an itertools.count is atomic"""
+    return itertools.count(base)
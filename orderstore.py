@@ -0,0 +1,185 @@
+"""
+The orders of the session, indexed.
+
+Order dicts are never mutated once stored, an update puts a new dict (a copy
+with the changes), so the lists returned to the handlers share the dicts
+instead of copying them and stay consistent while the orders change.
+
+Orders in a terminal status (Filled, Cancelled...) are kept retention seconds
+then evicted, the oldest first as soon as there are more than max_terminal of
+them, and appended to a JSON lines archive when archive_path is set.
+on_evict, when set, is called with the orders archived, for the journal to
+record their eviction: a replay then discards them instead of archiving them
+again.
+"""
+from collections import OrderedDict
+import json
+import logging
+import os
+import time
+
+TERMINAL = frozenset(("Filled", "Cancelled", "ApiCancelled", "Rejected"))
+
+def same_state(old, new):
+    """True when two versions of an order only differ by their time"""
+    return len(old) == len(new) and all(key == "time" or old.get(key) == value for (key, value) in new.items())
+
+class OrderStore:
+    """Orders by orderId, with indexes by status, permId, symbol and orderRef
+    (the client tag). Queries cost the size of their result."""
+    def __init__(self, archive_path="", retention=3600, max_terminal=10000):
+        self.archive_path = archive_path
+        self.retention = retention
+        self.max_terminal = max_terminal
+        self.orders = {}
+        # key -> {orderId: order}
+        self.statuses = {}
+        self.symbols = {}
+        self.tags = {}
+        self.perms = {}
+        # orderId -> time it became terminal, oldest first
+        self.terminal = OrderedDict()
+        self.archived = 0
+        self.archive = None
+        self.on_evict = None
+        if archive_path:
+            os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+            self.archive = open(archive_path, "a")
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return self.key(order_id) in self.orders
+
+    @staticmethod
+    def key(order_id):
+        """handlers pass the order_id argument as is"""
+        try:
+            return int(order_id)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, order_id, default=None):
+        return self.orders.get(self.key(order_id), default)
+
+    def put(self, order, ts=None, evict=True):
+        """Stores a new order or the new version of one, ts is the time
+        of the update when it is replayed, without evicting meanwhile."""
+        order_id = order["orderId"]
+        old = self.orders.get(order_id)
+        if old is not None:
+            self.unindex(old)
+        self.orders[order_id] = order
+        self.statuses.setdefault(order["status"], {})[order_id] = order
+        self.symbols.setdefault(order["symbol"], {})[order_id] = order
+        if order.get("orderRef"):
+            self.tags.setdefault(order["orderRef"], {})[order_id] = order
+        if order.get("permId"):
+            self.perms[order["permId"]] = order
+        if order["status"] in TERMINAL:
+            if order_id not in self.terminal:
+                self.terminal[order_id] = ts or time.time()
+                if evict:
+                    self.evict()
+        elif order_id in self.terminal:
+            # e.g. a Cancelled order still filled
+            del self.terminal[order_id]
+
+    def unindex(self, order):
+        order_id = order["orderId"]
+        for (index, key) in ((self.statuses, order["status"]), (self.symbols, order["symbol"]), (self.tags, order.get("orderRef"))):
+            orders = index.get(key)
+            if orders is not None:
+                orders.pop(order_id, None)
+                if not orders:
+                    del index[key]
+        if order.get("permId"):
+            self.perms.pop(order["permId"], None)
+
+    def discard(self, order_id):
+        """Drops an order without archiving it, replaying its eviction."""
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            self.unindex(order)
+            self.terminal.pop(order_id, None)
+
+    def by_status(self, *statuses):
+        return [order for status in statuses for order in self.statuses.get(status, {}).values()]
+
+    def live(self):
+        """the orders in a non terminal status"""
+        return [order for (status, orders) in self.statuses.items() if status not in TERMINAL for order in orders.values()]
+
+    def by_symbol(self, symbol):
+        return list(self.symbols.get(symbol, {}).values())
+
+    def by_tag(self, tag):
+        return list(self.tags.get(tag, {}).values())
+
+    def select(self, status, symbol="", tag=""):
+        """the orders of status, of symbol and tag when given, read from the
+        smallest of their indexes"""
+        indexes = [self.statuses.get(status, {})]
+        if symbol:
+            indexes.append(self.symbols.get(symbol, {}))
+        if tag:
+            indexes.append(self.tags.get(tag, {}))
+        orders = min(indexes, key=len)
+        return [order for order in orders.values() if order["status"] == status
+            and (not symbol or order["symbol"] == symbol) and (not tag or order.get("orderRef") == tag)]
+
+    def by_perm(self, perm_id, default=None):
+        return self.perms.get(self.key(perm_id), default)
+
+    def evict(self, now=None):
+        """Drops the terminal orders older than retention, and the oldest
+        ones above max_terminal."""
+        deadline = (now or time.time()) - self.retention
+        evicted = []
+        while self.terminal:
+            (order_id, ts) = next(iter(self.terminal.items()))
+            if ts > deadline and len(self.terminal) <= self.max_terminal:
+                break
+            del self.terminal[order_id]
+            order = self.orders.pop(order_id)
+            self.unindex(order)
+            evicted.append(order)
+        if evicted and self.archive is not None:
+            try:
+                self.archive.write("".join(json.dumps(order) + "\n" for order in evicted))
+                self.archive.flush()
+            except OSError as e:
+                logging.warning(f"OrderStore: cannot archive {len(evicted)} orders, {e}")
+        self.archived += len(evicted)
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+        return evicted
+
+    def find_archived(self, order_id):
+        """The last archived version of an evicted order, reading the whole
+        archive: for the rare lookups of old orders."""
+        order_id = self.key(order_id)
+        if not self.archive_path or order_id is None or not os.path.exists(self.archive_path):
+            return None
+        found = None
+        with open(self.archive_path) as f:
+            for line in f:
+                if f'"orderId": {order_id},' in line:
+                    order = json.loads(line)
+                    if order["orderId"] == order_id:
+                        found = order
+        return found
+
+    def stats(self):
+        return {
+            "orders": len(self.orders),
+            "statuses": {status: len(orders) for (status, orders) in self.statuses.items()},
+            "terminal": len(self.terminal),
+            "archived": self.archived,
+        }
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
@@ -0,0 +1,170 @@
+from collections import deque
+from threading import Thread, Condition
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+# timestamp ns, reqId, kind, a, b, c, price, size: 32 bytes
+RECORD = struct.Struct("<qiBBBBdd")
+TICK_PRICE, TICK_SIZE, DEPTH, BAR = 1, 2, 3, 4
+# a of BAR records, size holds the volume
+BAR_OPEN, BAR_HIGH, BAR_LOW, BAR_CLOSE, BAR_WAP = range(5)
+
+class Recorder:
+    """Append-only binary log of the market data received.
+
+    Every callback becomes one fixed-width RECORD:
+        TICK_PRICE  a = tickType                            price
+        TICK_SIZE   a = tickType                                   size
+        DEPTH       a = position, b = operation, c = side   price  size
+        BAR         a = BAR_OPEN..BAR_WAP                   price  size = volume
+    timestamps are the receive time (time.time_ns()), bar time for BAR.
+
+    Records are packed into a preallocated buffer on the caller's thread, full
+    buffers (and the pending one every flush_interval seconds) are written by
+    a background thread. Files rotate at max_bytes, which is kept a multiple
+    of RECORD.size so each file can be mapped as an array of records, see
+    Recording. The reqId -> symbol, channel of each stream goes to a
+    streams.jsonl file next to them.
+    """
+    def __init__(self, path, prefix="md", max_bytes=256 * 1024 * 1024, flush_interval=1.0, buffer_records=4096):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.prefix = prefix
+        self.max_bytes = max(max_bytes // RECORD.size, 1) * RECORD.size
+        self.flush_interval = flush_interval
+        self.buffer_size = RECORD.size * buffer_records
+        self.buffer = bytearray(self.buffer_size)
+        self.offset = 0
+        self.full = deque()
+        self.spare = []
+        self.closing = False
+        self.cond = Condition()
+
+        self.file = None
+        self.file_bytes = 0
+        self.seq = 0
+        self.records = 0
+        self.streams = open(os.path.join(path, f"{prefix}.streams.jsonl"), "a")
+
+        self.thread = Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def append(self, ts, reqId, kind, a, b, c, price, size):
+        with self.cond:
+            RECORD.pack_into(self.buffer, self.offset, ts, reqId, kind, a, b, c, price, size)
+            self.offset += RECORD.size
+            if self.offset == self.buffer_size:
+                self.swap()
+                self.cond.notify()
+
+    def swap(self):
+        # with cond held
+        self.full.append((self.buffer, self.offset))
+        self.buffer = self.spare.pop() if self.spare else bytearray(self.buffer_size)
+        self.offset = 0
+
+    def tick_price(self, reqId, tickType, price):
+        self.append(time.time_ns(), reqId, TICK_PRICE, tickType, 0, 0, price, 0)
+
+    def tick_size(self, reqId, tickType, size):
+        self.append(time.time_ns(), reqId, TICK_SIZE, tickType, 0, 0, 0, size)
+
+    def depth(self, reqId, position, operation, side, price, size):
+        self.append(time.time_ns(), reqId, DEPTH, position, operation, side, price, size)
+
+    def bar(self, reqId, bar_time, open_, high, low, close, volume, wap):
+        ts = bar_time * 1000000000
+        self.append(ts, reqId, BAR, BAR_OPEN, 0, 0, open_, volume)
+        self.append(ts, reqId, BAR, BAR_HIGH, 0, 0, high, volume)
+        self.append(ts, reqId, BAR, BAR_LOW, 0, 0, low, volume)
+        self.append(ts, reqId, BAR, BAR_CLOSE, 0, 0, close, volume)
+        self.append(ts, reqId, BAR, BAR_WAP, 0, 0, wap, volume)
+
+    def describe(self, reqId, symbol, channel):
+        """Record what a reqId streams, written synchronously, it is rare."""
+        self.streams.write(json.dumps({"ts": time.time_ns(), "reqId": reqId, "symbol": symbol, "channel": channel}) + "\n")
+        self.streams.flush()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.full or self.closing, self.flush_interval)
+                if self.offset:
+                    self.swap()
+                buffers = self.full
+                self.full = deque()
+                closing = self.closing
+            try:
+                for (buffer, size) in buffers:
+                    self.write(buffer, size)
+            except OSError as e:
+                logging.warning(f"Recorder write failed, {e}")
+            with self.cond:
+                self.spare.extend(buffer for (buffer, _) in buffers)
+            if closing:
+                break
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def write(self, buffer, size):
+        view = memoryview(buffer)
+        offset = 0
+        while offset < size:
+            if self.file is None or self.file_bytes == self.max_bytes:
+                self.rotate()
+            n = min(size - offset, self.max_bytes - self.file_bytes)
+            self.file.write(view[offset:offset + n])
+            self.file_bytes += n
+            self.records += n // RECORD.size
+            offset += n
+
+    def rotate(self):
+        if self.file is not None:
+            self.file.close()
+        self.seq += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = os.path.join(self.path, f"{self.prefix}-{stamp}-{self.seq:04d}.rec")
+        self.file = open(name, "wb", buffering=0)
+        self.file_bytes = 0
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        self.streams.close()
+
+class Recording:
+    """Records of one Recorder file, memory mapped."""
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # a file still being written may end with a partial record
+        self.count = size // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self.map, index * RECORD.size)
+
+    def __iter__(self):
+        return RECORD.iter_unpack(memoryview(self.map)[:self.count * RECORD.size])
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+def recordings(path, prefix="md"):
+    """Recorder files under path, oldest first."""
+    names = [n for n in os.listdir(path) if n.startswith(prefix + "-") and n.endswith(".rec")]
+    return [os.path.join(path, n) for n in sorted(names)]
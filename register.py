@@ -0,0 +1,172 @@
+from collections import deque
+from metrics import pipeline, now
+import tornado.ioloop
+import json
+import logging
+
+class Outbox:
+    """Messages waiting to be written to one subscriber.
+
+    Bounded: when the subscriber is slower than the stream, the oldest
+    pending messages are dropped, so with capacity 1 it only ever gets the
+    latest snapshot. drain() runs on the IOLoop and waits for each write to
+    be flushed before sending the next one.
+
+    Outboxes of streams that must not lose messages (order events) are given
+    an overflow callback instead: when full, the outbox is closed and
+    overflow() is called on the next loop iteration to disconnect the
+    subscriber, which resyncs by reconnecting. Without one, warn_drops logs
+    every message dropped.
+
+    With an interval (seconds), updates are conflated: at most one message
+    per window is sent, and the latest state is always flushed by a timer at
+    the end of the window.
+
+    Messages are queued with the recv time of the TWS message they come
+    from (0 if none), for the fanout and write stages of metrics.pipeline.
+    """
+    def __init__(self, callback, capacity, interval=0, latest=None, overflow=None, warn_drops=False):
+        self.callback = callback
+        self.overflow = overflow
+        self.warn_drops = warn_drops
+        self.pending = deque(maxlen=capacity)
+        self.draining = False
+        self.closed = False
+        self.dropped = 0
+        self.interval = interval
+        self.latest = latest
+        self.timer = None
+        self.window_end = 0
+        self.conflated = 0
+
+    def put(self, payload, stamp=0):
+        if self.closed:
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+            if self.overflow is not None:
+                logging.warning(f"Outbox full, {len(self.pending)} messages pending, closing the subscriber")
+                self.close()
+                tornado.ioloop.IOLoop.current().add_callback(self.overflow)
+                return
+            if self.warn_drops:
+                logging.warning(f"Outbox full, dropping the oldest of {len(self.pending)} messages")
+        self.pending.append((payload, stamp))
+        if not self.draining:
+            self.draining = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self.drain)
+
+    def update(self):
+        """The latest state changed (conflated subscribers only)."""
+        if self.timer is not None:
+            self.conflated += 1
+            return
+        ioloop = tornado.ioloop.IOLoop.current()
+        if ioloop.time() >= self.window_end:
+            self.flush()
+        else:
+            self.timer = ioloop.call_at(self.window_end, self.flush)
+
+    def flush(self):
+        self.timer = None
+        if self.closed:
+            return
+        self.window_end = tornado.ioloop.IOLoop.current().time() + self.interval
+        self.put(*self.latest())
+
+    def close(self):
+        self.closed = True
+        if self.timer is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.timer)
+            self.timer = None
+
+    async def drain(self):
+        try:
+            while self.pending and not self.closed:
+                (payload, stamp) = self.pending.popleft()
+                try:
+                    start = now()
+                    if stamp:
+                        pipeline.fanout.record(start - stamp)
+                    result = self.callback(payload)
+                    if result is not None:
+                        await result
+                    pipeline.write.record(now() - start)
+                except Exception as e:
+                    logging.warning(f"Outbox write failed, {e}")
+        finally:
+            self.draining = False
+
+class Register:
+    """Fan-out of one stream to its WebSocket subscribers.
+
+    Each message is serialized at most once and queued to every subscriber's
+    Outbox, the writes happen asynchronously so a slow client never blocks
+    the caller (the decoder).
+
+    rate is the default max messages per second of a subscriber, 0 for every
+    update; subscribers may ask for another rate on login. Registers created
+    with conflate=False (order events) deliver every message regardless: a
+    subscriber capacity messages behind is disconnected by the overflow
+    callback it passed on login rather than losing events, without one every
+    event dropped is logged.
+
+    stats() counts the messages triggered, and the messages dropped and
+    conflated by the subscribers' outboxes, logged out ones included.
+    """
+    def __init__(self, capacity=1, rate=0, conflate=True):
+        self.capacity = capacity
+        self.rate = rate
+        self.conflate = conflate
+        self.outboxes = {}
+        self.message = None
+        self.payload = None
+        self.stamp = 0
+        self.triggered = 0
+        self.dropped = 0
+        self.conflated = 0
+
+    def login(self, callback, rate=0, overflow=None):
+        """overflow() disconnects the subscriber, for conflate=False registers"""
+        rate = rate or self.rate
+        interval = 1 / rate if rate and self.conflate else 0
+        self.outboxes[callback] = Outbox(callback, self.capacity, interval, self.latest, overflow, warn_drops=not self.conflate)
+
+    def logout(self, callback):
+        outbox = self.outboxes.pop(callback, None)
+        if outbox is not None:
+            outbox.close()
+            self.dropped += outbox.dropped
+            self.conflated += outbox.conflated
+
+    def stats(self):
+        outboxes = self.outboxes.values()
+        return {
+            "subscribers": len(self.outboxes),
+            "triggered": self.triggered,
+            "dropped": self.dropped + sum(outbox.dropped for outbox in outboxes),
+            "conflated": self.conflated + sum(outbox.conflated for outbox in outboxes),
+        }
+
+    def latest(self):
+        return (self.serialize(), self.stamp)
+
+    def serialize(self):
+        if self.payload is None:
+            self.payload = json.dumps(self.message)
+        return self.payload
+
+    def trigger(self, message):
+        self.stamp = pipeline.triggered()
+        self.triggered += 1
+        self.notify_callbacks(message)
+
+    def notify_callbacks(self, message):
+        self.message = message
+        self.payload = None
+        if len(self.outboxes):
+            for outbox in self.outboxes.values():
+                if outbox.interval:
+                    outbox.update()
+                else:
+                    outbox.put(self.serialize(), self.stamp)
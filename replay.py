@@ -0,0 +1,152 @@
+"""
+Replay a wire capture (capture_path in tws_conf) without TWS.
+
+    python replay.py CAPTURE [--mode app|decoder] [--speed 0] [--clients 1]
+
+decoder  feeds the messages to Decoder.interpret with a bare EWrapper.
+app      feeds them to IbApi on the IOLoop, the decode -> state -> fan-out path
+         of the gateway, with --clients subscribers on every register.
+
+--speed 0 replays as fast as possible, 1 at the recorded pace, 2 twice as
+fast... Decode time and throughput are reported per message type.
+"""
+from ibapi.capture import CaptureReader, MSG, NOTE
+from ibapi.client import EClient
+from ibapi.decoder import Decoder
+from ibapi.message import IN
+from ibapi.wrapper import EWrapper
+from orders import REQUEST_ID_BASE, request_ids
+from collections import defaultdict
+import tornado.ioloop
+import argparse
+import asyncio
+import json
+import time
+
+msgNames = {v: k for (k, v) in vars(IN).items() if not k.startswith("_")}
+
+class ReplayConnection:
+    """Stands for the TWS connection, requests are dropped."""
+    def isConnected(self):
+        return True
+
+    def sendMsg(self, msg):
+        return len(msg)
+
+    def disconnect(self):
+        pass
+
+class QuietMessenger:
+    """Replayed errors are not sent to Dingding."""
+    def send_msg(self, title, text):
+        return None
+
+class Stats:
+    def __init__(self):
+        self.count = defaultdict(int)
+        self.ns = defaultdict(int)
+        self.notes = 0
+        self.delivered = 0
+
+    def add(self, msg_id, ns):
+        self.count[msg_id] += 1
+        self.ns[msg_id] += ns
+
+    def report(self, elapsed):
+        total = sum(self.count.values())
+        print(f"{total} messages in {elapsed:.3f} s, {total / elapsed:.0f} msgs/s, {self.delivered} websocket messages")
+        print(f"{'message':<28}{'count':>10}{'us/msg':>10}{'msgs/s':>12}")
+        for msg_id in sorted(self.count, key=self.ns.get, reverse=True):
+            count = self.count[msg_id]
+            ns = self.ns[msg_id] or 1
+            name = msgNames.get(msg_id, str(msg_id))
+            print(f"{name:<28}{count:>10}{ns / count / 1000:>10.2f}{count * 1e9 / ns:>12.0f}")
+
+def msg_id(msg):
+    end = msg.find(b"\0")
+    try:
+        return int(msg[:end])
+    except ValueError:
+        return 0
+
+def make_client(mode, serverVersion):
+    if mode == "decoder":
+        client = EClient(EWrapper())
+        api = None
+    else:
+        from core import IbApi
+        from config import tws_conf
+        conf = dict(tws_conf, record_path="", capture_path="", order_id_path="", order_archive_path="", order_journal_path="", history_cache_path="")
+        api = IbApi(conf)
+        api.messenger = QuietMessenger()
+        # keep the reqIds of the replay away from the captured ones
+        api.request_ids = request_ids(REQUEST_ID_BASE + (1 << 29))
+        client = api.client
+    client.conn = ReplayConnection()
+    client.serverVersion_ = serverVersion
+    client.decoder = Decoder(client.wrapper, serverVersion)
+    client.setConnState(EClient.CONNECTED)
+    return (client, api)
+
+def login(api, clients, stats):
+    def deliver(payload):
+        stats.delivered += 1
+    registers = [api.order_register]
+    for instrument in api.market.instruments.values():
+        registers.extend(instrument.registers.values())
+    for register in registers:
+        while len(register.outboxes) < clients:
+            # a new callback each time, Register keys the outboxes by callback
+            register.login(lambda payload: deliver(payload))
+
+async def replay(reader, client, api, speed, clients, stats):
+    start = time.perf_counter()
+    first_ts = None
+    n = 0
+    for (ts, kind, data) in reader:
+        if speed:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / 1e9 / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if kind == NOTE:
+            note = json.loads(data)
+            stats.notes += 1
+            if api is not None and "reqId" in note and "channel" in note:
+                api.market.bind(note["reqId"], note["symbol"], note["channel"])
+                login(api, clients, stats)
+            continue
+        if kind != MSG:
+            continue
+        t0 = time.perf_counter_ns()
+        client.decodeMsg(data)
+        stats.add(msg_id(data), time.perf_counter_ns() - t0)
+        n += 1
+        if api is not None and not n % 256:
+            # let the outboxes drain
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    # last writes
+    await asyncio.sleep(0.1)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("capture")
+    parser.add_argument("--mode", choices=("app", "decoder"), default="app")
+    parser.add_argument("--speed", type=float, default=0, help="0: as fast as possible, 1: recorded pace")
+    parser.add_argument("--clients", type=int, default=1, help="subscribers per register in app mode")
+    args = parser.parse_args()
+
+    reader = CaptureReader(args.capture)
+    stats = Stats()
+    (client, api) = make_client(args.mode, reader.serverVersion)
+    if api is not None:
+        login(api, args.clients, stats)
+    elapsed = tornado.ioloop.IOLoop.current().run_sync(
+        lambda: replay(reader, client, api, args.speed, args.clients, stats))
+    stats.report(elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+"""
+Stand-in for TWS / IB Gateway speaking the API wire protocol, for load,
+latency and reconnect tests of the gateway without a real TWS.
+
+    python simulator.py [--port 7497] [--tick-rate 10] [--depth-rate 10] [--bar-interval 5] [--fill-delay 0.05]
+        [--hist-pacing 60/600] [--stamp]
+
+It answers the "API\\0" + version handshake with SERVER_VERSION and the
+server time, sends nextValidId and managedAccounts after startApi, and serves:
+    reqMktData          bid / ask tickPrice at tick_rate per stream
+    reqMktDepth         inserts for every row, then updates (and the odd
+                        delete + insert) at depth_rate per stream
+    reqRealTimeBars     a bar every bar_interval seconds
+    reqContractDetails  contractDetails + contractDetailsEnd
+    reqHistoricalData   the bars of [endDateTime - durationStr, endDateTime),
+                        dates as formatDate 2, the same bar for the same
+                        symbol and time in every request; error 162 pacing
+                        violation above hist_pacing (requests, seconds) per
+                        session or for a request identical to one of the
+                        last 15 seconds
+    placeOrder          orderStatus Submitted, MKT and marketable LMT orders
+                        fill after fill_delay (orderStatus Filled, execDetails,
+                        commissionReport), other LMT orders when the market
+                        crosses them
+    cancelOrder, reqIds, reqCurrentTime, reqAccountUpdates, reqPositions,
+    reqOpenOrders / reqAllOpenOrders (orderStatus of the working orders of
+    the client id, openOrder is not sent), reqCompletedOrders (end only),
+    reqExecutions (with their commissionReport, the time of the filter is
+    honoured) and the matching cancels.
+Orders and executions are kept by client id, a client reconnecting finds
+them again, orders only fill while it is connected.
+Prices follow one random walk per symbol, shared by every session. With
+stamp, tick and depth sizes carry the send time in microseconds since the
+epoch instead of a random lot, strictly increasing, so a client can measure
+the latency of each update (see benchmarks/bench_e2e.py).
+"""
+from ibapi import comm
+from ibapi.message import IN, OUT
+from ibapi.server_versions import MAX_CLIENT_VER
+from collections import deque
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+SERVER_VERSION = MAX_CLIENT_VER
+BID, ASK = 1, 2
+# base price and tick of known symbols, others start at 100 with a 0.01 tick
+MARKETS = {
+    "XAUUSD": (1900.0, 0.01),
+    "EURUSD": (1.17, 0.00001),
+    "GBPUSD": (1.29, 0.00001),
+}
+UNITS = {"S": 1, "D": 86400, "W": 7 * 86400, "sec": 1, "secs": 1, "min": 60, "mins": 60,
+    "hour": 3600, "hours": 3600, "day": 86400}
+
+def frame(*fields):
+    payload = ("\0".join(map(str, fields)) + "\0").encode()
+    return comm.HEADER.pack(len(payload)) + payload
+
+class Market:
+    """Random walk of one symbol."""
+    def __init__(self, symbol, rnd):
+        (self.mid, self.tick) = MARKETS.get(symbol.upper(), (100.0, 0.01))
+        self.symbol = symbol
+        self.rnd = rnd
+        self.spread = 2
+
+    def step(self):
+        self.mid += self.rnd.choice((-1, 0, 1)) * self.tick
+        return self.mid
+
+    def bid(self, row=0):
+        return round(self.mid - (self.spread // 2 + row) * self.tick, 8)
+
+    def ask(self, row=0):
+        return round(self.mid + (self.spread - self.spread // 2 + row) * self.tick, 8)
+
+class Stream:
+    def __init__(self, reqId, kind, symbol, rows=0):
+        self.reqId = reqId
+        self.kind = kind
+        self.symbol = symbol
+        self.rows = rows
+        # depth rows per side, sizes only, prices follow the market
+        self.book = ([], [])
+        self.n = 0
+
+class Order:
+    def __init__(self, orderId, symbol, secType, exchange, currency, action, quantity, orderType, lmtPrice, account):
+        self.orderId = orderId
+        self.permId = 0
+        self.symbol = symbol
+        self.secType = secType
+        self.exchange = exchange
+        self.currency = currency
+        self.action = action
+        self.quantity = quantity
+        self.orderType = orderType
+        self.lmtPrice = lmtPrice
+        self.account = account
+        self.status = "Submitted"
+
+class Session:
+    """One API client connection."""
+    def __init__(self, sim, reader, writer):
+        self.sim = sim
+        self.reader = reader
+        self.writer = writer
+        self.clientId = None
+        self.streams = {}
+        # the orders and executions of the client id, from start_api
+        self.orders = {}
+        self.executions = []
+        # send times of reqHistoricalData, and of each distinct request
+        self.history_sent = deque()
+        self.history_identical = {}
+        self.closed = False
+
+    def send(self, *fields):
+        if not self.closed:
+            self.writer.write(frame(*fields))
+
+    async def run(self):
+        msgBuf = comm.MsgBuffer()
+        try:
+            if not await self.handshake(msgBuf):
+                return
+            while True:
+                for msg in msgBuf.msgs():
+                    self.handle(comm.read_fields(msg))
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                msgBuf.extend(data)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.close()
+
+    async def handshake(self, msgBuf):
+        prefix = await self.reader.readexactly(4)
+        if prefix != b"API\0":
+            return False
+        size = comm.HEADER.unpack(await self.reader.readexactly(comm.HEADER.size))[0]
+        versions = (await self.reader.readexactly(size)).decode()
+        (low, high) = (int(v) for v in versions.lstrip("v").split(".."))
+        if not low <= SERVER_VERSION <= high:
+            logging.warning(f"simulator: client versions {versions} without {SERVER_VERSION}")
+            return False
+        self.send(SERVER_VERSION, time.strftime("%Y%m%d %H:%M:%S UTC", time.gmtime()))
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+            self.sim.sessions.discard(self)
+
+    def handle(self, fields):
+        msgId = int(fields[0])
+        handler = self.handlers.get(msgId)
+        if handler is not None:
+            handler(self, fields)
+
+    def start_api(self, fields):
+        self.clientId = int(fields[2])
+        self.orders = self.sim.orders.setdefault(self.clientId, {})
+        self.executions = self.sim.executions.setdefault(self.clientId, [])
+        self.send(IN.NEXT_VALID_ID, 1, self.sim.next_order_id)
+        self.send(IN.MANAGED_ACCTS, 1, self.sim.account)
+
+    def req_ids(self, fields):
+        self.send(IN.NEXT_VALID_ID, 1, self.sim.next_order_id)
+
+    def req_current_time(self, fields):
+        self.send(IN.CURRENT_TIME, 1, int(time.time()))
+
+    def req_managed_accts(self, fields):
+        self.send(IN.MANAGED_ACCTS, 1, self.sim.account)
+
+    def req_mkt_data(self, fields):
+        # msgId, version, reqId, conId, symbol, ...
+        self.subscribe(Stream(int(fields[2]), "tick", fields[4].decode()))
+
+    def req_mkt_depth(self, fields):
+        # msgId, version, reqId, conId, symbol ... tradingClass, numRows
+        stream = Stream(int(fields[2]), "depth", fields[4].decode(), int(fields[15]))
+        self.subscribe(stream)
+        market = self.sim.market(stream.symbol)
+        for side in (0, 1):
+            for row in range(stream.rows):
+                size = self.sim.size()
+                stream.book[side].append(size)
+                self.depth(stream, row, 0, side, market, size)
+
+    def req_real_time_bars(self, fields):
+        self.subscribe(Stream(int(fields[2]), "bar", fields[4].decode()))
+
+    def subscribe(self, stream):
+        self.streams[stream.reqId] = stream
+        self.sim.market(stream.symbol)
+
+    def cancel_stream(self, fields):
+        self.streams.pop(int(fields[2]), None)
+
+    def req_contract_data(self, fields):
+        # msgId, version, reqId, conId, symbol, secType, lastTradeDate, strike,
+        # right, multiplier, exchange, primaryExchange, currency, localSymbol
+        reqId = int(fields[2])
+        symbol = fields[4].decode()
+        secType = fields[5].decode()
+        exchange = fields[10].decode()
+        currency = fields[12].decode()
+        market = self.sim.market(symbol)
+        conId = self.sim.con_id(symbol)
+        self.send(IN.CONTRACT_DATA, 8, reqId,
+            symbol, secType, "", 0.0, "", exchange, currency, symbol, symbol, symbol, conId,
+            market.tick, 1, "", "ACTIVETIM,LMT,MKT,STP", exchange, 1, 0,
+            f"{symbol} simulated", "", "", "", "", "", "UTC", "", "", "", 0, 0,
+            1, "", "", "", "")
+        self.send(IN.CONTRACT_DATA_END, 1, reqId)
+
+    def req_historical_data(self, fields):
+        # msgId, reqId, conId, symbol, secType, lastTradeDate, strike, right,
+        # multiplier, exchange, primaryExchange, currency, localSymbol,
+        # tradingClass, includeExpired, endDateTime, barSizeSetting,
+        # durationStr, useRTH, whatToShow, formatDate, keepUpToDate
+        reqId = int(fields[1])
+        symbol = fields[3].decode()
+        now = time.monotonic()
+        (max_requests, window) = self.sim.hist_pacing
+        while self.history_sent and self.history_sent[0] <= now - window:
+            self.history_sent.popleft()
+        request = tuple(fields[2:])
+        if len(self.history_sent) >= max_requests or now - self.history_identical.get(request, -15) < 15:
+            self.sim.pacing_violations += 1
+            self.send(IN.ERR_MSG, 2, reqId, 162, "Historical Market Data Service error message:Historical data request pacing violation")
+            return
+        self.history_sent.append(now)
+        self.history_identical[request] = now
+        end_str = fields[15].decode()
+        end = int(time.mktime(time.strptime(end_str[:17], "%Y%m%d %H:%M:%S"))) if end_str else int(time.time())
+        (n, unit) = fields[16].decode().split()
+        bar_secs = int(n) * UNITS[unit]
+        (n, unit) = fields[17].decode().split()
+        start = end - int(n) * UNITS[unit]
+        (base, tick) = MARKETS.get(symbol.upper(), (100.0, 0.01))
+        if bar_secs < 86400:
+            times = range(-(-start // bar_secs) * bar_secs, end, bar_secs)
+            dates = [str(ts) for ts in times]
+        else:
+            day = time.localtime(start)
+            first = int(time.mktime((day.tm_year, day.tm_mon, day.tm_mday + ((day.tm_hour, day.tm_min, day.tm_sec) > (0, 0, 0)), 0, 0, 0, 0, 0, -1)))
+            times = range(first, end, 86400)
+            dates = [time.strftime("%Y%m%d", time.localtime(ts)) for ts in times]
+        bars = []
+        for (ts, date) in zip(times, dates):
+            # the same bar whenever asked
+            rnd = random.Random(f"{symbol}.{bar_secs}.{ts}")
+            (o, c) = (round(base + rnd.randint(-50, 50) * tick, 8) for _ in range(2))
+            (h, l) = (round(max(o, c) + rnd.randint(0, 10) * tick, 8), round(min(o, c) - rnd.randint(0, 10) * tick, 8))
+            bars += [date, o, h, l, c, rnd.randrange(1, 100) * 100, round((o + c) / 2, 8), rnd.randrange(1, 50)]
+        self.send(IN.HISTORICAL_DATA, reqId, time.strftime("%Y%m%d  %H:%M:%S", time.localtime(start)),
+            time.strftime("%Y%m%d  %H:%M:%S", time.localtime(end)), len(times), *bars)
+
+    def place_order(self, fields):
+        # msgId, orderId, conId, symbol, secType, lastTradeDate, strike, right,
+        # multiplier, exchange, primaryExchange, currency, localSymbol,
+        # tradingClass, secIdType, secId, action, totalQuantity, orderType,
+        # lmtPrice, auxPrice, tif, ocaGroup, account
+        order = Order(int(fields[1]), fields[3].decode(), fields[4].decode(), fields[9].decode(),
+            fields[11].decode(), fields[16].decode(), float(fields[17]), fields[18].decode(),
+            float(fields[19] or 0), fields[23].decode() or self.sim.account)
+        self.sim.next_order_id = max(self.sim.next_order_id, order.orderId + 1)
+        self.sim.perm_id += 1
+        order.permId = self.sim.perm_id
+        self.orders[order.orderId] = order
+        self.order_status(order)
+        self.sim.market(order.symbol)
+        if self.marketable(order):
+            asyncio.get_event_loop().call_later(self.sim.fill_delay, self.fill, order)
+
+    def cancel_order(self, fields):
+        orderId = int(fields[2])
+        order = self.orders.get(orderId)
+        if order is None or order.status != "Submitted":
+            self.send(IN.ERR_MSG, 2, orderId, 10147, f"OrderId {orderId} that needs to be cancelled is not found.")
+            return
+        order.status = "Cancelled"
+        self.order_status(order)
+
+    def marketable(self, order):
+        if order.orderType == "MKT":
+            return True
+        market = self.sim.market(order.symbol)
+        if order.action == "BUY":
+            return order.lmtPrice >= market.ask()
+        return order.lmtPrice <= market.bid()
+
+    def order_status(self, order, filled=0.0, price=0.0):
+        remaining = order.quantity - filled
+        self.send(IN.ORDER_STATUS, order.orderId, order.status, filled, remaining, price,
+            order.permId, 0, price, self.clientId, "", 0.0)
+
+    def fill(self, order):
+        if order.status != "Submitted" or self.closed:
+            return
+        market = self.sim.market(order.symbol)
+        price = market.ask() if order.action == "BUY" else market.bid()
+        if order.orderType == "LMT":
+            price = min(price, order.lmtPrice) if order.action == "BUY" else max(price, order.lmtPrice)
+        order.status = "Filled"
+        self.sim.exec_id += 1
+        execution = (order, f"{self.sim.exec_id:08x}.sim.01.01", time.strftime("%Y%m%d  %H:%M:%S"), price)
+        self.executions.append(execution)
+        position = self.sim.positions.get(order.symbol, 0.0)
+        self.sim.positions[order.symbol] = position + (order.quantity if order.action == "BUY" else -order.quantity)
+        self.order_status(order, order.quantity, price)
+        self.exec_details(-1, execution)
+        self.commission_report(execution)
+
+    def exec_details(self, reqId, execution):
+        (order, execId, exec_time, price) = execution
+        side = "BOT" if order.action == "BUY" else "SLD"
+        self.send(IN.EXECUTION_DATA, reqId, order.orderId,
+            self.sim.con_id(order.symbol), order.symbol, order.secType, "", 0.0, "", "",
+            order.exchange, order.currency, order.symbol, order.symbol,
+            execId, exec_time, order.account, order.exchange, side, order.quantity, price,
+            order.permId, self.clientId, 0, order.quantity, price, "", "", 0.0, "", 2)
+
+    def commission_report(self, execution):
+        (order, execId, exec_time, price) = execution
+        self.send(IN.COMMISSION_REPORT, 1, execId, 2.0, order.currency, 0.0, 0.0, 0)
+
+    def req_executions(self, fields):
+        # msgId, version, reqId, clientId, acctCode, time (yyyymmdd-hh:mm:ss), ...
+        reqId = int(fields[2])
+        since = fields[5].decode()
+        for execution in self.executions:
+            if "-".join(execution[2].split()) >= since:
+                self.exec_details(reqId, execution)
+                self.commission_report(execution)
+        self.send(IN.EXECUTION_DATA_END, 1, reqId)
+
+    def req_open_orders(self, fields):
+        for order in self.orders.values():
+            if order.status == "Submitted":
+                self.order_status(order)
+        self.send(IN.OPEN_ORDER_END, 1)
+
+    def req_completed_orders(self, fields):
+        self.send(IN.COMPLETED_ORDERS_END)
+
+    def req_acct_data(self, fields):
+        if fields[2] not in (b"1", b"True"):
+            return
+        account = self.sim.account
+        for (key, value) in (("NetLiquidation", "1000000.00"), ("AvailableFunds", "1000000.00"), ("BuyingPower", "4000000.00")):
+            self.send(IN.ACCT_VALUE, 2, key, value, "USD", account)
+        self.send(IN.ACCT_UPDATE_TIME, 1, time.strftime("%H:%M"))
+        self.send(IN.ACCT_DOWNLOAD_END, 1, account)
+
+    def req_positions(self, fields):
+        for (symbol, position) in self.sim.positions.items():
+            self.send(IN.POSITION_DATA, 3, self.sim.account, self.sim.con_id(symbol), symbol, "CMDTY",
+                "", 0.0, "", "", "SMART", "USD", symbol, symbol, position, 0.0)
+        self.send(IN.POSITION_END, 1)
+
+    def depth(self, stream, row, operation, side, market, size):
+        price = market.ask(row) if side == 0 else market.bid(row)
+        self.send(IN.MARKET_DEPTH, 1, stream.reqId, row, operation, side, price, size)
+
+    handlers = {
+        OUT.START_API: start_api,
+        OUT.REQ_IDS: req_ids,
+        OUT.REQ_CURRENT_TIME: req_current_time,
+        OUT.REQ_MANAGED_ACCTS: req_managed_accts,
+        OUT.REQ_MKT_DATA: req_mkt_data,
+        OUT.CANCEL_MKT_DATA: cancel_stream,
+        OUT.REQ_MKT_DEPTH: req_mkt_depth,
+        OUT.CANCEL_MKT_DEPTH: cancel_stream,
+        OUT.REQ_REAL_TIME_BARS: req_real_time_bars,
+        OUT.CANCEL_REAL_TIME_BARS: cancel_stream,
+        OUT.REQ_CONTRACT_DATA: req_contract_data,
+        OUT.REQ_HISTORICAL_DATA: req_historical_data,
+        OUT.PLACE_ORDER: place_order,
+        OUT.CANCEL_ORDER: cancel_order,
+        OUT.REQ_EXECUTIONS: req_executions,
+        OUT.REQ_OPEN_ORDERS: req_open_orders,
+        OUT.REQ_ALL_OPEN_ORDERS: req_open_orders,
+        OUT.REQ_COMPLETED_ORDERS: req_completed_orders,
+        OUT.REQ_ACCT_DATA: req_acct_data,
+        OUT.REQ_POSITIONS: req_positions,
+    }
+
+class Simulator:
+    """The server, sessions share the markets, positions and order ids."""
+    def __init__(self, tick_rate=10, depth_rate=10, bar_interval=5, fill_delay=0.0, account="DU000001", seed=1, stamp=False, hist_pacing=(60, 600)):
+        self.tick_rate = tick_rate
+        self.depth_rate = depth_rate
+        self.bar_interval = bar_interval
+        self.fill_delay = fill_delay
+        self.hist_pacing = hist_pacing
+        self.pacing_violations = 0
+        self.account = account
+        self.rnd = random.Random(seed)
+        self.stamp = stamp
+        self.last_stamp = 0
+        self.markets = {}
+        self.con_ids = {}
+        self.positions = {}
+        self.sessions = set()
+        # clientId -> {orderId: Order}, [execution]
+        self.orders = {}
+        self.executions = {}
+        self.next_order_id = 1
+        self.perm_id = 1000000
+        self.exec_id = 0
+        self.server = None
+        self.tasks = []
+
+    def market(self, symbol):
+        market = self.markets.get(symbol)
+        if market is None:
+            market = self.markets[symbol] = Market(symbol, self.rnd)
+        return market
+
+    def size(self):
+        if not self.stamp:
+            return self.rnd.randrange(1, 100) * 100
+        self.last_stamp = max(time.time_ns() // 1000, self.last_stamp + 1)
+        return self.last_stamp
+
+    def con_id(self, symbol):
+        return self.con_ids.setdefault(symbol, 100000 + len(self.con_ids))
+
+    async def start(self, host="127.0.0.1", port=7497):
+        self.server = await asyncio.start_server(self.connected, host, port)
+        self.tasks = [asyncio.ensure_future(task) for task in (
+            self.clock(self.tick_rate, self.ticks),
+            self.clock(self.depth_rate, self.depth_updates),
+            self.clock(1 / self.bar_interval, self.bars))]
+        return self.server
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.drop_connections()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def drop_connections(self):
+        """Close every client connection, to exercise reconnects."""
+        for session in list(self.sessions):
+            session.close()
+
+    async def connected(self, reader, writer):
+        session = Session(self, reader, writer)
+        self.sessions.add(session)
+        await session.run()
+
+    async def clock(self, rate, step):
+        """Call step(n) with the number of updates due per stream, n may be
+        above 1 when rate is higher than the loop can keep up with sleeping."""
+        if rate <= 0:
+            return
+        start = time.monotonic()
+        done = 0
+        while True:
+            due = int((time.monotonic() - start) * rate)
+            if due > done:
+                step(due - done)
+                done = due
+            await asyncio.sleep(max(0.0, (done + 1) / rate - (time.monotonic() - start)))
+
+    def streams(self, kind):
+        for session in list(self.sessions):
+            for stream in list(session.streams.values()):
+                if stream.kind == kind:
+                    yield (session, stream)
+
+    def ticks(self, n):
+        for _ in range(n):
+            for market in self.markets.values():
+                market.step()
+            for (session, stream) in self.streams("tick"):
+                market = self.markets[stream.symbol]
+                stream.n += 1
+                tickType = BID if stream.n % 2 else ASK
+                price = market.bid() if tickType == BID else market.ask()
+                session.send(IN.TICK_PRICE, 6, stream.reqId, tickType, price, self.size(), 0)
+        self.match_orders()
+
+    def match_orders(self):
+        for session in list(self.sessions):
+            for order in list(session.orders.values()):
+                if order.status == "Submitted" and order.orderType == "LMT" and session.marketable(order):
+                    session.fill(order)
+
+    def depth_updates(self, n):
+        rnd = self.rnd
+        for _ in range(n):
+            for (session, stream) in self.streams("depth"):
+                market = self.markets[stream.symbol]
+                side = rnd.randrange(2)
+                book = stream.book[side]
+                if not book:
+                    continue
+                row = rnd.randrange(len(book))
+                size = self.size()
+                if rnd.random() < 0.1:
+                    # a level goes away and another one comes in
+                    session.send(IN.MARKET_DEPTH, 1, stream.reqId, row, 2, side, 0.0, 0)
+                    session.depth(stream, row, 0, side, market, size)
+                else:
+                    session.depth(stream, row, 1, side, market, size)
+                book[row] = size
+
+    def bars(self, n):
+        now = int(time.time())
+        for (session, stream) in self.streams("bar"):
+            market = self.markets[stream.symbol]
+            (low, high) = (market.bid(), market.ask())
+            session.send(IN.REAL_TIME_BARS, 3, stream.reqId, now - now % 5,
+                low, high, low, market.mid, -1, -1.0, -1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7497)
+    parser.add_argument("--tick-rate", type=float, default=10, help="ticks per second per stream")
+    parser.add_argument("--depth-rate", type=float, default=10, help="depth updates per second per stream")
+    parser.add_argument("--bar-interval", type=float, default=5, help="seconds between real time bars")
+    parser.add_argument("--fill-delay", type=float, default=0.05, help="seconds before a marketable order fills")
+    parser.add_argument("--hist-pacing", default="60/600", help="historical data requests allowed per seconds")
+    parser.add_argument("--stamp", action="store_true", help="sizes carry the send time in us")
+    args = parser.parse_args()
+
+    hist_pacing = tuple(int(v) for v in args.hist_pacing.split("/"))
+    sim = Simulator(args.tick_rate, args.depth_rate, args.bar_interval, args.fill_delay, stamp=args.stamp, hist_pacing=hist_pacing)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(sim.start(args.host, args.port))
+    print(f"simulating TWS (server version {SERVER_VERSION}) on {args.host}:{args.port}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(sim.stop())
+
+if __name__ == "__main__":
+    main()